@@ -0,0 +1,412 @@
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows没有resource模块, 不报告RSS
+    resource = None
+
+import main
+
+
+PIPELINE_STAGES = ('read', 'translate', 'compare', 'group', 'render')
+TAP_KINDS = ['', '', '', 'b', 'x']  # 普通tap居多
+SLIDE_SHAPES = ['-', '>', '<', '^', 'v', 'p', 'q', 'V', 'w', 's', 'z']
+TOUCH_AREAS = ['A', 'B', 'D', 'E']
+DIVISIONS = [4, 8, 8, 8, 12, 16, 16, 24, 32]
+
+
+
+def make_chart(segment_count, seed=0, bpm=120):
+
+    # 生成简单的合成谱面: 每个segment一个tap或空segment
+    rng = random.Random(seed)
+    parts = [f"({bpm}){{8}}"]
+    for i in range(segment_count):
+        if rng.random() < 0.8:
+            parts.append(str(rng.randint(1, 8)))
+        parts.append(',')
+        if i % 16 == 15:
+            parts.append('\n')
+    parts.append('E')
+    return ''.join(parts)
+
+
+
+def random_note(rng):
+
+    # 单个note: tap / hold / slide / touch / touch hold
+    button = rng.randint(1, 8)
+    roll = rng.random()
+    if roll < 0.55:
+        return f"{button}{rng.choice(TAP_KINDS)}"
+    if roll < 0.7:
+        return f"{button}h[{rng.choice([4, 8, 16])}:{rng.randint(1, 6)}]"
+    if roll < 0.85:
+        shape = rng.choice(SLIDE_SHAPES)
+        end = rng.randint(1, 8)
+        if shape == 'V':
+            return f"{button}V{(button + 1) % 8 + 1}{end}[8:{rng.randint(1, 4)}]"
+        return f"{button}{shape}{end}[{rng.choice([4, 8, 16])}:{rng.randint(1, 6)}]"
+    if roll < 0.95:
+        return rng.choice(['C', 'Cf', f"{rng.choice(TOUCH_AREAS)}{button}"])
+    return f"Ch[{rng.choice([4, 8])}:{rng.randint(1, 3)}]"
+
+
+
+def random_segment(rng):
+
+    # 一个segment的note内容: 空 / 单note / 双押 (1/2 或 12写法)
+    roll = rng.random()
+    if roll < 0.15:
+        return ''
+    if roll < 0.8:
+        return random_note(rng)
+    if roll < 0.9:
+        first, second = rng.sample(range(1, 9), 2)
+        return f"{first}{second}"
+    return '/'.join(random_note(rng) for _ in range(rng.randint(2, 3)))
+
+
+
+def make_inote(segment_count, seed=0, bpm=150):
+
+    # 生成较真实的inote内容: BPM变化, 分音变化, 双押, hold, slide, touch, 连续空segment
+    rng = random.Random(seed)
+    division = 8
+    parts = [f"({bpm}){{{division}}}"]
+    column = 0
+    for _ in range(segment_count):
+        if rng.random() < 0.01:
+            bpm = rng.choice([bpm, round(bpm * rng.choice([0.5, 0.75, 1.25, 2]), 2)])
+            parts.append(f"({bpm})")
+        if rng.random() < 0.05:
+            division = rng.choice(DIVISIONS)
+            parts.append(f"{{{division}}}")
+        if rng.random() < 0.03:
+            parts.append(',' * rng.randint(2, 8))  # 休止
+        parts.append(random_segment(rng))
+        parts.append(',')
+        column += 1
+        if column >= division:  # 大约每小节一行
+            parts.append('\n')
+            column = 0
+    parts.append('E')
+    return ''.join(parts)
+
+
+
+def make_maidata(segment_count, seed=0, levels=(5,), density=0.0):
+
+    # 完整的maidata.txt, 每个难度一个 &inote_N 块
+    # density > 0 时在每个inote中注入修改, 与density=0的结果比较即为可控的diff
+    blocks = [f"&title=bench-{segment_count}-{seed}", "&wholebpm=150", "&first=0"]
+    edits = 0
+    for level in levels:
+        inote = make_inote(segment_count, seed * 10 + level)
+        if density > 0:
+            inote, count = inject_edits(inote, density, seed * 10 + level + 1)
+            edits += count
+        blocks.append(f"&lv_{level}=13")
+        blocks.append(f"&inote_{level}={inote}")
+    return '\n'.join(blocks) + '\n', edits
+
+
+
+def inject_edits(inote, density, seed=0):
+
+    # 按比例 (0~1) 修改segment: 替换note / 删除 / 插入 / 改BPM, 返回 (新inote, 修改数)
+    rng = random.Random(seed)
+    segments = inote.split(',')
+    edited = []
+    edits = 0
+    for k, segment in enumerate(segments):
+        if k == 0 or k == len(segments) - 1 or rng.random() >= density:
+            edited.append(segment)
+            continue
+        edits += 1
+        roll = rng.random()
+        if roll < 0.5:
+            settings = ''.join(match.group(0) for match in main.BPM_LENGTH_RE.finditer(segment))  # 保留BPM/分音
+            edited.append(settings + random_segment(rng))
+        elif roll < 0.7:
+            continue
+        elif roll < 0.9:
+            edited.append(segment)
+            edited.append(random_segment(rng))
+        else:
+            edited.append(f"({rng.choice([120, 160, 200])})" + segment)
+    return ','.join(edited), edits
+
+
+
+def bench_segment_offsets(sizes):
+
+    # 前面写错BPM, 导致之后每个note都产生diff (最坏情况)
+    print(f"{'segments':>10} {'diffs':>8} {'translate':>10} {'compare':>10} {'us/seg':>8}")
+    for size in sizes:
+        text1 = make_chart(size, bpm=120).replace('\n', '')
+        text2 = make_chart(size, bpm=121).replace('\n', '')
+        line_mapping = main.LineMap()
+        line_mapping.add_line(1, text1)
+
+        start = time.perf_counter()
+        trans1, offsets1 = main.translate_inote(text1)
+        trans2, offsets2 = main.translate_inote(text2)
+        translate_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        errors = main.compare_inotes(trans1, trans2, offsets1, offsets2)
+        main.format_errors(main.build_error_groups(errors, text1, text2, offsets1, offsets2, 1, 1, line_mapping, line_mapping))
+        compare_time = time.perf_counter() - start
+
+        diffs = len(errors)
+        per_segment = (translate_time + compare_time) / size * 1e6
+        print(f"{size:>10} {diffs:>8} {translate_time:>9.3f}s {compare_time:>9.3f}s {per_segment:>8.2f}")
+
+
+
+def max_rss_kib():
+
+    # 进程的RSS峰值 (KiB); Linux上读取VmHWM: exec时内核把父进程的峰值并入ru_maxrss,
+    # spawn出的子进程的ru_maxrss从父进程当时的RSS开始, 而VmHWM只统计本进程自己的地址空间
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # ru_maxrss在Linux上以KiB为单位, 在macOS上以字节为单位
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss // 1024 if sys.platform == 'darwin' else max_rss
+
+
+
+def line_mapping_rss(path):
+
+    # 在新的子进程中运行: 读取前后RSS峰值之差即get_inote使RSS峰值增长的量
+    # 基线包括解释器和导入main, 页粒度, 不含tracemalloc本身的开销
+    before = max_rss_kib()
+    main.get_inote(5, path, 1)
+    return max_rss_kib() - before
+
+
+
+def bench_line_mapping(sizes, line_count=1024):
+
+    # 行号映射只随行数增长, 与每行字符数无关: 固定行数, 让每行宽度随谱面大小变化
+    # map B/line应保持不变, 而chars/line随之增长
+    # traced KiB: tracemalloc统计的Python分配峰值; RSS +KiB: 子进程 (spawn, 每次运行一个) 的RSS峰值增长
+    print(f"{'segments':>10} {'chars':>10} {'lines':>8} {'chars/line':>10} {'map KiB':>8} {'traced KiB':>10} {'RSS +KiB':>9} {'map B/line':>10}")
+    context = multiprocessing.get_context('spawn')
+    for size in sizes:
+        text = make_chart(size)
+        text = text.replace('\n', '')
+        line_width = -(-len(text) // line_count)
+        text = '\n'.join(text[k:k + line_width] for k in range(0, len(text), line_width))
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as f:
+            f.write(f"&title=bench\n&inote_5={text}\n")
+            path = f.name
+        try:
+            tracemalloc.start()
+            inote, _, line_mapping = main.get_inote(5, path, 1)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            rss = '-'
+            if resource is not None:
+                with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+                    rss = pool.submit(line_mapping_rss, path).result()
+        finally:
+            os.remove(path)
+
+        map_bytes = (len(line_mapping.starts) * line_mapping.starts.itemsize +
+                     len(line_mapping.lines) * line_mapping.lines.itemsize)
+        lines = len(line_mapping.lines)
+        print(f"{size:>10} {len(inote):>10} {lines:>8} {len(inote) / lines:>10.1f} {map_bytes // 1024:>8} {peak // 1024:>10} {rss:>9} {map_bytes / lines:>10.3f}")
+
+
+
+def bench_locate(sizes, seed=0, repeat=3):
+
+    # 六个难度的maidata.txt中只读取最后一个 (&inote_7): 流式逐行读取 vs mmap定位
+    # 定位只解码目标块, 耗时和峰值内存应随块大小而不是文件大小增长
+    # hit/miss: 默认CLI路径 (load_inotes + ParseCache), 对映射计算hash; miss还包括解析该块和写入缓存
+    print(f"{'segments':>10} {'file KiB':>9} {'block KiB':>9} {'stream':>9} {'locate':>9} {'hit':>9} {'miss':>9} "
+          f"{'stream KiB':>10} {'locate KiB':>10} {'hit KiB':>9} {'miss KiB':>9}")
+    for size in sizes:
+        text, _ = make_maidata(size, seed, levels=(2, 3, 4, 5, 6, 7))
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8', newline='\r\n') as f:
+            f.write(text)
+            path = f.name
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cache = main.ParseCache(cache_dir)
+            def stream():
+                with open(path, 'r', encoding='utf-8-sig') as f:
+                    return main.extract_inotes(f, ['7'])
+            def locate():
+                return main.read_inotes(path, ['7'])
+            def hit():
+                entries = main.load_inotes(path, ['7'], cache)
+                return {level: inote for level, (inote, _) in entries.items()}
+            def miss():
+                cache.clear()
+                return hit()
+            row = []
+            for read in (stream, locate, miss, hit):
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    blocks = read()
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                tracemalloc.start()
+                read()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                row.append((best, peak, blocks))
+            expected = row[0][2]
+            for _, _, blocks in row[1:]:
+                assert blocks['7'][:2] == expected['7'][:2], "locate_inotes differs from the streaming reader"
+            (stream_time, stream_peak, _), (locate_time, locate_peak, _), (miss_time, miss_peak, _), (hit_time, hit_peak, _) = row
+            file_size = os.path.getsize(path)
+        finally:
+            os.remove(path)
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        print(f"{size:>10} {file_size // 1024:>9} {len(expected['7'][0]) // 1024:>9} {stream_time:>8.3f}s {locate_time:>8.3f}s "
+              f"{hit_time:>8.3f}s {miss_time:>8.3f}s {stream_peak // 1024:>10} {locate_peak // 1024:>10} {hit_peak // 1024:>9} {miss_peak // 1024:>9}")
+
+
+
+def bench_pipeline(sizes, densities, seed=0, repeat=3):
+
+    # 完整流程 (read/translate/compare/group/render) 的各阶段耗时, 每项取repeat次中的最小值
+    # 返回可直接写入JSON的结果列表
+    print(f"{'segments':>10} {'density':>8} {'edits':>7} {'diffs':>7} " + ' '.join(f"{stage:>10}" for stage in PIPELINE_STAGES))
+    results = []
+    for size in sizes:
+        text1, _ = make_maidata(size, seed)
+        for density in densities:
+            text2, edits = make_maidata(size, seed, density=density)
+            best = {}
+            for _ in range(repeat):
+                profiler = main.Profiler()
+                profiler.start()
+                result = main.diff_charts(text1, text2, 5, profiler=profiler)
+                with profiler.stage('render'):
+                    result.render()
+                profiler.stop()
+                for stage, (wall, cpu, _) in profiler.stages.items():
+                    if stage not in best or wall < best[stage]['wall']:
+                        best[stage] = {'wall': wall, 'cpu': cpu}
+            counters = profiler.counters
+            results.append({'segments': size, 'density': density, 'edits': edits, 'chars': len(text1),
+                            'counters': counters, 'stages': best})
+            print(f"{size:>10} {density:>8} {edits:>7} {counters['diffs']:>7} " +
+                  ' '.join(f"{best[stage]['wall'] * 1000:>8.1f}ms" for stage in PIPELINE_STAGES))
+    return results
+
+
+
+def same_translation(a, b):
+
+    # 逐个数组比较 (NoteTable.__eq__会换算精度, 这里要求完全相同)
+    (table1, offsets1), (table2, offsets2) = a, b
+    names = ('info', 'bpm', 'length', 'hold', 'seconds', 'segment', 'group', 'group_start', 'resolution', 'warnings')
+    return offsets1 == offsets2 and all(getattr(table1, name) == getattr(table2, name) for name in names)
+
+
+
+def bench_parallel(sizes, jobs_list, seed=0, repeat=3):
+
+    # 单个inote的串行/并行解析耗时, 每项取repeat次中的最小值, 并检查结果与串行完全相同
+    print(f"cpu count: {os.cpu_count()}")
+    print(f"{'segments':>10} {'chars':>10} {'jobs':>5} {'time':>10} {'speedup':>8}")
+    results = []
+    for size in sizes:
+        inote = make_inote(size, seed)
+        serial = None
+        for jobs in [1] + [jobs for jobs in jobs_list if jobs > 1]:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                if jobs == 1:
+                    translated = main.translate_inote(inote)
+                else:
+                    translated = main.translate_inote_parallel(inote, jobs)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            if jobs == 1:
+                serial = (translated, best)
+            elif not same_translation(serial[0], translated):
+                raise AssertionError(f"parallel translate differs from serial (segments={size}, jobs={jobs})")
+            speedup = serial[1] / best
+            results.append({'segments': size, 'chars': len(inote), 'jobs': jobs, 'wall': best, 'speedup': speedup})
+            print(f"{size:>10} {len(inote):>10} {jobs:>5} {best * 1000:>8.1f}ms {speedup:>7.2f}x")
+    return results
+
+
+
+def write_fixtures(directory, sizes, densities, seed=0):
+
+    # 写出成对的谱面, 可直接用main.py/batch比较
+    os.makedirs(directory, exist_ok=True)
+    for size in sizes:
+        for density in densities:
+            for name, text in (('a', make_maidata(size, seed)[0]), ('b', make_maidata(size, seed, density=density)[0])):
+                with open(os.path.join(directory, f"chart-{size}-{density}-{name}.txt"), 'w', encoding='utf-8') as f:
+                    f.write(text)
+    print(f"Fixtures written to {directory}")
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Maidata diff benchmarks')
+    parser.add_argument('bench', nargs='*', help='Benchmarks to run: offsets, lines, locate, pipeline, parallel (default: all)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 100000, 250000, 500000], help='Segment counts')
+    parser.add_argument('--densities', type=float, nargs='+', default=[0.0, 0.001, 0.01, 0.1], help='Fraction of segments edited in txt2 (pipeline)')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case, the fastest is reported (locate, pipeline, parallel)')
+    parser.add_argument('--jobs', type=int, nargs='+', help='Worker counts for the parallel benchmark (default 2, 4, ... up to cpu count)')
+    parser.add_argument('--json', type=str, metavar='PATH', help='Write pipeline/parallel results as JSON')
+    parser.add_argument('--write-fixtures', type=str, metavar='DIR', help='Write the generated chart pairs to DIR and exit')
+    args = parser.parse_args()
+    if args.write_fixtures:
+        write_fixtures(args.write_fixtures, args.sizes, args.densities, args.seed)
+        raise SystemExit
+    benches = ['offsets', 'lines', 'locate', 'pipeline', 'parallel']
+    for bench in args.bench:
+        if bench not in benches:
+            parser.error(f"invalid benchmark: {bench} (choose from {', '.join(benches)})")
+    if not args.bench:
+        args.bench = benches
+    if 'offsets' in args.bench:
+        bench_segment_offsets(args.sizes)
+    if 'lines' in args.bench:
+        bench_line_mapping(args.sizes)
+    if 'locate' in args.bench:
+        bench_locate(args.sizes, args.seed, args.repeat)
+    report = {'seed': args.seed, 'repeat': args.repeat, 'python': platform.python_version(),
+              'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+    if 'pipeline' in args.bench:
+        report['benchmark'] = 'pipeline'
+        report['results'] = bench_pipeline(args.sizes, args.densities, args.seed, args.repeat)
+    if 'parallel' in args.bench:
+        cpu_count = max(os.cpu_count() or 1, 2)
+        jobs_list = args.jobs or [2 ** k for k in range(1, cpu_count.bit_length()) if 2 ** k <= cpu_count]
+        report['parallel'] = bench_parallel(args.sizes, jobs_list, args.seed, args.repeat)
+    if args.json and ('results' in report or 'parallel' in report):
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
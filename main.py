@@ -1,7 +1,74 @@
 import argparse
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import errno
+import io
+import itertools
 import sys
 import os
+import fnmatch
 import fractions
+import glob
+import hashlib
+import http.server
+import json
+import math
+import mmap
+import multiprocessing
+import re
+import struct
+import subprocess
+import threading
+import time
+import tracemalloc
+import urllib.request
+import zipfile
+import zlib
+from array import array
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖, 没有时使用纯Python实现
+    np = None
+
+
+
+class MaidataError(Exception):
+
+    # 谱面读取/解析失败, 信息格式与CLI输出一致
+    pass
+
+
+
+class InoteNotFoundError(MaidataError):
+
+    def __init__(self, level, source):
+        super().__init__(f"get_inote error: inote_{level} not found in {source}")
+        self.level = level
+        self.source = source
+
+
+
+class ChartParseError(MaidataError):
+
+    # inote内容无法解析 (BPM未设置, BPM/分音不是数字等)
+    pass
+
+
+
+def parse_time(text):
+
+    # "93.25" / "1:33.25" / "1:01:33.25" -> 秒
+    seconds = 0.0
+    for part in text.strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
 
 def parse_args():
 
@@ -10,15 +77,47 @@ def parse_args():
     parser.add_argument('-lv', type=int, choices=range(2, 8), help='inote level (2-7)')
     parser.add_argument('-txt1', type=str, help='Path to txt 1')
     parser.add_argument('-txt2', type=str, help='Path to txt 2')
-    parser.add_argument('positional', nargs='*', help='Positional args: level path1 path2')
+    parser.add_argument('positional', nargs='*', help='Positional args: level path1 path2 (path1 path2 with --all-levels)')
+    parser.add_argument('--all-levels', action='store_true', help='Diff every &inote_N found in either txt')
+    parser.add_argument('--timeline', choices=['delay', 'tick', 'time'], help='delay: compare note by note with delay to next note (default); tick: align notes by absolute onset; time: align notes by real time in seconds, ignoring BPM/division spelling')
+    parser.add_argument('--at', type=str, metavar='TIME', help='Only report differences around TIME (seconds or m:ss.sss)')
+    parser.add_argument('--at-window', type=float, default=2.0, metavar='SECONDS', help='Half width of the --at window (default 2)')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the parse cache')
+    parser.add_argument('--clear-cache', action='store_true', help='Remove all parse cache entries (exit if no txt is given)')
+    parser.add_argument('--cache-dir', type=str, help='Parse cache directory (default: ~/.cache/maidata-diff)')
+    parser.add_argument('--cache-stats', action='store_true', help='Print parse cache hit/miss counters')
+    parser.add_argument('--watch', action='store_true', help='Keep running and re-diff whenever txt1 or txt2 is saved')
+    parser.add_argument('--watch-interval', type=float, default=0.5, help='Polling interval in seconds for --watch (default: 0.5)')
+    parser.add_argument('--format', choices=['text', 'jsonl'], default='text', help='text: human readable report (default); jsonl: one JSON object per error group, then a summary line')
+    parser.add_argument('--max-groups', type=int, metavar='N', help='Stop after N error groups')
+    parser.add_argument('--max-diffs', type=int, metavar='N', help='Stop after N diffs')
+    parser.add_argument('--fail-fast', action='store_true', help='Stop at the first error group and exit 1 if any difference is found')
+    parser.add_argument('--quiet', action='store_true', help='Print nothing, exit 1 on the first difference (or parse error), 0 if identical')
+    parser.add_argument('--parallel-translate', type=int, nargs='?', const=0, metavar='JOBS', help='Parse long inotes in chunks on a process pool (default JOBS: cpu count); output is identical')
+    parser.add_argument('--profile', action='store_true', help='Print wall/CPU time per stage, counters and peak memory to stderr (tracemalloc adds overhead)')
+    parser.add_argument('--stats-json', type=str, metavar='PATH', help="Write the --profile stats as JSON to PATH ('-' for stdout)")
+    add_note_rule_args(parser)
     args = parser.parse_args()
+    apply_note_rule_args(args)
+
+    if args.clear_cache:
+        cache = ParseCache(args.cache_dir)
+        print(f"Cache cleared: {cache.clear()} file(s) removed from {cache.cache_dir}")
+        if not args.positional and not args.lv and not args.txt1 and not args.txt2:
+            sys.exit(0)
     
     lv = None
     txt1 = None
     txt2 = None
     
     # parse args
-    if args.lv and args.txt1 and args.txt2:
+    if args.all_levels and args.txt1 and args.txt2 and not args.positional:
+        txt1 = args.txt1
+        txt2 = args.txt2
+    elif args.all_levels and len(args.positional) == 2 and not args.txt1 and not args.txt2:
+        txt1 = args.positional[0]
+        txt2 = args.positional[1]
+    elif args.lv and args.txt1 and args.txt2:
         lv = args.lv
         txt1 = args.txt1
         txt2 = args.txt2
@@ -29,7 +128,8 @@ def parse_args():
     elif len(args.positional) == 0 and not args.lv and not args.txt1 and not args.txt2:
         # 没有任何参数时，分别询问用户输入
         print("Please provide the following parameters:")
-        lv = input("Enter inote level (2-7): ").strip()
+        if not args.all_levels:
+            lv = input("Enter inote level (2-7): ").strip()
         txt1 = input("Enter path to txt file 1: ").strip()
         txt2 = input("Enter path to txt file 2: ").strip()
         if txt1.startswith('"') and txt1.endswith('"'):
@@ -45,185 +145,1242 @@ def parse_args():
         sys.exit(1)
 
     # validate args
-    try:
-        if not (2 <= int(lv) <= 7): raise ValueError
-    except ValueError:
-        print(f"args error: inote level must be int 2-7")
-        sys.exit(1)
-    if not os.path.exists(txt1):
-        print(f"args error: txt1 not exist")
+    for name in ('max_groups', 'max_diffs'):
+        if getattr(args, name) is not None and getattr(args, name) < 1:
+            print(f"args error: --{name.replace('_', '-')} must be at least 1")
+            sys.exit(1)
+    args.window = None
+    if args.at is not None:
+        try:
+            at = parse_time(args.at)
+        except ValueError:
+            print(f"args error: invalid --at time '{args.at}'")
+            sys.exit(1)
+        args.window = (at - args.at_window, at + args.at_window)
+    if args.watch and args.all_levels:
+        print(f"args error: --watch needs a single inote level")
         sys.exit(1)
-    if not os.path.exists(txt2):
-        print(f"args error: txt2 not exist")
+    if not args.all_levels:
+        try:
+            if not (2 <= int(lv) <= 7): raise ValueError
+        except ValueError:
+            print(f"args error: inote level must be int 2-7")
+            sys.exit(1)
+    try:
+        if not chart_exists(txt1):
+            print(f"args error: txt1 not exist")
+            sys.exit(1)
+        if not chart_exists(txt2):
+            print(f"args error: txt2 not exist")
+            sys.exit(1)
+    except MaidataError as e:
+        print(f"args error: {e}")
         sys.exit(1)
     
-    return lv, txt1, txt2
+    args.lv, args.txt1, args.txt2 = lv, txt1, txt2
+    return args
 
 
 
-def get_inote(lv, txt, txt_num):
+class LineMap:
 
-    with open(txt, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    
-    target_inote = f"&inote_{lv}="
-    inote_content = []
-    found = False
-    start_line = None
-    line_mapping = []  # 记录每个字符对应的行号
-    
-    for line_num, line in enumerate(lines, 1):
+    # inote内容中每一行的起始位置及其行号, 按位置二分查找
+    __slots__ = ('starts', 'lines', 'length')
+
+    def __init__(self):
+        self.starts = array('I')  # 该行在inote内容中的起始位置
+        self.lines = array('I')   # 该行在txt中的行号
+        self.length = 0           # inote内容总长度
+
+    def add_line(self, line_num, content):
+        self.starts.append(self.length)
+        self.lines.append(line_num)
+        self.length += len(content)
+
+
+
+ARCHIVE_PATH_RE = re.compile(r'^(.*?\.(?:zip|7z))!/*(.*)$', re.IGNORECASE)
+
+
+
+def split_archive_path(path):
+
+    # 'pack.zip!/song/maidata.txt' -> ('pack.zip', 'song/maidata.txt'), 普通路径返回 (path, None)
+    match = ARCHIVE_PATH_RE.match(path)
+    if match is None:
+        return path, None
+    return match.group(1), match.group(2)
+
+
+
+def open_archive(archive):
+
+    if archive.lower().endswith('.7z'):
+        raise MaidataError(f"archive error: 7z is not supported, repack {archive} as zip")
+    try:
+        return zipfile.ZipFile(archive)
+    except zipfile.BadZipFile as e:
+        raise MaidataError(f"archive error: {archive}: {e}") from None
+
+
+
+@contextlib.contextmanager
+def open_chart(txt, binary=False):
+
+    # 打开谱面文件, 或压缩包中的一个成员 (pack.zip!/song/maidata.txt)
+    # 压缩包成员边读边解压/解码, 不解压到磁盘, 只读取用到的成员
+    archive, member = split_archive_path(txt)
+    if member is None:
+        with open(txt, 'rb') if binary else open(txt, 'r', encoding='utf-8-sig') as f:
+            yield f
+        return
+    with open_archive(archive) as pack:
+        try:
+            stream = pack.open(member)
+        except KeyError:
+            raise FileNotFoundError(errno.ENOENT, f"No such member in {archive}", member) from None
+        with stream:
+            yield stream if binary else io.TextIOWrapper(stream, encoding='utf-8-sig')
+
+
+
+def read_chart_bytes(txt):
+
+    # 整个文件读入为bytes, 读取中被改写 (编辑器截断后重写) 也只是得到不完整的内容
+    with open_chart(txt, binary=True) as f:
+        return f.read()
+
+
+
+@contextlib.contextmanager
+def map_chart(txt):
+
+    # 只读映射谱面文件, 不读入内存; 压缩包成员和空文件 (无法mmap) 读入为bytes
+    # 映射期间文件被截断时读取会触发SIGBUS (无法捕获), 可能正在被改写的文件用read_chart_bytes
+    if split_archive_path(txt)[1] is None:
+        with open(txt, 'rb') as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    yield mm
+                return
+    with open_chart(txt, binary=True) as f:
+        yield f.read()
+
+
+
+def chart_exists(txt):
+
+    archive, member = split_archive_path(txt)
+    if member is None:
+        return os.path.exists(txt)
+    if not os.path.isfile(archive):
+        return False
+    with open_archive(archive) as pack:
+        try:
+            pack.getinfo(member)
+        except KeyError:
+            return False
+    return True
+
+
+
+def chart_stamp(txt):
+
+    # 判断文件是否改动: (mtime, 大小), 压缩包成员再加上成员的CRC
+    archive, member = split_archive_path(txt)
+    stat = os.stat(archive)
+    if member is None:
+        return stat.st_mtime_ns, stat.st_size
+    with open_archive(archive) as pack:
+        try:
+            info = pack.getinfo(member)
+        except KeyError:
+            raise FileNotFoundError(errno.ENOENT, f"No such member in {archive}", member) from None
+    return stat.st_mtime_ns, stat.st_size, info.CRC, info.file_size
+
+
+
+def read_inotes(txt, levels=None, mapped=True):
+
+    # 提取所有(或指定的) &inote_N 块; txt可以是压缩包中的成员, 见open_chart
+    # 指定levels时映射文件并直接跳到需要的块 (locate_inotes), 否则单次流式读取
+    # mapped=False: 先读入为bytes再定位, 用于读取时可能被改写的文件 (--watch), 见map_chart
+    if levels is not None and split_archive_path(txt)[1] is None:
+        if not mapped:
+            return locate_inotes(read_chart_bytes(txt), levels)
+        with map_chart(txt) as buffer:
+            return locate_inotes(buffer, levels)
+    with open_chart(txt) as f:
+        return extract_inotes(f, levels)
+
+
+
+def read_inotes_from_text(text, levels=None):
+
+    # 同read_inotes, 但接受内存中的谱面 (str, bytes或mmap)
+    if not isinstance(text, str):
+        if levels is not None:
+            return locate_inotes(text, levels)
+        text = decode_chart_bytes(text, 'utf-8-sig')
+    return extract_inotes(io.StringIO(text.removeprefix('\ufeff'), newline=None), levels)
+
+
+
+def decode_chart_bytes(data, encoding='utf-8'):
+
+    # data可以是memoryview, 直接解码不先复制为bytes
+    try:
+        return str(data, encoding)
+    except UnicodeDecodeError as e:
+        raise ChartParseError(f"decode error: {e}") from None
+
+
+
+UTF8_BOM = b'\xef\xbb\xbf'
+INOTE_HEADER = b'&inote_'
+NEWLINE_COUNT_CHUNK = 1 << 16
+NEWLINE_RE = re.compile(rb'\r\n|\r|\n')
+
+
+
+def count_newlines(buffer, start, end):
+
+    # buffer[start:end]中的行数 (\r\n, \r, \n 都是换行, 同文本模式的universal newlines)
+    # 每次只复制一小块计数, 内存不随前缀长度增长; end为行首, 不会切开\r\n
+    count = 0
+    for chunk_start in range(start, end, NEWLINE_COUNT_CHUNK):
+        chunk = buffer[chunk_start:min(chunk_start + NEWLINE_COUNT_CHUNK, end)]
+        count += chunk.count(b'\n') + chunk.count(b'\r') - chunk.count(b'\r\n')
+        if chunk_start > start and buffer[chunk_start - 1:chunk_start + 1] == b'\r\n':
+            count -= 1  # 被块边界切开的\r\n
+    return count
+
+
+
+def iter_inote_headers(buffer, start=0):
+
+    # 在字节中查找 &inote_ 行 (行首到 &inote_ 之间只有空白), 返回 (行首位置, strip后的行)
+    position = buffer.find(INOTE_HEADER, start)
+    while position >= 0:
+        line_start = max(buffer.rfind(b'\n', start, position), buffer.rfind(b'\r', start, position)) + 1
+        line_start = max(line_start, start)
+        if line_start == position or not decode_chart_bytes(buffer[line_start:position]).strip():
+            line_end = len(buffer)
+            for newline in (b'\n', b'\r'):
+                index = buffer.find(newline, position, line_end)
+                if index >= 0: line_end = index
+            yield line_start, decode_chart_bytes(buffer[line_start:line_end]).strip()
+        position = buffer.find(INOTE_HEADER, position + len(INOTE_HEADER))
+
+
+
+def locate_inotes(buffer, levels):
+
+    # 同extract_inotes(指定levels), 但直接在字节 (mmap) 中查找 &inote_ 行并跳到需要的块
+    # 只解码并建立这些块的行映射, 起始行号由块之前的换行数得到; 跳过开头的UTF-8 BOM
+    wanted = {str(lv) for lv in levels}
+    start = len(UTF8_BOM) if buffer[:len(UTF8_BOM)] == UTF8_BOM else 0
+    spans = []      # (level, 块起始, 块结束), 块到下一个 &inote_ 行为止
+    current = None  # (level, 块起始)
+    for line_start, line in iter_inote_headers(buffer, start):
+        if current is not None:
+            spans.append((*current, line_start))
+            current = None
+            if len(spans) == len(wanted):
+                break  # 需要的inote都已找到
+        level, sep, _ = line[len('&inote_'):].partition('=')
+        if not sep or level not in wanted or any(level == span[0] for span in spans):
+            continue  # 重复的inote只取第一个
+        current = (level, line_start)
+    if current is not None:
+        spans.append((*current, len(buffer)))
+
+    blocks = {}
+    line_num, counted = 1, start
+    for level, block_start, block_end in spans:
+        line_num += count_newlines(buffer, counted, block_start)
+        counted = block_start
+        with contextlib.closing(iter_block_lines(buffer, block_start, block_end)) as lines:
+            blocks.update(extract_inotes(lines, [level], line_num))  # 关闭后才释放memoryview, mmap才能关闭
+    return blocks
+
+
+
+def iter_block_lines(buffer, start, end):
+
+    # buffer[start:end]按universal newlines (\r\n, \r, \n) 逐行解码产出, 同文本模式读取
+    # 换行符是ASCII, 不会出现在多字节字符中间, 所以逐行解码与整块解码相同; 不复制整个块
+    with memoryview(buffer) as view:
+        position = start
+        for match in NEWLINE_RE.finditer(buffer, start, end):
+            yield decode_chart_bytes(view[position:match.start()])
+            position = match.end()
+        if position < end:
+            yield decode_chart_bytes(view[position:end])
+
+
+
+def extract_inotes(lines, levels=None, first_line=1):
+
+    # 返回 {level: (inote_raw, start_line, line_mapping)}, level为字符串
+    # first_line: lines第一行的行号 (lines为文件中间的一段时)
+    wanted = None if levels is None else {str(lv) for lv in levels}
+    blocks = {}
+    current = None  # 正在读取的块: (level, inote_content, start_line, line_mapping)
+
+    for line_num, line in enumerate(lines, first_line):
         line = line.strip()
         if not line: continue
         if line.startswith('||'): continue # Skip comment
 
-        # Find the target inote
-        if not found and line.startswith(target_inote):
-            found = True
-            start_line = line_num
-            content = line[len(target_inote):].strip()
+        # Encounter another inote, close current block
+        if line.startswith('&inote_'):
+            if current is not None:
+                level, inote_content, start_line, line_mapping = current
+                blocks[level] = (''.join(inote_content), start_line, line_mapping)
+                current = None
+                if wanted is not None and wanted.issubset(blocks):
+                    break  # 需要的inote都已找到
+
+            level, sep, content = line[len('&inote_'):].partition('=')
+            if not sep or level in blocks: continue  # 重复的inote只取第一个
+            if wanted is not None and level not in wanted: continue
+
+            current = (level, [], line_num, LineMap())
+            content = content.strip()
             if content:
-                inote_content.append(content)
-                # 为这部分内容的每个字符记录行号
-                for _ in content:
-                    line_mapping.append(line_num)
+                current[1].append(content)
+                current[3].add_line(line_num, content)
             continue
-        # If we found the target inote and encounter another inote, stop
-        if found and line.startswith('&inote_'):
-            break
+
         # Append line to inote
-        if found:
-            inote_content.append(line)
-            # 为这行内容的每个字符记录行号
-            for _ in line:
-                line_mapping.append(line_num)
-            continue
-    
-    if not found:
-        print(f"get_inote error: inote_{lv} not found in {txt_num}")
-        sys.exit(1)
+        if current is not None:
+            current[1].append(line)
+            current[3].add_line(line_num, line)
 
-    return ''.join(inote_content).replace('\n', ''), start_line, line_mapping
+    if current is not None:
+        level, inote_content, start_line, line_mapping = current
+        blocks[level] = (''.join(inote_content), start_line, line_mapping)
+
+    return blocks
+
+
+
+def get_inote(lv, txt, txt_num, mapped=True):
+
+    blocks = read_inotes(txt, [lv], mapped)
+    if str(lv) not in blocks:
+        raise InoteNotFoundError(lv, txt_num)
+
+    return blocks[str(lv)]
+
+
+
+def level_sort_key(level):
+
+    return (0, int(level), '') if level.isdigit() else (1, 0, level)
 
 
 
 def get_line_number_for_position(line_mapping, position):
 
-    if position < 0 or position >= len(line_mapping):
+    if position < 0 or position >= line_mapping.length:
         return None
-    return line_mapping[position]
+    return line_mapping.lines[bisect.bisect_right(line_mapping.starts, position) - 1]
+
+
+
+INFO_POOL = []  # note info字符串池, NoteTable中只保存其下标
+INFO_IDS = {}
+INFO_KEYS = []  # INFO_POOL下标 -> 规范键id, 比较note时只比较这个int
+NOTE_KEYS = []  # 规范键id -> 规范键
+NOTE_KEY_IDS = {}
+NOTE_KEY_DIGESTS = []  # 规范键id -> 规范键内容的crc32, 与编号顺序无关 (见get_group_digests)
+# 向上面的池中添加条目时持有; 已有条目不会改变, 查找不加锁 (条目写全之后才放入INFO_IDS/NOTE_KEY_IDS)
+INTERN_LOCK = threading.RLock()
+
+# 比较时忽略的写法差异, 可通过set_normalization_rules修改
+NORMALIZATION_RULES = {
+    'sensor_aliases': {'c1': 'C', 'c2': 'C', 'C1': 'C'},  # 视为相同的touch写法
+    'slide_shapes': {'>': '^', '<': '^'},                   # 视为相同的slide形状
+    'ignored_flags': '$',                                   # 忽略的修饰符
+    'time_tolerance_ms': 1.0,                               # --timeline time: 视为同一时刻的最大误差
+}
+SLIDE_SHAPES = frozenset('-<>^vpqszwV')
+TOUCH_SENSORS = frozenset('ABCDEc')
+
+
+
+def intern_info(info):
+
+    # 第一次出现的info在这里计算规范键, 之后同样的info共享同一个键
+    info_id = INFO_IDS.get(info)
+    if info_id is None:
+        with INTERN_LOCK:
+            info_id = INFO_IDS.get(info)
+            if info_id is None:
+                info_id = len(INFO_POOL)
+                INFO_KEYS.append(intern_note_key(canonical_note_key(info)))
+                INFO_POOL.append(sys.intern(info))
+                INFO_IDS[info] = info_id
+    return info_id
+
+
+
+def intern_note_key(key):
+
+    key_id = NOTE_KEY_IDS.get(key)
+    if key_id is None:
+        with INTERN_LOCK:
+            key_id = NOTE_KEY_IDS.get(key)
+            if key_id is None:
+                key_id = len(NOTE_KEYS)
+                NOTE_KEYS.append(key)
+                NOTE_KEY_DIGESTS.append(zlib.crc32(repr(key).encode('utf-8')))
+                NOTE_KEY_IDS[key] = key_id
+    return key_id
+
+
+
+def canonical_note_key(info):
+
+    # info (已去掉[x:y]) -> 可哈希的规范键
+    #   touch: ('touch', 传感器, 修饰符)
+    #   tap/hold/slide: ('note', 按键, 修饰符, ((slide路径, 路径修饰符), ...))
+    #   修饰符为排序后的tuple, 所以 1xh 与 1hx 相同; 无法识别的写法为 ('raw', info)
+    rules = NORMALIZATION_RULES
+    for flag in rules['ignored_flags']:
+        info = info.replace(flag, '')
+    if not info:
+        return ('raw', info)
+    if info[0] in TOUCH_SENSORS:
+        split = 2 if len(info) > 1 and info[1] in '12345678' else 1
+        sensor = rules['sensor_aliases'].get(info[:split], info[:split])
+        return ('touch', sensor, tuple(sorted(info[split:])))
+    if info[0] not in '12345678':
+        return ('raw', info)
+
+    flags = []
+    paths = []
+    path = None  # 当前slide路径: [(形状, 终点), ...]
+    path_flags = None
+    i = 1
+    while i < len(info):
+        char = info[i]
+        if char in SLIDE_SHAPES:
+            shape = info[i:i + 2] if info[i:i + 2] in ('pp', 'qq') else char
+            i += len(shape)
+            end = i
+            while end < len(info) and info[end].isdigit():
+                end += 1
+            if path is None:
+                path = []
+                path_flags = []
+            path.append((rules['slide_shapes'].get(shape, shape), info[i:end]))
+            i = end
+            continue
+        if char == '*':  # 同一个头的多条slide
+            if path is not None:
+                paths.append((tuple(path), tuple(sorted(path_flags))))
+            path = None
+        else:
+            (flags if path is None else path_flags).append(char)
+        i += 1
+    if path is not None:
+        paths.append((tuple(path), tuple(sorted(path_flags))))
+    return ('note', info[0], tuple(sorted(flags)), tuple(paths))
 
 
 
-def translate_inote(inote):
+def set_normalization_rules(sensor_aliases=None, slide_shapes=None, ignored_flags=None, time_tolerance_ms=None):
 
-    segments = inote.split(',')
-    result = []
-    current_bpm = None
-    current_length = None
-    added_initial_placeholder = False
-    
-    i = 0
-    while i < len(segments):
-        segment = segments[i].strip()
-        if segment == 'E': break  # End of inote
-        note_info, current_bpm, current_length = parse_bpm_length(segment, current_bpm, current_length, i)
+    # 修改比较规则 (None表示保持不变), 已出现的info全部重新计算规范键
+    # 之前得到的对齐键 (get_alignment_keys的key_ids) 随之失效
+    if time_tolerance_ms is not None:
+        NORMALIZATION_RULES['time_tolerance_ms'] = float(time_tolerance_ms)
+    if sensor_aliases is None and slide_shapes is None and ignored_flags is None:
+        return
+    if sensor_aliases is not None:
+        NORMALIZATION_RULES['sensor_aliases'] = dict(sensor_aliases)
+    if slide_shapes is not None:
+        NORMALIZATION_RULES['slide_shapes'] = dict(slide_shapes)
+    if ignored_flags is not None:
+        NORMALIZATION_RULES['ignored_flags'] = ''.join(ignored_flags)
+    with INTERN_LOCK:
+        NOTE_KEYS.clear()
+        NOTE_KEY_IDS.clear()
+        NOTE_KEY_DIGESTS.clear()
+        INFO_KEYS[:] = [intern_note_key(canonical_note_key(info)) for info in INFO_POOL]
+
+
+
+def normalization_rule_values():
+
+    # set_normalization_rules的参数, 用于把当前规则传给子进程
+    return tuple(NORMALIZATION_RULES[name] for name in ('sensor_aliases', 'slide_shapes', 'ignored_flags', 'time_tolerance_ms'))
+
+
+
+class NoteTable:
+
+    # 列式存储的谱面时间轴: 每个note占一行, 各字段为并列的array
+    # 同时押的note共享一个group id, 一个group即时间轴上的一个位置
+    __slots__ = ('info', 'bpm', 'length', 'hold', 'seconds', 'segment', 'group', 'group_start', 'resolution', 'warnings')
+
+    def __init__(self, resolution=1):
+        self.info = array('I')         # INFO_POOL下标
+        self.bpm = array('d')
+        self.length = array('q')       # 到下一组note的时长 (tick)
+        self.hold = array('q')         # hold时长 (tick), 0表示没有
+        self.seconds = array('d')      # 到下一组note的实际时长 (秒), 间隔中的BPM变化也计算在内, 见tempo_map
+        self.segment = array('i')      # 所在segment, -1为开头占位符
+        self.group = array('I')        # 所属group id
+        self.group_start = array('I')  # 每个group第一个note的行号
+        self.resolution = resolution   # 一小节的tick数
+        self.warnings = []             # 解析时的非致命错误
+
+    def __len__(self):
+        # 时间轴上的位置数 (同时押算一个)
+        return len(self.group_start)
+
+    def __eq__(self, other):
+        if not isinstance(other, NoteTable):
+            return NotImplemented
+        if self.resolution != other.resolution:
+            resolution = math.lcm(self.resolution, other.resolution)
+            return self.scaled(resolution) == other.scaled(resolution)
+        return (self.group_start == other.group_start and self.info == other.info and
+                self.bpm == other.bpm and self.length == other.length and self.hold == other.hold)
+
+    __hash__ = None
+
+    def add_group(self, notes, bpm, length, segment_index, seconds=0.0):
+        # notes: [(info, hold), ...]
+        group_id = len(self.group_start)
+        self.group_start.append(len(self.info))
+        for info, hold in notes:
+            info_id = INFO_IDS.get(info)
+            self.info.append(intern_info(info) if info_id is None else info_id)
+            self.hold.append(hold)
+        count = len(notes)
+        if count == 1:  # 大部分group只有一个note
+            self.bpm.append(bpm)
+            self.length.append(length)
+            self.seconds.append(seconds)
+            self.segment.append(segment_index)
+            self.group.append(group_id)
+        else:
+            self.bpm.extend([bpm] * count)
+            self.length.extend([length] * count)
+            self.seconds.extend([seconds] * count)
+            self.segment.extend([segment_index] * count)
+            self.group.extend([group_id] * count)
+
+    def group_range(self, group_id):
+        start = self.group_start[group_id]
+        end = self.group_start[group_id + 1] if group_id + 1 < len(self.group_start) else len(self.info)
+        return start, end
+
+    def add_length_to_last_group(self, length, seconds=0.0):
+        start, end = self.group_range(len(self.group_start) - 1)
+        for k in range(start, end):
+            self.length[k] += length
+            self.seconds[k] += seconds
+
+    def group_segment(self, group_id):
+        return self.segment[self.group_start[group_id]]
+
+    def onsets(self):
+        # 每个group的绝对起始位置 (tick) = 之前所有group时长之和
+        onsets = array('q')
+        tick = 0
+        for group_start in self.group_start:
+            onsets.append(tick)
+            tick += self.length[group_start]
+        return onsets
+
+    def tempo_map(self, inote=None, segment_offsets=None):
+        return TempoMap(self, inote, segment_offsets)
+
+    def rescale(self, resolution):
+        # 原地换算到更高的精度 (resolution必须是当前精度的倍数)
+        factor = resolution // self.resolution
+        if factor != 1:
+            for k in range(len(self.length)):
+                self.length[k] *= factor
+                self.hold[k] *= factor
+        self.resolution = resolution
+
+    def scaled(self, resolution):
+        # 返回换算到另一个精度的副本
+        factor = resolution // self.resolution
+        table = NoteTable(resolution)
+        table.info = array('I', self.info)
+        table.bpm = array('d', self.bpm)
+        table.length = array('q', (length * factor for length in self.length))
+        table.hold = array('q', (hold * factor for hold in self.hold))
+        table.seconds = array('d', self.seconds)
+        table.segment = array('i', self.segment)
+        table.group = array('I', self.group)
+        table.group_start = array('I', self.group_start)
+        return table
+
+
+
+class TempoMap:
+
+    # 时间轴索引: 每个group的起始tick和起始时刻 (秒, 由NoteTable.seconds求前缀和), 以及BPM变化点
+    # 时刻 <-> group/segment 的查询都是二分查找, 不需要重新累加之前的时长
+    # BPM变化点需要inote原文和segment_offsets: (xxx)可能写在空segment中, 此时变化发生在group的间隔之内
+    __slots__ = ('resolution', 'ticks', 'times', 'segments', 'change_times', 'change_bpm')
+
+    def __init__(self, table, inote=None, segment_offsets=None):
+        starts = table.group_start
+        self.resolution = table.resolution
+        self.ticks = table.onsets()
+        self.times = array('d', itertools.accumulate((table.seconds[k] for k in starts), initial=0.0))
+        self.segments = array('i', (table.segment[k] for k in starts))
+        self.change_times = None  # BPM变化的时刻, 没有inote原文时为None
+        self.change_bpm = None
+        if inote is not None:
+            self.change_times = array('d')
+            self.change_bpm = array('d')
+            self.add_tempo_changes(inote, segment_offsets)
+
+    def add_tempo_changes(self, inote, segment_offsets):
+        # 按segment顺序处理 (xxx)/{xxx}, 与tokenize_inote相同: 每个segment取最后一个
+        # 锚点 (segment, 时刻) 之后到下一个设置之前, 每个segment的时长不变, 设置所在segment的时刻由锚点推算
+        # 设置之前有新的group开始时, 锚点换成该group (其时刻由NoteTable.seconds累加, 已包含之前的变化)
+        bpm = length = None
+        anchor_segment, anchor_time = 0, 0.0
+        for segment_index, bpm_text, length_text in iter_segment_settings(inote, segment_offsets):
+            group_id = bisect.bisect_right(self.segments, segment_index, 0, len(self.segments)) - 1
+            if group_id >= 0 and self.segments[group_id] >= anchor_segment:
+                anchor_segment, anchor_time = max(self.segments[group_id], 0), self.times[group_id]
+            seconds = anchor_time
+            if bpm is not None and length is not None and bpm > 0:
+                seconds += (segment_index - anchor_segment) * 240.0 / (bpm * length)
+            if bpm_text is not None:
+                bpm = round(float(bpm_text), 2)
+            if length_text is not None:
+                length = int(length_text)
+            anchor_segment, anchor_time = segment_index, seconds
+            if bpm_text is not None and (not self.change_bpm or bpm != self.change_bpm[-1]):
+                self.change_times.append(seconds)
+                self.change_bpm.append(bpm)
+
+    def __len__(self):
+        return len(self.segments)
+
+    def time_at_group(self, group_id):
+        # group的起始时刻 (秒); group_id等于len时为谱面结束时刻
+        return self.times[group_id]
+
+    def group_at_time(self, seconds):
+        # 在该时刻或之前开始的最后一个group, 早于第一个group时返回0
+        return max(bisect.bisect_right(self.times, seconds, 0, len(self.segments)) - 1, 0)
+
+    def groups_between(self, start, end):
+        # 起始时刻在 [start, end] 之内的group: (第一个, 最后一个+1)
+        count = len(self.segments)
+        return bisect.bisect_left(self.times, start, 0, count), bisect.bisect_right(self.times, end, 0, count)
+
+    def time_at_segment(self, segment_index):
+        # segment所在位置的时刻; 空segment属于前一个group的间隔, 返回该group的时刻
+        return self.times[max(bisect.bisect_right(self.segments, segment_index) - 1, 0)]
+
+    def bpm_at_time(self, seconds):
+        # 该时刻的BPM, 早于第一个变化点时为第一个BPM, 没有note时为None
+        if self.change_times is None:
+            raise ValueError("bpm_at_time needs a TempoMap built with the inote text and segment offsets")
+        index = bisect.bisect_right(self.change_times, seconds) - 1
+        return self.change_bpm[max(index, 0)] if self.change_bpm else None
+
+
+
+BPM_LENGTH_RE = re.compile(r'\(([^)]*)\)|\{([^}]*)\}')
+HOLD_RE = re.compile(r'\[([^\]]*)\]')
+SETTING_START_RE = re.compile(r'[({]')
+
+
+
+def iter_segment_settings(inote, segment_offsets):
+
+    # 有 (xxx)/{xxx} 的segment: (segment_index, bpm_text, length_text), 与tokenize_inote产出的相同
+    # 只切分含有括号的segment, 不需要重新解析note; segment_offsets为translate_inote的返回值
+    segment_count = len(segment_offsets) - 1
+    last_segment = -1
+    for match in SETTING_START_RE.finditer(inote):
+        segment_index = bisect.bisect_right(segment_offsets, match.start(), 0, segment_count) - 1
+        if segment_index <= last_segment:
+            continue
+        last_segment = segment_index
+        start = segment_offsets[segment_index]
+        end = inote.find(',', start)
+        if end == -1:
+            end = len(inote)
+        if match.start() >= end:
+            continue  # 'E'之后的内容
+        bpm_text = length_text = None
+        for setting in BPM_LENGTH_RE.finditer(inote, start, end):
+            if setting.group(1) is not None:
+                bpm_text = setting.group(1)
+            else:
+                length_text = setting.group(2)
+        if bpm_text is not None or length_text is not None:
+            yield segment_index, bpm_text, length_text
+
+
+
+def tokenize_inote(inote, warnings=None, pos=0, segment_index=0, end_pos=None):
+
+    # 逐个segment流式切分inote (不预先split整个字符串)
+    # 产出 (kind, segment_index, start, end, bpm_text, length_text, notes, last)
+    #   kind: 'note' 有note内容 / 'empty' 空segment / 'E' 结束符 (之后不再产出)
+    #   bpm_text/length_text: 该segment中最后一个(xxx)/{xxx}的内容, 没有则为None
+    #   notes: [(info, hold_parts)], hold_parts为[(分母, 分子)], 没有时为0
+    #   last: 之后没有逗号
+    # pos/segment_index: 从某个segment的起始位置开始切分 (增量解析)
+    # end_pos: 到该位置开始的segment为止 (不含), 用于并行解析
+    while True:
+        if end_pos is not None and pos >= end_pos:
+            return
+        end = inote.find(',', pos)
+        last = end == -1
+        if last:
+            end = len(inote)
+        segment = inote[pos:end]
+
+        stripped = segment.strip()
+        if stripped == 'E':
+            yield 'E', segment_index, pos, end, None, None, None, last
+            return
+
+        bpm_text = None
+        length_text = None
+        if '(' in segment or '{' in segment:
+            # Remove BPM and length settings, leaving only note info
+            pieces = []
+            piece_start = 0
+            for match in BPM_LENGTH_RE.finditer(segment):
+                if match.group(1) is not None:
+                    bpm_text = match.group(1)
+                else:
+                    length_text = match.group(2)
+                pieces.append(segment[piece_start:match.start()])
+                piece_start = match.end()
+            if pieces:
+                pieces.append(segment[piece_start:])
+                stripped = ''.join(pieces).strip()
+
+        if stripped:
+            yield 'note', segment_index, pos, end, bpm_text, length_text, parse_note_segment(stripped, warnings) or [], last
+        else:
+            yield 'empty', segment_index, pos, end, bpm_text, length_text, None, last
+
+        if last:
+            return
+        pos = end + 1
+        segment_index += 1
+
+
+
+CHECKPOINT_INTERVAL = 64  # 增量解析的断点间隔 (segment数)
+
+
+
+class Checkpoints:
+
+    # translate_inote的断点: 某个有note的segment之前, 且没有未合并的空segment时的解析状态
+    # 断点之前的group之后不会再被修改, 从断点继续解析与完整解析的结果相同
+    __slots__ = ('segment', 'groups', 'notes', 'warnings', 'bpm', 'length', 'resolution', 'last_length', 'last_seconds')
+
+    def __init__(self):
+        self.segment = array('I')   # 断点所在segment
+        self.groups = array('I')    # 此时NoteTable中的group数
+        self.notes = array('I')     # 此时NoteTable中的note数
+        self.warnings = array('I')  # 此时warnings的条数
+        self.bpm = array('d')       # 当前BPM
+        self.length = array('q')    # 当前分音
+        self.resolution = array('q')     # 此时NoteTable的resolution
+        # 此时最后一个group的时长; 断点之后它仍可能被修改 (合并之后的空segment, 结尾清零)
+        self.last_length = array('q')
+        self.last_seconds = array('d')
+
+    def __len__(self):
+        return len(self.segment)
+
+    def add(self, segment_index, table, bpm, length, warning_count):
+        self.segment.append(segment_index)
+        self.groups.append(len(table.group_start))
+        self.notes.append(len(table.info))
+        self.warnings.append(warning_count)
+        self.bpm.append(bpm)
+        self.length.append(length)
+        self.resolution.append(table.resolution)
+        self.last_length.append(table.length[-1] if len(table.info) else 0)
+        self.last_seconds.append(table.seconds[-1] if len(table.info) else 0.0)
+
+    def last_group_changed(self, checkpoint_id, table):
+        # table (该次解析的最终结果) 中断点之前的最后一个group是否在断点之后被修改过
+        notes = self.notes[checkpoint_id]
+        if not notes:
+            return False
+        factor = table.resolution // self.resolution[checkpoint_id]
+        return (table.length[notes - 1] != self.last_length[checkpoint_id] * factor or
+                table.seconds[notes - 1] != self.last_seconds[checkpoint_id])
+
+    def head(self, count):
+        # 前count个断点的副本
+        checkpoints = Checkpoints()
+        for name in Checkpoints.__slots__:
+            setattr(checkpoints, name, getattr(self, name)[:count])
+        return checkpoints
+
+    def extend_shifted(self, other, start, segment_shift, group_shift, note_shift, warning_shift):
+        # 追加other中从start开始的断点, 各位置加上偏移
+        self.segment.extend(shift_array(other.segment[start:], segment_shift))
+        self.groups.extend(shift_array(other.groups[start:], group_shift))
+        self.notes.extend(shift_array(other.notes[start:], note_shift))
+        self.warnings.extend(shift_array(other.warnings[start:], warning_shift))
+        self.bpm.extend(other.bpm[start:])
+        self.length.extend(other.length[start:])
+        self.resolution.extend(other.resolution[start:])
+        self.last_length.extend(other.last_length[start:])
+        self.last_seconds.extend(other.last_seconds[start:])
+
+
+
+def shift_array(values, shift):
+
+    if shift == 0:
+        return values
+    return array(values.typecode, [value + shift for value in values])
+
+
+
+def translate_inote(inote, checkpoints=None):
+
+    # 流式消费tokenize_inote, 时长均为整数tick, 一小节 = resolution 个tick
+    # 遇到新的分音时原地提高精度, 不需要预先扫描整个inote
+    # checkpoints不为None时同时记录增量解析用的断点 (见retranslate_inote)
+    result = NoteTable(1)
+    segment_offsets = array('I')  # segment k 的范围为 offsets[k] ~ offsets[k+1]-1 (不含逗号), 末尾多一项哨兵
+    return translate_segments(inote, result, segment_offsets, tokenize_inote(inote, result.warnings), None, None, checkpoints)
+
+
+
+def translate_segments(inote, result, segment_offsets, tokens, current_bpm, current_length, checkpoints=None, splice=None, chunk=False):
+
+    # translate_inote的主循环, 从result/segment_offsets的当前状态继续解析
+    # splice: 增量解析时可以沿用的旧结果, 状态一致时直接拼接 (见splice_tail)
+    # chunk: 并行解析中的一段 (见translate_chunk), 不从segment 0开始时不添加开头占位符;
+    #        tokens在inote结束前用完时不追加哨兵, 也不修改最后一个note的时长
+    added_initial_placeholder = len(result) > 0
+    skipped_placeholder = False
+    finished = False  # 遇到了结束符或最后一个segment
+    placeholder_length = None  # 正在合并的连续空segment时长
+    placeholder_seconds = 0.0
+    placeholder_segment = None
+    tracking = checkpoints is not None or splice is not None
+    next_checkpoint = 0
+    warning_count = len(result.warnings)  # tokens产出segment之前已经解析了其中的note, 这里记录之前的warning数
+
+    for kind, i, start, _, bpm_text, length_text, notes, last in tokens:
+        if tracking:
+            if kind == 'note' and placeholder_length is None and added_initial_placeholder:
+                if splice is not None and start >= splice['start']:
+                    checkpoint_id = splice['reusable'].get(start)
+                    if checkpoint_id is not None and splice_tail(result, segment_offsets, checkpoints, i, current_bpm, current_length, warning_count, splice, checkpoint_id):
+                        return result, segment_offsets
+                if checkpoints is not None and i >= next_checkpoint:
+                    checkpoints.add(i, result, current_bpm, current_length, warning_count)
+                    next_checkpoint = i + CHECKPOINT_INTERVAL
+            warning_count = len(result.warnings)
+
+        segment_offsets.append(start)
+        finished = kind == 'E' or last
+        if kind == 'E': break  # End of inote
+
+        # Parse BPM and length settings from this segment
+        if bpm_text is not None:
+            try:
+                current_bpm = round(float(bpm_text), 2)
+            except ValueError:
+                raise ChartParseError(f"parse_bpm_length error: Invalid BPM '{bpm_text}' at note {i}") from None
+        if length_text is not None:
+            try:
+                current_length = int(length_text)
+                if current_length <= 0: raise ValueError
+            except ValueError:
+                raise ChartParseError(f"parse_bpm_length error: Invalid length '{length_text}' at note {i}") from None
+            if result.resolution % current_length:
+                resolution = math.lcm(result.resolution, current_length)
+                if placeholder_length is not None:
+                    placeholder_length *= resolution // result.resolution
+                result.rescale(resolution)
+        if current_bpm is None or current_length is None:
+            raise ChartParseError(f"parse_bpm_length error: BPM not set at note {i}")
+        length = result.resolution // current_length
+        seconds = 240.0 / (current_bpm * current_length) if current_bpm > 0 else 0.0  # 一小节4拍
 
         # 开头默认添加一个时长为0的占位符
-        if not added_initial_placeholder and current_bpm is not None and current_length is not None:
-            result.append({
-                'info': '@',
-                'bpm': current_bpm,
-                'length': fractions.Fraction(0, 1),
-                'segment_index': -1  # 特殊标记为开头占位符
-            })
+        if not added_initial_placeholder:
+            if chunk and i:
+                skipped_placeholder = True
+            else:
+                result.add_group([('@', 0)], current_bpm, 0, -1)  # 特殊标记为开头占位符
             added_initial_placeholder = True
-        
-        if note_info:
-            # Parse this segment as notes
-            parsed_note = parse_note_segment(note_info, current_bpm, current_length)
-            if parsed_note:
-                # Add segment index for context tracking
-                if isinstance(parsed_note, dict):
-                    parsed_note['segment_index'] = i
-                elif isinstance(parsed_note, list):
-                    for note in parsed_note:
-                        note['segment_index'] = i
-                result.append(parsed_note)
-        else:
+
+        if kind == 'empty':
             # No info segment means placeholder note '@'
-            # Loop check if next segment also no info
             # Combine consecutive placeholder notes into one
-            placeholder_length = fractions.Fraction(1, current_length)
-            j = i + 1
-            if j >= len(segments): break # End of inote
-
-            while j < len(segments):
-                next_segment = segments[j].strip()
-                if next_segment == 'E': break # End of inote
-                note_info, current_bpm, current_length = parse_bpm_length(next_segment, current_bpm, current_length, j)
-                
-                if note_info: break # Not a placeholder segment
-                placeholder_length += fractions.Fraction(1, current_length) # Add placeholder segment
-                j += 1
-            
-            # Add combined length to last note
-            if result:
-                # If last note is a single note
-                if isinstance(result[-1], dict):
-                    result[-1]['length'] += placeholder_length
-                # If last note is a list (simultaneous notes)    
-                elif isinstance(result[-1], list):
-                    for note in result[-1]:
-                        note['length'] += placeholder_length
+            if placeholder_length is None:
+                if last: break # End of inote
+                placeholder_length = length
+                placeholder_seconds = seconds
+                placeholder_segment = i
             else:
-                # If no notes yet, create a placeholder note
-                result.append({
-                    'info': '@',
-                    'bpm': current_bpm,
-                    'length': placeholder_length,
-                    'segment_index': i
-                })
-
-            i = j - 1  # j-1 because will i++ below
-        
-        i += 1
+                placeholder_length += length
+                placeholder_seconds += seconds
+            continue
+
+        # Add combined placeholder length to last note
+        if placeholder_length is not None:
+            add_placeholder_length(result, placeholder_length, current_bpm, placeholder_segment, placeholder_seconds)
+            placeholder_length = None
+
+        if notes:
+            # Holds in ticks, raise resolution for new denominators
+            has_hold = False
+            for _, hold_parts in notes:
+                for denominator, _ in hold_parts or ():
+                    has_hold = True
+                    if result.resolution % denominator:
+                        result.rescale(math.lcm(result.resolution, denominator))
+            if has_hold:
+                length = result.resolution // current_length
+                notes = [(info, sum(numerator * (result.resolution // denominator) for denominator, numerator in hold_parts) if hold_parts else 0)
+                         for info, hold_parts in notes]
+            # Add segment index for context tracking
+            result.add_group(notes, current_bpm, length, i, seconds)
+
+    if placeholder_length is not None:
+        add_placeholder_length(result, placeholder_length, current_bpm, placeholder_segment, placeholder_seconds)
+    if chunk and not finished:
+        return result, segment_offsets
+    segment_offsets.append(len(inote) + 1)  # 'E' 之后的内容都算作最后一个segment
     
     # 修改最后一个note的delay为0（特殊情况处理）
-    if result and len(result) > 1:  # 确保有note并且不只是开头的占位符
-        last_note = result[-1]
-        if isinstance(last_note, dict):
-            # 单个note
-            if last_note['info'] != '@':  # 不是占位符
-                last_note['length'] = fractions.Fraction(0, 1)
-        elif isinstance(last_note, list):
-            # 同时的多个notes
-            for note in last_note:
-                if note['info'] != '@':  # 不是占位符
-                    note['length'] = fractions.Fraction(0, 1)
+    if len(result) > (0 if skipped_placeholder else 1):  # 确保有note并且不只是开头的占位符
+        start, end = result.group_range(len(result) - 1)
+        placeholder_id = intern_info('@')
+        for k in range(start, end):
+            if result.info[k] != placeholder_id:  # 不是占位符
+                result.length[k] = 0
+                result.seconds[k] = 0.0
     
-    return result
+    return result, segment_offsets
+
+
+
+PARALLEL_TRANSLATE_MIN_CHARS = 100000  # 短于此时进程池的开销大于收益
+PARALLEL_STATE = {'inote': None}  # translate_chunk读取的inote, fork的子进程直接继承
+
+
+
+def split_inote(inote, count):
+
+    # 把inote切成约count段, 每段从一个有note的segment开始 (之前的空segment留在上一段, 合并规则不变)
+    # 每段开始时的BPM/分音由之前出现的最后一个 (xxx)/{xxx} 决定, 不需要解析之前的note
+    # 返回 [(start, end, segment_index, bpm, length)], 无法切分时返回None
+    settings = []  # (位置, bpm_text, length_text)
+    for match in BPM_LENGTH_RE.finditer(inote):
+        if ',' in match.group(0):
+            return None  # 跨segment的括号, 只能按segment切分后解析
+        settings.append((match.start(), match.group(1), match.group(2)))
+    positions = [position for position, _, _ in settings]
+
+    starts = []
+    for k in range(1, count):
+        pos = inote.find(',', len(inote) * k // count)
+        while pos != -1:
+            start = pos + 1
+            pos = inote.find(',', start)
+            segment = inote[start:len(inote) if pos == -1 else pos]
+            if segment.strip() == 'E':
+                break
+            if BPM_LENGTH_RE.sub('', segment).strip():
+                if not starts or start > starts[-1]:
+                    starts.append(start)
+                break
+    if not starts:
+        return None
+
+    tasks = [(0, starts[0], 0, None, None)]
+    segment_index = 0
+    last = 0
+    for n, start in enumerate(starts):
+        segment_index += inote.count(',', last, start)
+        last = start
+        bpm = length = None
+        for position, bpm_text, length_text in reversed(settings[:bisect.bisect_left(positions, start)]):
+            if bpm is None and bpm_text is not None:
+                bpm = bpm_text
+            if length is None and length_text is not None:
+                length = length_text
+            if bpm is not None and length is not None:
+                break
+        try:
+            bpm = round(float(bpm), 2)
+            length = int(length)
+            if length <= 0: raise ValueError
+        except (TypeError, ValueError):
+            return None  # 之前的设置无效或缺失, 串行解析会在那里报错
+        end = starts[n + 1] if n + 1 < len(starts) else None
+        tasks.append((start, end, segment_index, bpm, length))
+    return tasks
+
 
 
+def init_translate_worker(inote):
 
-def get_context_from_original(inote_raw, segment_index, context_chars=20):
+    PARALLEL_STATE['inote'] = inote
+
+
+
+def translate_chunk(task):
+
+    # 在子进程中解析inote的一段, 返回可序列化的结果
+    # info换成段内的字符串池下标 (各进程的INFO_POOL不同); finished: 这一段到达了inote的结尾
+    start, end, segment_index, bpm, length = task
+    inote = PARALLEL_STATE['inote']
+    result = NoteTable(length or 1)
+    segment_offsets = array('I')
+    tokens = tokenize_inote(inote, result.warnings, start, segment_index, end)
+    translate_segments(inote, result, segment_offsets, tokens, bpm, length, chunk=True)
+    local_ids = {}
+    info = array('I', [local_ids.setdefault(info_id, len(local_ids)) for info_id in result.info])
+    pool = [INFO_POOL[info_id] for info_id in local_ids]
+    finished = len(segment_offsets) > 0 and segment_offsets[-1] == len(inote) + 1
+    return pool, info, result, segment_offsets, finished
+
+
+
+def translate_inote_parallel(inote, jobs=None):
+
+    # translate_inote的并行版本, 按split_inote切分后用进程池解析再拼接
+    # 结果与translate_inote完全相同 (包括resolution和INFO_POOL的顺序); 不支持checkpoints
+    jobs = jobs or os.cpu_count() or 1
+    tasks = split_inote(inote, jobs * 4) if jobs > 1 and len(inote) >= PARALLEL_TRANSLATE_MIN_CHARS else None
+    if tasks is None:
+        return translate_inote(inote)
+
+    PARALLEL_STATE['inote'] = inote
+    if 'fork' in multiprocessing.get_all_start_methods():
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork'))
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=init_translate_worker, initargs=(inote,))
+    parts = []
+    try:
+        # 按顺序取结果: 之前的段出错时抛出该错误, 到达结尾后忽略之后的段 (与串行解析相同)
+        for part in executor.map(translate_chunk, tasks):
+            parts.append(part)
+            if part[4]:
+                break
+    finally:
+        executor.shutdown(cancel_futures=True)
+        PARALLEL_STATE['inote'] = None
+    return stitch_chunks(parts)
+
+
+
+def stitch_chunks(parts):
+
+    # 按顺序拼接translate_chunk的结果, 统一到所有段的最小公倍数精度
+    resolution = 1
+    for _, _, table, _, _ in parts:
+        resolution = math.lcm(resolution, table.resolution)
+    result = NoteTable(resolution)
+    segment_offsets = array('I')
+    for pool, info, table, offsets, _ in parts:
+        info_ids = [intern_info(name) for name in pool]
+        group_shift = len(result.group_start)
+        note_shift = len(result.info)
+        factor = resolution // table.resolution
+        result.info.extend(array('I', map(info_ids.__getitem__, info)))
+        result.bpm.extend(table.bpm)
+        if factor == 1:
+            result.length.extend(table.length)
+            result.hold.extend(table.hold)
+        else:
+            result.length.extend(array('q', [length * factor for length in table.length]))
+            result.hold.extend(array('q', [hold * factor for hold in table.hold]))
+        result.seconds.extend(table.seconds)
+        result.segment.extend(table.segment)
+        result.group.extend(shift_array(table.group, group_shift))
+        result.group_start.extend(shift_array(table.group_start, note_shift))
+        result.warnings.extend(table.warnings)
+        segment_offsets.extend(offsets)
+    return result, segment_offsets
+
+
+
+def common_prefix_length(a, b):
+
+    # 二分比较切片, 比逐字符循环快得多
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+
+def common_suffix_length(a, b, limit):
+
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+
+def retranslate_inote(old_inote, old_translated, old_checkpoints, inote):
+
+    # 增量解析: 从编辑位置之前最近的断点开始重新解析, 到编辑位置之后
+    # 与旧结果状态一致的断点为止, 其余部分直接沿用旧的NoteTable
+    # 返回 (NoteTable, segment_offsets, checkpoints, head, tail), 与完整解析的结果相等 (精度可能更高)
+    # head/tail: 开头/末尾与旧结果内容相同的group数
+    old_table, old_offsets = old_translated
+    if inote == old_inote:
+        return old_table, old_offsets, old_checkpoints, len(old_table), 0
+    prefix = common_prefix_length(old_inote, inote)
+    suffix = common_suffix_length(old_inote, inote, min(len(old_inote), len(inote)) - prefix)
+
+    # 断点所在segment之前的文本 (含逗号) 必须没有改动
+    edited_segment = bisect.bisect_right(old_offsets, prefix) - 1
+    checkpoint_id = bisect.bisect_right(old_checkpoints.segment, edited_segment) - 1
+    if checkpoint_id < 0:
+        checkpoints = Checkpoints()
+        return translate_inote(inote, checkpoints) + (checkpoints, 0, 0)
+
+    segment_index = old_checkpoints.segment[checkpoint_id]
+    notes = old_checkpoints.notes[checkpoint_id]
+    result = NoteTable(old_table.resolution)
+    result.info = old_table.info[:notes]
+    result.bpm = old_table.bpm[:notes]
+    result.length = old_table.length[:notes]
+    result.hold = old_table.hold[:notes]
+    result.seconds = old_table.seconds[:notes]
+    result.segment = old_table.segment[:notes]
+    result.group = old_table.group[:notes]
+    result.group_start = old_table.group_start[:old_checkpoints.groups[checkpoint_id]]
+    result.warnings = old_table.warnings[:old_checkpoints.warnings[checkpoint_id]]
+    if notes:
+        # 恢复断点时最后一个group的时长, 之后的修改由重新解析决定
+        factor = old_table.resolution // old_checkpoints.resolution[checkpoint_id]
+        for k in range(result.group_start[-1], notes):
+            result.length[k] = old_checkpoints.last_length[checkpoint_id] * factor
+            result.seconds[k] = old_checkpoints.last_seconds[checkpoint_id]
+    segment_offsets = old_offsets[:segment_index]
+    checkpoints = old_checkpoints.head(checkpoint_id)
+
+    # 编辑位置之后的旧断点, 以新文本中的位置为键
+    char_shift = len(inote) - len(old_inote)
+    suffix_start = len(old_inote) - suffix
+    reusable = {}
+    for k in range(bisect.bisect_left(old_checkpoints.segment, edited_segment), len(old_checkpoints)):
+        start = old_offsets[old_checkpoints.segment[k]]
+        if start >= suffix_start:
+            reusable[start + char_shift] = k
+    splice = {'start': suffix_start + char_shift, 'reusable': reusable, 'table': old_table, 'offsets': old_offsets,
+              'checkpoints': old_checkpoints, 'char_shift': char_shift, 'tail': 0}
+
+    tokens = tokenize_inote(inote, result.warnings, old_offsets[segment_index], segment_index)
+    translate_segments(inote, result, segment_offsets, tokens, old_checkpoints.bpm[checkpoint_id],
+                       old_checkpoints.length[checkpoint_id], checkpoints, splice)
+    # 编辑后断点处的segment可能变成空segment, 时长会合并到断点前的最后一个group
+    return result, segment_offsets, checkpoints, max(old_checkpoints.groups[checkpoint_id] - 1, 0), splice['tail']
+
+
+
+def splice_tail(result, segment_offsets, checkpoints, segment_index, current_bpm, current_length, warning_count, splice, checkpoint_id):
+
+    # 当前状态与旧断点一致时, 把旧结果中断点之后的部分接到result后面
+    old_table = splice['table']
+    old_offsets = splice['offsets']
+    old_checkpoints = splice['checkpoints']
+    char_shift = splice['char_shift']
+    if old_checkpoints.bpm[checkpoint_id] != current_bpm or old_checkpoints.length[checkpoint_id] != current_length:
+        return False
+    if old_checkpoints.last_group_changed(checkpoint_id, old_table):
+        return False  # 旧结果在断点之后修改了之前的group, 新结果需要继续解析得到同样的修改
+
+    old_segment = old_checkpoints.segment[checkpoint_id]
+    old_groups = old_checkpoints.groups[checkpoint_id]
+    old_notes = old_checkpoints.notes[checkpoint_id]
+    segment_shift = segment_index - old_segment
+    group_shift = len(result.group_start) - old_groups
+    note_shift = len(result.info) - old_notes
+    warning_shift = warning_count - old_checkpoints.warnings[checkpoint_id]
+    if checkpoints is not None:
+        # 拼接处的断点记录新结果的最后一个group, 之后的断点从旧结果平移
+        checkpoints.add(segment_index, result, current_bpm, current_length, warning_count)
+
+    resolution = math.lcm(result.resolution, old_table.resolution)
+    result.rescale(resolution)
+    factor = resolution // old_table.resolution
+    result.info.extend(old_table.info[old_notes:])
+    result.bpm.extend(old_table.bpm[old_notes:])
+    result.seconds.extend(old_table.seconds[old_notes:])
+    if factor == 1:
+        result.length.extend(old_table.length[old_notes:])
+        result.hold.extend(old_table.hold[old_notes:])
+    else:
+        result.length.extend(array('q', [length * factor for length in old_table.length[old_notes:]]))
+        result.hold.extend(array('q', [hold * factor for hold in old_table.hold[old_notes:]]))
+    result.segment.extend(shift_array(old_table.segment[old_notes:], segment_shift))
+    result.group.extend(shift_array(old_table.group[old_notes:], group_shift))
+    result.group_start.extend(shift_array(old_table.group_start[old_groups:], note_shift))
+    del result.warnings[warning_count:]  # 当前segment的warning已包含在旧结果中
+    result.warnings.extend(old_table.warnings[old_checkpoints.warnings[checkpoint_id]:])
+    segment_offsets.extend(shift_array(old_offsets[old_segment:], char_shift))
+    if checkpoints is not None:
+        checkpoints.extend_shifted(old_checkpoints, checkpoint_id + 1, segment_shift, group_shift, note_shift, warning_shift)
+    splice['tail'] = len(old_table) - old_groups
+    return True
+
+
+
+def add_placeholder_length(result, placeholder_length, current_bpm, segment_index, placeholder_seconds=0.0):
+
+    if len(result):
+        result.add_length_to_last_group(placeholder_length, placeholder_seconds)
+    else:
+        # If no notes yet, create a placeholder note
+        result.add_group([('@', 0)], current_bpm, placeholder_length, segment_index, placeholder_seconds)
+
+
+
+def get_context_from_original(inote_raw, segment_offsets, segment_index, context_chars=20):
 
     if segment_index < 0:  # 开头占位符
         return inote_raw[:context_chars*2] if len(inote_raw) > context_chars*2 else inote_raw
     
-    segments = inote_raw.split(',')
-    if segment_index >= len(segments):
+    if segment_index >= len(segment_offsets) - 1:
         return ""
     
     # 找到目标segment在原始字符串中的位置
-    current_pos = 0
-    for i in range(segment_index):
-        current_pos += len(segments[i]) + 1  # +1 for comma
-    
-    # 获取目标segment
-    target_segment = segments[segment_index]
-    segment_start = current_pos
-    segment_end = current_pos + len(target_segment)
+    segment_start = get_segment_position(segment_offsets, segment_index)
+    segment_end = get_segment_end(segment_offsets, segment_index)
     
     # 获取前后context_chars个字符
     context_start = max(0, segment_start - context_chars)
@@ -243,47 +1400,9 @@ def get_context_from_original(inote_raw, segment_index, context_chars=20):
 
 
 
-def parse_bpm_length(segment, current_bpm, current_length, i):
-    
-    # Parse BPM and length settings from this segment
-    while True:
-        bpm_updated = False
-        length_updated = False
-        
-        # Parse BPM (xxx)
-        if '(' in segment:
-            start = segment.find('(')
-            end = segment.find(')', start)
-            if end != -1:
-                current_bpm = round(float(segment[start+1:end]), 2)
-                segment = segment[:start] + segment[end+1:]
-                bpm_updated = True
-        
-        # Parse length {xxx}
-        if '{' in segment:
-            start = segment.find('{')
-            end = segment.find('}', start)
-            if end != -1:
-                current_length = int(segment[start+1:end])
-                segment = segment[:start] + segment[end+1:]
-                length_updated = True
-        
-        if not bpm_updated and not length_updated:
-            break
-    
-    # Remove BPM and length settings, leaving only note info
-    note_info = segment.strip()
-
-    if current_bpm is None or current_length is None:
-        print(f"parse_bpm_length error: BPM not set at note {i}")
-        sys.exit(1)
-
-    return note_info, current_bpm, current_length
-
-
-
-def parse_note_segment(segment, current_bpm, current_length):
+def parse_note_segment(segment, warnings=None):
 
+    # 返回 [(info, hold_parts)], 按info排序
     if not segment: return None
 
     if "`" in segment:
@@ -294,256 +1413,941 @@ def parse_note_segment(segment, current_bpm, current_length):
     else:
         # Further check if '/' omitted for tap notes
         # e.g. "123" means 1/2/3
-        try:
-            if int(segment) >= 10:
-                # Split multi-digit number into individual digits
-                simultaneous_notes = list(segment)
-            else:
-                # Single note
-                return parse_single_note(segment, current_bpm, current_length)
-        except ValueError:
+        if segment.isdecimal():
+            is_multi_tap = int(segment) >= 10
+        elif segment[0] in '+-' or '_' in segment:
+            # int() 也接受符号和下划线
+            try:
+                is_multi_tap = int(segment) >= 10
+            except ValueError:
+                is_multi_tap = False
+        else:
+            is_multi_tap = False
+        if not is_multi_tap:
             # Single note
-            return parse_single_note(segment, current_bpm, current_length)
+            note = parse_single_note(segment, warnings)
+            return [note] if note else None
+        # Split multi-digit number into individual digits
+        simultaneous_notes = list(segment)
     
     notes = []
     for note_str in simultaneous_notes:
-        note = parse_single_note(note_str.strip(), current_bpm, current_length)
+        note = parse_single_note(note_str, warnings)
         if note:
             notes.append(note)
-    if notes: notes.sort(key=lambda x: x['info'])
+    if notes: notes.sort(key=lambda x: x[0])
 
     return notes if notes else None
 
 
 
-def parse_single_note(note_str, current_bpm, current_length):
+def parse_single_note(note_str, warnings=None):
 
+    # 返回 (info, hold_parts), hold_parts为[x:y]时值的 [(分母x, 分子y)], 没有时为0
     note_str = note_str.strip()
     if not note_str: return None
-    info = note_str
+    if '[' not in note_str:
+        return note_str, 0
     
     # Check for [x:x] hold
-    hold = fractions.Fraction(0)
-    while '[' in info:
-        start_bracket = info.find('[')
-        end_bracket = info.find(']', start_bracket)
-        if end_bracket != -1:
-            length_part = info[start_bracket+1:end_bracket]
-
-            if ':' in length_part:
-                parts = length_part.split(':')
-                if len(parts) == 2:
-                    try:
-                        denominator = int(parts[0])
-                        numerator = int(parts[1])
-                        hold += fractions.Fraction(numerator, denominator)
-                    except ValueError:
-                        print(f"parse_single_note error: Invalid [content] in '{note_str}'")
-            
-            # Remove the length part from info
-            info = info[:start_bracket] + info[end_bracket+1:]
+    hold_parts = []
+    pieces = []
+    piece_start = 0
+    for match in HOLD_RE.finditer(note_str):
+        parts = match.group(1).split(':')
+        if len(parts) == 2:
+            try:
+                denominator = int(parts[0])
+                numerator = int(parts[1])
+                if denominator <= 0: raise ValueError
+                hold_parts.append((denominator, numerator))
+            except ValueError:
+                if warnings is not None:
+                    warnings.append(f"parse_single_note error: Invalid [content] in '{note_str}'")
+
+        # Remove the length part from info
+        pieces.append(note_str[piece_start:match.start()])
+        piece_start = match.end()
+    pieces.append(note_str[piece_start:])
     
-    # Use length override if present
-    if hold != fractions.Fraction(0):
-        return {
-            'info': info.strip(),
-            'bpm': current_bpm,
-            'length': fractions.Fraction(1, current_length),
-            'hold': hold
-        }
-    # Otherwise use current length
-    else:
-        return {
-            'info': info.strip(),
-            'bpm': current_bpm,
-            'length': fractions.Fraction(1, current_length)
-        }
+    return ''.join(pieces).strip(), hold_parts or 0
     
 
 
-def compare_inotes(inote1_trans, inote2_trans, inote1_raw, inote2_raw, start_line1, start_line2, txt1, txt2, line_mapping1, line_mapping2):
+COUNTERS = {'fractions': 0}  # 进程内累计的计数, Profiler取差值
 
-    def note_str(note):
-        if note.get('hold'):
-            note_str = f"'{note['info']}[{note['hold']}]': bpm-{note['bpm']}, delay-{note['length']}"
-        else:
-            note_str = f"'{note['info']}': bpm-{note['bpm']}, delay-{note['length']}"
-        return note_str
-    
-    if inote1_trans == inote2_trans:
-        print("No difference found.")
-        return
-    
-    # 收集所有错误
-    errors = []
-    
-    max_len = max(len(inote1_trans), len(inote2_trans))
-    for i in range(max_len):
-        note1 = inote1_trans[i] if i < len(inote1_trans) else None
-        note2 = inote2_trans[i] if i < len(inote2_trans) else None
-        
-        if note1 != note2:
-
-            if note1:
-                if isinstance(note1, dict):
-                    note1_str = note_str(note1)
-                    segment_idx1 = note1.get('segment_index', -1)
-                elif isinstance(note1, list):
-                    note1_str = ', '.join(note_str(n) for n in note1)
-                    segment_idx1 = note1[0].get('segment_index', -1) if note1 else -1
-            else:
-                note1_str = "None"
-                segment_idx1 = -1
-            
-            if note2:
-                if isinstance(note2, dict):
-                    note2_str = note_str(note2)
-                    segment_idx2 = note2.get('segment_index', -1)
-                elif isinstance(note2, list):
-                    note2_str = ', '.join(note_str(n) for n in note2)
-                    segment_idx2 = note2[0].get('segment_index', -1) if note2 else -1
-            else:
-                note2_str = "None"
-                segment_idx2 = -1
-
-            # further handle diff
-            note1_str_norm = note1_str.replace("c1", "C").replace("c2", "C").replace("C1", "C")
-            note2_str_norm = note2_str.replace("c1", "C").replace("c2", "C").replace("C1", "C")
-            note1_str_norm = note1_str_norm.replace("xh", "hx").replace("xb", "bx").replace("hb", "bh")
-            note2_str_norm = note2_str_norm.replace("xh", "hx").replace("xb", "bx").replace("hb", "bh")
-            note1_str_norm = note1_str_norm.replace(">", "^").replace("<", "^")
-            note2_str_norm = note2_str_norm.replace(">", "^").replace("<", "^")
-            note1_str_norm = note1_str_norm.replace("$", "")
-            note2_str_norm = note2_str_norm.replace("$", "")
-            
-            if note1_str_norm == note2_str_norm:
-                continue
 
-            # 计算错误在原始字符串中的位置
-            pos1 = get_segment_position(inote1_raw, segment_idx1)
-            pos2 = get_segment_position(inote2_raw, segment_idx2)
-            
-            errors.append({
-                'diff_index': i,
-                'note1_str': note1_str,
-                'note2_str': note2_str,
-                'segment_idx1': segment_idx1,
-                'segment_idx2': segment_idx2,
-                'pos1': pos1,
-                'pos2': pos2
-            })
 
-            # if i > 200: break
+def tick_fraction(ticks, resolution):
 
-    if not errors:
-        print("No difference found.")
-        return
+    COUNTERS['fractions'] += 1
+    return fractions.Fraction(ticks, resolution)
 
-    # 分组处理错误 - 基于位置相近性
-    grouped_errors = group_nearby_errors(errors)
-    
-    # 打印分组的错误
-    for group_idx, error_group in enumerate(grouped_errors):
-        print_error_group(error_group, group_idx, inote1_raw, inote2_raw, start_line1, start_line2, txt1, txt2, line_mapping1, line_mapping2)
 
-    print(f"Reach end of inote.")
 
-    # # Ask user to continue
-    # while True:
-    #     user_input = input("Stop comparing? (y/n): ").strip().lower()
-    #     if user_input == 'y':
-    #         print(f"Comparison stopped.")
-    #         return
-    #     else:
-    #         # Move cursor up one line and clear it to overwrite the prompt
-    #         print("\033[A\033[K", end="")
-    #         break
+def note_str(table, k):
 
+    # 整数tick只在显示时转换为Fraction
+    info = INFO_POOL[table.info[k]]
+    length = tick_fraction(table.length[k], table.resolution)
+    if table.hold[k]:
+        return f"'{info}[{tick_fraction(table.hold[k], table.resolution)}]': bpm-{table.bpm[k]}, delay-{length}"
+    return f"'{info}': bpm-{table.bpm[k]}, delay-{length}"
 
 
-def get_segment_position(inote_raw, segment_index):
 
-    if segment_index < 0:
-        return 0
-    
-    segments = inote_raw.split(',')
-    if segment_index >= len(segments):
-        return len(inote_raw)
-    
-    current_pos = 0
-    for i in range(segment_index):
-        current_pos += len(segments[i]) + 1  # +1 for comma
-    
-    return current_pos
+def entry_str(table, group_id):
 
+    if group_id is None:
+        return None
+    start, end = table.group_range(group_id)
+    return ', '.join(note_str(table, k) for k in range(start, end))
 
 
-def group_nearby_errors(errors, max_distance=6):
 
-    if not errors:
+def get_alignment_keys(inote_trans, key_ids, start=0, end=None):
+
+    # 每个group映射为int, 对齐时只比较int
+    # note的键为 (info的规范键, BPM的二进制, hold和时长的既约分数)
+    # 与resolution无关, 不需要格式化字符串或创建Fraction
+    end = len(inote_trans) if end is None else end
+    if start >= end:
         return []
-    
-    # 按位置排序
-    errors.sort(key=lambda x: min(x['pos1'], x['pos2']))
-    
-    groups = []
-    current_group = [errors[0]]
-    
-    for i in range(1, len(errors)):
-        curr_error = errors[i]
-        last_error = current_group[-1]
-        
-        # 检查是否相近（基于两个文件中的最小距离）
-        dist1 = abs(curr_error['pos1'] - last_error['pos1'])
-        dist2 = abs(curr_error['pos2'] - last_error['pos2'])
-        min_distance = min(dist1, dist2)
-        
-        if min_distance <= max_distance:
-            current_group.append(curr_error)
+    info_keys = INFO_KEYS
+    resolution = inote_trans.resolution
+    group_start = inote_trans.group_start
+    first = group_start[start]
+    last = group_start[end] if end < len(group_start) else len(inote_trans.info)
+    info = inote_trans.info[first:last]
+    bpm_bits = array('q', inote_trans.bpm[first:last].tobytes())
+    lengths = inote_trans.length[first:last]
+    holds = inote_trans.hold[first:last]
+    gcd = math.gcd
+
+    def note_key(k):
+        length = lengths[k]
+        hold = holds[k]
+        length_gcd = gcd(length, resolution)
+        hold_gcd = gcd(hold, resolution)
+        return (info_keys[info[k]], bpm_bits[k], hold // hold_gcd, resolution // hold_gcd, length // length_gcd, resolution // length_gcd)
+
+    keys = []
+    for group_id in range(start, end):
+        note_start = group_start[group_id] - first
+        note_end = (group_start[group_id + 1] if group_id + 1 < len(group_start) else len(inote_trans.info)) - first
+        if note_end - note_start == 1:
+            key = note_key(note_start)
         else:
-            groups.append(current_group)
-            current_group = [curr_error]
-    
-    groups.append(current_group)
-    return groups
+            key = tuple(note_key(k) for k in range(note_start, note_end))
+        keys.append(key_ids.setdefault(key, len(key_ids)))
+    return keys
+
+
+
+def factorize_rows(columns):
+
+    # 多列int64按行编号, 相同的行得到相同的编号 (0开始连续)
+    # 一次lexsort后比较相邻行, 比np.unique(axis=0)快得多
+    count = len(columns[0])
+    if count == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort(columns)
+    change = np.zeros(count, dtype=bool)
+    change[0] = True
+    for column in columns:
+        values = column[order]
+        change[1:] |= values[1:] != values[:-1]
+    ids = np.empty(count, dtype=np.int64)
+    ids[order] = np.cumsum(change) - 1
+    return ids
+
+
+
+def get_alignment_keys_numpy(inote1_trans, inote2_trans):
+
+    # 同get_alignment_keys, 但两个谱面一起向量化编码, 返回两个int64数组
+    # 先给每个note的键编号, 同时押的group再把各note的编号 (补-1对齐) 作为一行编号
+    info_keys = np.array(INFO_KEYS, dtype=np.int64)
+    tables = (inote1_trans, inote2_trans)
+    columns = [[] for _ in range(6)]
+    for table in tables:
+        resolution = table.resolution
+        lengths = np.asarray(table.length, dtype=np.int64)
+        holds = np.asarray(table.hold, dtype=np.int64)
+        length_gcd = np.gcd(lengths, resolution)
+        hold_gcd = np.gcd(holds, resolution)
+        table_columns = (info_keys[np.asarray(table.info, dtype=np.int64)],
+                         np.asarray(table.bpm, dtype=np.float64).view(np.int64),
+                         holds // hold_gcd, resolution // hold_gcd,
+                         lengths // length_gcd, resolution // length_gcd)
+        for column, values in zip(columns, table_columns):
+            column.append(values)
+    note_keys = factorize_rows([np.concatenate(column) for column in columns])
+    note_key_count = int(note_keys.max()) + 1 if len(note_keys) else 0
+
+    keys = []
+    masks = []
+    multi_starts = []
+    multi_sizes = []
+    offset = 0
+    for table in tables:
+        count = len(table.info)
+        starts = np.asarray(table.group_start, dtype=np.int64) + offset
+        sizes = np.diff(np.append(starts, offset + count))
+        multi = sizes > 1
+        keys.append(note_keys[starts])
+        masks.append(multi)
+        multi_starts.append(starts[multi])
+        multi_sizes.append(sizes[multi])
+        offset += count
+
+    multi_starts = np.concatenate(multi_starts)
+    multi_sizes = np.concatenate(multi_sizes)
+    if len(multi_starts):
+        rows = []
+        for column in range(int(multi_sizes.max())):
+            values = np.full(len(multi_starts), -1, dtype=np.int64)
+            present = multi_sizes > column
+            values[present] = note_keys[multi_starts[present] + column]
+            rows.append(values)
+        multi_keys = note_key_count + factorize_rows(rows)
+        split = int(np.count_nonzero(masks[0]))
+        keys[0][masks[0]] = multi_keys[:split]
+        keys[1][masks[1]] = multi_keys[split:]
+    return keys
+
+
+
+def diff_key_arrays(keys1, keys2, group_digests=None):
+
+    # numpy版本的diff_chunked: 向量化去掉公共前后缀, 只有中间不同的部分交给diff_chunked
+    # 结果与diff_chunked(keys1, keys2, group_digests) 完全相同
+    length1 = len(keys1)
+    length2 = len(keys2)
+    limit = min(length1, length2)
+    mismatch = np.flatnonzero(keys1[:limit] != keys2[:limit])
+    prefix = int(mismatch[0]) if len(mismatch) else limit
+    limit -= prefix
+    mismatch = np.flatnonzero(keys1[length1 - limit:][::-1] != keys2[length2 - limit:][::-1])
+    suffix = int(mismatch[0]) if len(mismatch) else limit
+
+    opcodes = []
+    if prefix:
+        opcodes.append(('equal', 0, prefix, 0, prefix))
+    middle1 = keys1[prefix:length1 - suffix].tolist()
+    middle2 = keys2[prefix:length2 - suffix].tolist()
+    middle_digests = None
+    if group_digests is not None:
+        def middle_digests(start1, end1, start2, end2):
+            return group_digests(start1 + prefix, end1 + prefix, start2 + prefix, end2 + prefix)
+    for tag, i1, i2, j1, j2 in diff_chunked(middle1, middle2, middle_digests):
+        opcodes.append((tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix))
+    if suffix:
+        opcodes.append(('equal', length1 - suffix, length1, length2 - suffix, length2))
+    return opcodes
+
+
+
+def find_middle_snake(a, a_lo, a_hi, b, b_lo, b_hi):
+
+    # Myers O(ND) 正反双向搜索, 只保存两条V数组 (线性内存)
+    # 返回 (x0, y0, x1, y1): 位于最短编辑路径中间的一段相同区间 (相对坐标)
+    # 差异过多时在max_cost步后放弃最优解, 直接从中间分割 (保证O(n log n))
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    delta = n - m
+    odd = delta & 1
+    max_d = (n + m + 1) // 2
+    max_cost = 64
+    offset = min(max_d, max_cost) + 2
+    v_forward = [0] * (2 * offset + 1)
+    v_backward = [0] * (2 * offset + 1)
+
+    for d in range(max_d + 1):
+        if d > max_cost:
+            return n // 2, m // 2, n // 2, m // 2
+
+        # 正向搜索
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v_forward[offset + k - 1] < v_forward[offset + k + 1]):
+                x = v_forward[offset + k + 1]
+            else:
+                x = v_forward[offset + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            v_forward[offset + k] = x
+            if odd and -(d - 1) <= delta - k <= d - 1:
+                if x + v_backward[offset + delta - k] >= n:
+                    return x0, y0, x, y
+
+        # 反向搜索 (在反转后的序列上进行)
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v_backward[offset + k - 1] < v_backward[offset + k + 1]):
+                x = v_backward[offset + k + 1]
+            else:
+                x = v_backward[offset + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[a_hi - 1 - x] == b[b_hi - 1 - y]:
+                x += 1
+                y += 1
+            v_backward[offset + k] = x
+            if not odd and -d <= delta - k <= d:
+                if x + v_forward[offset + delta - k] >= n:
+                    return n - x, m - y, n - x0, m - y0
+
+    raise AssertionError("find_middle_snake: no overlap found")
+
+
+
+def diff_sequences(a, b):
+
+    # 返回与difflib相同格式的opcodes: (tag, i1, i2, j1, j2)
+    matches = []  # (i, j, size)
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        a_lo, a_hi, b_lo, b_hi = stack.pop()
+
+        # 去掉公共前缀和后缀
+        prefix = 0
+        while a_lo + prefix < a_hi and b_lo + prefix < b_hi and a[a_lo + prefix] == b[b_lo + prefix]:
+            prefix += 1
+        if prefix:
+            matches.append((a_lo, b_lo, prefix))
+            a_lo += prefix
+            b_lo += prefix
+        suffix = 0
+        while a_lo < a_hi - suffix and b_lo < b_hi - suffix and a[a_hi - 1 - suffix] == b[b_hi - 1 - suffix]:
+            suffix += 1
+        if suffix:
+            matches.append((a_hi - suffix, b_hi - suffix, suffix))
+            a_hi -= suffix
+            b_hi -= suffix
+
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        # 没有任何相同的note时直接整段替换 (例如BPM写错)
+        if set(a[a_lo:a_hi]).isdisjoint(b[b_lo:b_hi]):
+            continue
 
+        x0, y0, x1, y1 = find_middle_snake(a, a_lo, a_hi, b, b_lo, b_hi)
+        if x1 > x0:
+            matches.append((a_lo + x0, b_lo + y0, x1 - x0))
+        stack.append((a_lo + x1, a_hi, b_lo + y1, b_hi))
+        stack.append((a_lo, a_lo + x0, b_lo, b_lo + y0))
+
+    matches.sort()
+    opcodes = []
+    i = j = 0
+    for match_i, match_j, size in matches + [(len(a), len(b), 0)]:
+        if i < match_i and j < match_j:
+            opcodes.append(('replace', i, match_i, j, match_j))
+        elif i < match_i:
+            opcodes.append(('delete', i, match_i, j, j))
+        elif j < match_j:
+            opcodes.append(('insert', i, i, j, match_j))
+        if size:
+            # 合并相邻的equal区间
+            if opcodes and opcodes[-1][0] == 'equal' and opcodes[-1][2] == match_i:
+                _, eq_i, _, eq_j, _ = opcodes.pop()
+                opcodes.append(('equal', eq_i, match_i + size, eq_j, match_j + size))
+            else:
+                opcodes.append(('equal', match_i, match_i + size, match_j, match_j + size))
+        i = match_i + size
+        j = match_j + size
+    return opcodes
+
+
+
+CHUNK_MASK = 63          # 内容定义分块: 平均约64个group一块
+CHUNK_MIN = 16
+CHUNK_MAX = 1024
+CHUNKED_DIFF_MIN = 2048  # 中间不同部分短于此时直接用diff_sequences
+NOTE_DIGEST_STRUCT = struct.Struct('<IdQQQQ')  # 规范键摘要, BPM, hold和时长的既约分数
+
+
+
+def group_digest(inote_trans, group_id):
+
+    # 一个group的内容摘要 (crc32): 各note的规范键, BPM, hold和时长的既约分数 (同get_alignment_keys的键)
+    resolution = inote_trans.resolution
+    gcd = math.gcd
+    pack = NOTE_DIGEST_STRUCT.pack
+    mask = 0xFFFFFFFFFFFFFFFF
+    digest = 0
+    start, end = inote_trans.group_range(group_id)
+    for k in range(start, end):
+        hold = inote_trans.hold[k]
+        length = inote_trans.length[k]
+        hold_gcd = gcd(hold, resolution)
+        length_gcd = gcd(length, resolution)
+        digest = zlib.crc32(pack(NOTE_KEY_DIGESTS[INFO_KEYS[inote_trans.info[k]]], inote_trans.bpm[k],
+                                 (hold // hold_gcd) & mask, (resolution // hold_gcd) & mask,
+                                 (length // length_gcd) & mask, (resolution // length_gcd) & mask), digest)
+    return digest
+
+
+
+def get_group_digests(inote_trans, keys, start, end, memo):
+
+    # groups [start, end) 的内容摘要, 与keys的编号方式无关
+    # (numpy按排序编号, 纯Python按出现顺序编号, --watch共享key_ids), 分块边界由此决定
+    # memo: 对齐键id -> 摘要, 同样的键只计算一次, 两个谱面共用
+    digests = []
+    for group_id in range(start, end):
+        key = keys[group_id]
+        digest = memo.get(key)
+        if digest is None:
+            digest = memo[key] = group_digest(inote_trans, group_id)
+        digests.append(digest)
+    return digests
+
+
+
+def chunk_fingerprints(keys, digests=None):
+
+    # 按内容分块 (gear hash, 只取决于前32个key), 插入/删除只影响附近的分块边界
+    # digests: 与keys并列的内容摘要 (get_group_digests), 分块边界和指纹只取决于内容
+    # 为None时直接使用keys (此时结果取决于keys的编号)
+    # 返回 [(start, end, fingerprint)]
+    if digests is None:
+        digests = keys
+    chunks = []
+    start = 0
+    rolling = 0
+    for k, digest in enumerate(digests):
+        rolling = ((rolling << 1) + digest * 0x9E3779B1) & 0xFFFFFFFF
+        size = k + 1 - start
+        if (size >= CHUNK_MIN and not rolling & CHUNK_MASK) or size >= CHUNK_MAX:
+            chunks.append((start, k + 1, hash(tuple(digests[start:k + 1]))))
+            start = k + 1
+    if start < len(keys):
+        chunks.append((start, len(keys), hash(tuple(digests[start:]))))
+    return chunks
+
+
+
+def match_chunks(a, b, digests1=None, digests2=None):
+
+    # 两边各只出现一次的指纹作为锚点, 取保持顺序的最长子序列 (patience)
+    # 返回 [(i, j, size)], i和j都递增
+    chunks1 = chunk_fingerprints(a, digests1)
+    chunks2 = chunk_fingerprints(b, digests2)
+    counts = {}
+    for chunks, side in ((chunks1, 0), (chunks2, 1)):
+        for start, end, fingerprint in chunks:
+            count = counts.setdefault(fingerprint, [0, 0, None])
+            count[side] += 1
+            if side:
+                count[2] = (start, end)
+    candidates = []
+    for start, end, fingerprint in chunks1:
+        count1, count2, span = counts[fingerprint]
+        if count1 == 1 and count2 == 1 and end - start == span[1] - span[0] and a[start:end] == b[span[0]:span[1]]:
+            candidates.append((start, span[0], end - start))
+
+    # 按j的最长递增子序列
+    tails = []    # tails[n]: 长度n+1的子序列末尾candidate下标
+    previous = [-1] * len(candidates)
+    tail_js = []
+    for index, (_, j, _) in enumerate(candidates):
+        n = bisect.bisect_left(tail_js, j)
+        if n:
+            previous[index] = tails[n - 1]
+        if n == len(tails):
+            tails.append(index)
+            tail_js.append(j)
+        else:
+            tails[n] = index
+            tail_js[n] = j
+    matches = []
+    index = tails[-1] if tails else -1
+    while index >= 0:
+        matches.append(candidates[index])
+        index = previous[index]
+    matches.reverse()
+    return matches
 
 
-def print_error_group(error_group, group_idx, inote1_raw, inote2_raw, start_line1, start_line2, txt1, txt2, line_mapping1, line_mapping2):
 
-    # 计算合适的上下文范围
-    all_positions1 = [err['pos1'] for err in error_group]
-    all_positions2 = [err['pos2'] for err in error_group]
-    
-    context_chars = 20
+def diff_chunked(a, b, group_digests=None):
+
+    # diff_sequences的前置步骤: 去掉公共前后缀, 中间部分较长时先用分块指纹配对相同的区域,
+    # 只有锚点之间不同的窗口交给Myers, 耗时取决于修改的多少而不是谱面长度
+    # 中间部分短于CHUNKED_DIFF_MIN时结果与diff_sequences(a, b) 完全相同
+    # group_digests(start1, end1, start2, end2): 返回 a[start1:end1], b[start2:end2] 的内容摘要,
+    # 只在需要分块时调用; 提供时结果与key的编号方式无关
+    prefix = common_prefix_length(a, b)
+    suffix = common_suffix_length(a, b, min(len(a), len(b)) - prefix)
+    middle1 = a[prefix:len(a) - suffix]
+    middle2 = b[prefix:len(b) - suffix]
+    if min(len(middle1), len(middle2)) < CHUNKED_DIFF_MIN:
+        return diff_sequences(a, b)
+
+    opcodes = []
+
+    def add(tag, i1, i2, j1, j2):
+        if tag == 'equal' and opcodes and opcodes[-1][0] == 'equal' and opcodes[-1][2] == i1:
+            _, eq_i, _, eq_j, _ = opcodes.pop()
+            i1, j1 = eq_i, eq_j
+        opcodes.append((tag, i1, i2, j1, j2))
+
+    if prefix:
+        add('equal', 0, prefix, 0, prefix)
+    digests1 = digests2 = None
+    if group_digests is not None:
+        digests1, digests2 = group_digests(prefix, len(a) - suffix, prefix, len(b) - suffix)
+    i = j = 0
+    for match_i, match_j, size in match_chunks(middle1, middle2, digests1, digests2) + [(len(middle1), len(middle2), 0)]:
+        for tag, i1, i2, j1, j2 in diff_sequences(middle1[i:match_i], middle2[j:match_j]):
+            add(tag, i1 + i + prefix, i2 + i + prefix, j1 + j + prefix, j2 + j + prefix)
+        if size:
+            add('equal', match_i + prefix, match_i + size + prefix, match_j + prefix, match_j + size + prefix)
+        i = match_i + size
+        j = match_j + size
+    if suffix:
+        add('equal', len(a) - suffix, len(a), len(b) - suffix, len(b))
+    return opcodes
+
+
+
+def compare_inotes(inote1_trans, inote2_trans, segment_offsets1, segment_offsets2, keys=None):
+
+    return list(iter_compare_inotes(inote1_trans, inote2_trans, segment_offsets1, segment_offsets2, keys))
+
+
+
+def iter_compare_inotes(inote1_trans, inote2_trans, segment_offsets1, segment_offsets2, keys=None):
+
+    # 按位置顺序逐个产出错误 (pos1/pos2都不减), 见iter_nearby_errors
+    if inote1_trans == inote2_trans:
+        return
     
-    # 为文件生成上下文
-    context1, markers1 = get_context_with_markers(inote1_raw, error_group, 'pos1', 'segment_idx1', context_chars)
-    context2, markers2 = get_context_with_markers(inote2_raw, error_group, 'pos2', 'segment_idx2', context_chars)
+    # 对齐两个谱面, 插入/删除的note不会让之后的note全部错位
+    # keys: 预先计算好的 (keys1, keys2), 需使用同一个key_ids (见WatchedChart)
+    # 分块边界使用内容摘要, 三种方式得到的对齐结果相同
+    digest_memo = {}
+
+    def group_digests(start1, end1, start2, end2):
+        return (get_group_digests(inote1_trans, keys1, start1, end1, digest_memo),
+                get_group_digests(inote2_trans, keys2, start2, end2, digest_memo))
+
+    if keys is not None:
+        keys1, keys2 = keys
+        opcodes = diff_chunked(keys1, keys2, group_digests)
+    elif np is not None:
+        key_arrays = get_alignment_keys_numpy(inote1_trans, inote2_trans)
+        keys1, keys2 = key_arrays[0].tolist(), key_arrays[1].tolist()  # 之后逐个比较, list比numpy标量快
+        opcodes = diff_key_arrays(*key_arrays, group_digests)
+    else:
+        key_ids = {}
+        keys1 = get_alignment_keys(inote1_trans, key_ids)
+        keys2 = get_alignment_keys(inote2_trans, key_ids)
+        opcodes = diff_chunked(keys1, keys2, group_digests)
+
+    def anchor_segment(inote_trans, group_id):
+        # 缺失一侧使用下一个note的位置
+        if group_id < len(inote_trans):
+            return inote_trans.group_segment(group_id)
+        return sys.maxsize  # 谱面末尾
+
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            continue
+
+        for k in range(max(i2 - i1, j2 - j1)):
+            i = i1 + k
+            j = j1 + k
+            note1 = i if i < i2 else None
+            note2 = j if j < j2 else None
+            if note1 is not None and note2 is not None and keys1[i] == keys2[j]:
+                continue
+
+            segment_idx1 = inote1_trans.group_segment(note1) if note1 is not None else -1
+            segment_idx2 = inote2_trans.group_segment(note2) if note2 is not None else -1
+
+            # 计算错误在原始字符串中的位置
+            pos1 = get_segment_position(segment_offsets1, segment_idx1 if note1 is not None else anchor_segment(inote1_trans, i2))
+            pos2 = get_segment_position(segment_offsets2, segment_idx2 if note2 is not None else anchor_segment(inote2_trans, j2))
+            
+            yield {
+                'diff_index': min(i, i2),
+                'note1_str': entry_str(inote1_trans, note1),
+                'note2_str': entry_str(inote2_trans, note2),
+                'segment_idx1': segment_idx1,
+                'segment_idx2': segment_idx2,
+                'pos1': pos1,
+                'pos2': pos2,
+                'group1': note1,
+                'group2': note2
+            }
+
+
+
+def tick_entry_str(table, group_id, onset, resolution):
+
+    # 整数tick只在显示时转换为Fraction (小节内位置)
+    if group_id is None:
+        return None
+    scale = resolution // table.resolution
+    at = tick_fraction(onset, resolution)
+    start, end = table.group_range(group_id)
+    notes = []
+    for k in range(start, end):
+        info = INFO_POOL[table.info[k]]
+        if table.hold[k]:
+            notes.append(f"'{info}[{tick_fraction(table.hold[k] * scale, resolution)}]': bpm-{table.bpm[k]}, at-{at}")
+        else:
+            notes.append(f"'{info}': bpm-{table.bpm[k]}, at-{at}")
+    return ', '.join(notes)
+
+
+
+def tick_entry_key(table, group_id, scale):
+
+    # 按时间对齐时的比较键, 不含时刻本身
+    # scale: 到两个谱面共同resolution的倍数, hold直接按整数tick比较, 不创建Fraction
+    start, end = table.group_range(group_id)
+    key = []
+    for k in range(start, end):
+        key.append((INFO_KEYS[table.info[k]], table.hold[k] * scale, table.bpm[k]))
+    return key
+
+
+
+def compare_inotes_by_time(inote1_trans, inote2_trans, segment_offsets1, segment_offsets2):
+
+    return list(iter_compare_inotes_by_time(inote1_trans, inote2_trans, segment_offsets1, segment_offsets2))
+
+
+
+def iter_compare_inotes_by_time(inote1_trans, inote2_trans, segment_offsets1, segment_offsets2):
+
+    # 统一两个谱面的tick精度
+    resolution = math.lcm(inote1_trans.resolution, inote2_trans.resolution)
+    scale1 = resolution // inote1_trans.resolution
+    scale2 = resolution // inote2_trans.resolution
+    onsets1 = inote1_trans.onsets()
+    onsets2 = inote2_trans.onsets()
+
+    def anchor_segment(inote_trans, group_id):
+        if group_id < len(inote_trans):
+            return inote_trans.group_segment(group_id)
+        return sys.maxsize  # 谱面末尾
+
+    # 按起始时刻归并两个谱面, 每个时刻最多一组note
+    i = j = 0
+    while i < len(inote1_trans) or j < len(inote2_trans):
+        tick1 = onsets1[i] * scale1 if i < len(inote1_trans) else None
+        tick2 = onsets2[j] * scale2 if j < len(inote2_trans) else None
+        note1 = i if tick1 is not None and (tick2 is None or tick1 <= tick2) else None
+        note2 = j if tick2 is not None and (tick1 is None or tick2 <= tick1) else None
+
+        if note1 is None or note2 is None or tick_entry_key(inote1_trans, note1, scale1) != tick_entry_key(inote2_trans, note2, scale2):
+            segment_idx1 = inote1_trans.group_segment(note1) if note1 is not None else -1
+            segment_idx2 = inote2_trans.group_segment(note2) if note2 is not None else -1
+            pos1 = get_segment_position(segment_offsets1, segment_idx1 if note1 is not None else anchor_segment(inote1_trans, i))
+            pos2 = get_segment_position(segment_offsets2, segment_idx2 if note2 is not None else anchor_segment(inote2_trans, j))
+            yield {
+                'diff_index': i,
+                'note1_str': tick_entry_str(inote1_trans, note1, tick1, resolution),
+                'note2_str': tick_entry_str(inote2_trans, note2, tick2, resolution),
+                'segment_idx1': segment_idx1,
+                'segment_idx2': segment_idx2,
+                'pos1': pos1,
+                'pos2': pos2,
+                'group1': note1,
+                'group2': note2
+            }
+
+        if note1 is not None: i += 1
+        if note2 is not None: j += 1
+
+
+
+def hold_seconds(table, k):
+
+    bpm = table.bpm[k]
+    return table.hold[k] * 240.0 / (bpm * table.resolution) if bpm > 0 else 0.0
+
+
+
+def time_entry_str(table, group_id, seconds):
+
+    if group_id is None:
+        return None
+    start, end = table.group_range(group_id)
+    notes = []
+    for k in range(start, end):
+        info = INFO_POOL[table.info[k]]
+        if table.hold[k]:
+            notes.append(f"'{info}[{tick_fraction(table.hold[k], table.resolution)}]': bpm-{table.bpm[k]}, at-{seconds:.3f}s")
+        else:
+            notes.append(f"'{info}': bpm-{table.bpm[k]}, at-{seconds:.3f}s")
+    return ', '.join(notes)
+
+
+
+def time_entries_match(table1, group1, table2, group2, tolerance):
+
+    # 同一时刻的两组note: 规范键相同, hold的实际时长相差不超过tolerance (秒); 不比较BPM
+    start1, end1 = table1.group_range(group1)
+    start2, end2 = table2.group_range(group2)
+    if end1 - start1 != end2 - start2:
+        return False
+    for k1, k2 in zip(range(start1, end1), range(start2, end2)):
+        if INFO_KEYS[table1.info[k1]] != INFO_KEYS[table2.info[k2]]:
+            return False
+        if abs(hold_seconds(table1, k1) - hold_seconds(table2, k2)) > tolerance:
+            return False
+    return True
+
+
+
+def compare_inotes_by_seconds(inote1_trans, inote2_trans, segment_offsets1, segment_offsets2, tolerance_ms=None, window=None):
+
+    return list(iter_compare_inotes_by_seconds(inote1_trans, inote2_trans, segment_offsets1, segment_offsets2, tolerance_ms, window))
+
+
+
+def iter_compare_inotes_by_seconds(inote1_trans, inote2_trans, segment_offsets1, segment_offsets2, tolerance_ms=None, window=None):
+
+    # 按实际时刻 (秒) 归并两个谱面, 时刻相差不超过tolerance_ms时视为同一位置
+    # BPM/分音写法不同但实际时刻相同的note视为相同, 用于比较转换过的谱面
+    # window: (start, end) 秒, 只比较起始时刻在其中的group, 通过TempoMap二分定位
+    if tolerance_ms is None:
+        tolerance_ms = NORMALIZATION_RULES['time_tolerance_ms']
+    tolerance = tolerance_ms / 1000 + 1e-9  # 浮点累加误差
+    map1 = inote1_trans.tempo_map()
+    map2 = inote2_trans.tempo_map()
+    i, end1 = 0, len(inote1_trans)
+    j, end2 = 0, len(inote2_trans)
+    if window is not None:
+        i, end1 = map1.groups_between(*window)
+        j, end2 = map2.groups_between(*window)
+
+    def anchor_segment(inote_trans, group_id):
+        if group_id < len(inote_trans):
+            return inote_trans.group_segment(group_id)
+        return sys.maxsize  # 谱面末尾
+
+    while i < end1 or j < end2:
+        time1 = map1.times[i] if i < end1 else None
+        time2 = map2.times[j] if j < end2 else None
+        if time1 is not None and time2 is not None and abs(time1 - time2) <= tolerance:
+            note1, note2 = i, j
+        elif time2 is None or (time1 is not None and time1 < time2):
+            note1, note2 = i, None
+        else:
+            note1, note2 = None, j
+
+        if note1 is None or note2 is None or not time_entries_match(inote1_trans, note1, inote2_trans, note2, tolerance):
+            segment_idx1 = inote1_trans.group_segment(note1) if note1 is not None else -1
+            segment_idx2 = inote2_trans.group_segment(note2) if note2 is not None else -1
+            pos1 = get_segment_position(segment_offsets1, segment_idx1 if note1 is not None else anchor_segment(inote1_trans, i))
+            pos2 = get_segment_position(segment_offsets2, segment_idx2 if note2 is not None else anchor_segment(inote2_trans, j))
+            yield {
+                'diff_index': i,
+                'note1_str': time_entry_str(inote1_trans, note1, time1),
+                'note2_str': time_entry_str(inote2_trans, note2, time2),
+                'segment_idx1': segment_idx1,
+                'segment_idx2': segment_idx2,
+                'pos1': pos1,
+                'pos2': pos2,
+                'group1': note1,
+                'group2': note2
+            }
+
+        if note1 is not None: i += 1
+        if note2 is not None: j += 1
+
+
+
+def filter_errors_by_time(errors, inote1_trans, inote2_trans, window):
+
+    # 只保留在window (start, end) 秒之内的差异, 按任意一侧存在的note的起始时刻判断
+    start, end = window
+    times1 = inote1_trans.tempo_map().times
+    times2 = inote2_trans.tempo_map().times
+    for error in errors:
+        if error['group1'] is not None and start <= times1[error['group1']] <= end:
+            yield error
+        elif error['group2'] is not None and start <= times2[error['group2']] <= end:
+            yield error
+
+
+
+@dataclass
+class NoteDiff:
+
+    # 一处差异; 某一侧缺失时该侧note为None, segment为-1
+    diff_index: int
+    note1: Optional[str]
+    note2: Optional[str]
+    segment1: int
+    segment2: int
+    pos1: int
+    pos2: int
+
+
+
+@dataclass
+class ErrorGroup:
+
+    # 位置相近的差异, 附带两边的上下文和标记行
+    diffs: list
+    line1: int
+    line2: int
+    context1: str
+    markers1: str
+    context2: str
+    markers2: str
+
+
+
+@dataclass
+class DiffResult:
+
+    level: str
+    groups: list = field(default_factory=list)
+    warnings: list = field(default_factory=list)
+    missing: Optional[int] = None  # 1/2: 该inote在txt1/txt2中不存在
+    error: Optional[str] = None    # 多难度比较时, 该inote解析失败的信息
+
+    @property
+    def diff_count(self):
+        if self.missing:
+            return 1
+        return sum(len(group.diffs) for group in self.groups)
+
+    @property
+    def identical(self):
+        return self.diff_count == 0 and self.error is None
+
+    def render(self):
+        if self.missing:
+            return f"inote_{self.level} missing in txt{self.missing}\n"
+        if self.error is not None:
+            return f"{self.error}\n"
+        return ''.join(warning + "\n" for warning in self.warnings) + format_errors(self.groups)
+
+
+
+def build_error_groups(errors, inote1_raw, inote2_raw, segment_offsets1, segment_offsets2, start_line1, start_line2, line_mapping1, line_mapping2):
+
+    # 分组处理错误 - 基于位置相近性
+    errors.sort(key=lambda x: min(x['pos1'], x['pos2']))
+    return list(iter_error_groups(errors, inote1_raw, inote2_raw, segment_offsets1, segment_offsets2,
+                                  start_line1, start_line2, line_mapping1, line_mapping2))
+
+
+
+def iter_error_groups(errors, inote1_raw, inote2_raw, segment_offsets1, segment_offsets2, start_line1, start_line2, line_mapping1, line_mapping2):
+
+    # 流式版本: errors需已按位置排序, 每个组闭合后立即产出ErrorGroup
+    for error_group in iter_nearby_errors(errors):
+
+        # 为文件生成上下文
+        context1, markers1 = get_context_with_markers(inote1_raw, segment_offsets1, error_group, 'pos1', 'segment_idx1')
+        context2, markers2 = get_context_with_markers(inote2_raw, segment_offsets2, error_group, 'pos2', 'segment_idx2')
+
+        # 获取实际行号
+        line1 = get_line_number_for_position(line_mapping1, min(err['pos1'] for err in error_group)) or start_line1
+        line2 = get_line_number_for_position(line_mapping2, min(err['pos2'] for err in error_group)) or start_line2
+
+        diffs = [NoteDiff(err['diff_index'], err['note1_str'], err['note2_str'],
+                          err['segment_idx1'], err['segment_idx2'], err['pos1'], err['pos2'])
+                 for err in error_group]
+        yield ErrorGroup(diffs, line1, line2, context1, markers1, context2, markers2)
+
+
+
+def format_errors(groups):
+
+    if not groups:
+        return "No difference found.\n"
+
+    report = [format_error_group(group, group_idx) for group_idx, group in enumerate(groups)]
+    report.append("Reach end of inote.\n")
+    return ''.join(report)
+
+
+
+def get_segment_position(segment_offsets, segment_index):
+
+    if segment_index < 0:
+        return 0
     
-    # 获取实际行号
-    actual_line1 = get_line_number_for_position(line_mapping1, min(all_positions1)) or start_line1
-    actual_line2 = get_line_number_for_position(line_mapping2, min(all_positions2)) or start_line2
+    if segment_index >= len(segment_offsets) - 1:
+        return segment_offsets[-1] - 1  # len(inote_raw)
     
+    return segment_offsets[segment_index]
+
+
+
+def get_segment_end(segment_offsets, segment_index):
+
+    # segment结束位置 (不含逗号)
+    return segment_offsets[segment_index + 1] - 1
+
+
+
+def group_nearby_errors(errors, max_distance=6):
+
+    # 按位置排序
+    errors.sort(key=lambda x: min(x['pos1'], x['pos2']))
+    return list(iter_nearby_errors(errors, max_distance))
+
+
+
+def iter_nearby_errors(errors, max_distance=6):
+
+    # errors需按位置排序; compare_inotes/compare_inotes_by_time产出的顺序中pos1/pos2都不减, 可直接使用
+    # 只保留当前未闭合的组, 内存与差异总数无关
+    current_group = []
+    for curr_error in errors:
+        if current_group:
+            last_error = current_group[-1]
+
+            # 检查是否相近（基于两个文件中的最小距离）
+            dist1 = abs(curr_error['pos1'] - last_error['pos1'])
+            dist2 = abs(curr_error['pos2'] - last_error['pos2'])
+            if min(dist1, dist2) > max_distance:
+                yield current_group
+                current_group = []
+        current_group.append(curr_error)
+
+    if current_group:
+        yield current_group
+
+
+
+def format_error_group(group, group_idx):
+
     # 对齐行号 (使用后置空格填充)
-    line1_str = str(actual_line1) + " " * (3 - len(str(actual_line1)))
-    line2_str = str(actual_line2) + " " * (3 - len(str(actual_line2)))
-
-    print(f"Error group {group_idx + 1}:")
-    print(f"  Line {line1_str}: {context1}")
-    print(f"            {markers1}")
-    for err in error_group:
-        print(f"    diff{err['diff_index']}: {err['note1_str']}")
+    line1_str = str(group.line1) + " " * (3 - len(str(group.line1)))
+    line2_str = str(group.line2) + " " * (3 - len(str(group.line2)))
+
+    lines = []
+    lines.append(f"Error group {group_idx + 1}:")
+    lines.append(f"  Line {line1_str}: {group.context1}")
+    lines.append(f"            {group.markers1}")
+    for diff in group.diffs:
+        lines.append(f"    diff{diff.diff_index}: {diff.note1}")
     
-    print(f"\n  Line {line2_str}: {context2}")
-    print(f"            {markers2}")
-    for err in error_group:
-        print(f"    diff{err['diff_index']}: {err['note2_str']}")
-    print()
+    lines.append(f"\n  Line {line2_str}: {group.context2}")
+    lines.append(f"            {group.markers2}")
+    for diff in group.diffs:
+        lines.append(f"    diff{diff.diff_index}: {diff.note2}")
+    lines.append("")
+    return '\n'.join(lines) + '\n'
 
 
 
-def get_context_with_markers(inote_raw, error_group, pos_key, segment_key, context_chars=20):
+def get_context_with_markers(inote_raw, segment_offsets, error_group, pos_key, segment_key, context_chars=20):
 
     positions = [err[pos_key] for err in error_group]
     segment_indices = [err[segment_key] for err in error_group]
@@ -558,11 +2362,11 @@ def get_context_with_markers(inote_raw, error_group, pos_key, segment_key, conte
     context_start = max(0, min_pos - context_chars)
     
     # 需要考虑最长的segment来确定context_end
-    segments = inote_raw.split(',')
+    segment_count = len(segment_offsets) - 1
     max_segment_end = max_pos
-    for pos, segment_idx in zip(positions, segment_indices):
-        if segment_idx >= 0 and segment_idx < len(segments):
-            segment_end = pos + len(segments[segment_idx])
+    for segment_idx in segment_indices:
+        if segment_idx >= 0 and segment_idx < segment_count:
+            segment_end = get_segment_end(segment_offsets, segment_idx)
             max_segment_end = max(max_segment_end, segment_end)
     
     context_end = min(len(inote_raw), max_segment_end + context_chars)
@@ -575,12 +2379,12 @@ def get_context_with_markers(inote_raw, error_group, pos_key, segment_key, conte
     for i, (pos, segment_idx) in enumerate(zip(positions, segment_indices)):
         if segment_idx < 0:  # 开头占位符
             continue
-        if segment_idx >= len(segments):
+        if segment_idx >= segment_count:
             continue
             
         # 计算segment在原始字符串中的实际范围
         segment_start_in_raw = pos
-        segment_end_in_raw = pos + len(segments[segment_idx])
+        segment_end_in_raw = get_segment_end(segment_offsets, segment_idx)
         
         # 计算在context中的相对位置
         relative_start = segment_start_in_raw - context_start
@@ -600,15 +2404,1468 @@ def get_context_with_markers(inote_raw, error_group, pos_key, segment_key, conte
 
 
 
+PARSER_VERSION = 3  # translate_inote/NoteTable的输出格式改变时递增, 旧缓存随之失效
+CACHE_MAGIC = b'MDIFFC01'
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+
+def default_cache_dir():
+
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'maidata-diff')
+
+
+
+class ParseCache:
+
+    # 解析结果的磁盘缓存, 键为 (txt内容hash, level, PARSER_VERSION)
+    # 每个条目一个文件: magic + JSON头 + 8字节对齐的array数据段, 读取时mmap
+    # 按mtime做LRU淘汰, 命中时更新mtime; 写入失败只会让缓存失效, 不影响diff
+    def __init__(self, cache_dir=None, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def entry_path(self, digest, level):
+        # level为None时是该文件的难度列表
+        key = hashlib.sha256(f"{digest}\0{level}\0{PARSER_VERSION}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key + '.bin')
+
+    def load_inotes(self, digest, levels=None):
+        # 返回load_inotes格式的结果, 未命中时返回None
+        index = self.read_entry(self.entry_path(digest, None))
+        index = None if index is None else index[0]['levels']
+        wanted = index if levels is None else list(map(str, levels))
+        if wanted is None:
+            self.misses += 1
+            return None
+        entries = {}
+        for level in wanted:
+            entry = self.read_entry(self.entry_path(digest, level))
+            if entry is None:
+                if index is not None and level not in index:
+                    continue  # 文件中本来就没有这个难度
+                self.misses += 1
+                return None
+            entries[level] = self.decode_entry(*entry)
+        self.hits += 1
+        return entries
+
+    def store_inotes(self, digest, levels, entries):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for level, (inote, translated) in entries.items():
+                self.write_entry(self.entry_path(digest, level), *self.encode_entry(level, inote, translated))
+            if levels is None:
+                self.write_entry(self.entry_path(digest, None), {'levels': list(entries)}, [])
+            self.evict()
+        except OSError:
+            pass
+
+    def encode_entry(self, level, inote, translated):
+        inote_raw, start_line, line_mapping = inote
+        header = {'level': level, 'start_line': start_line, 'line_length': line_mapping.length}
+        sections = [('raw', array('B', inote_raw.encode('utf-8'))),
+                    ('line_starts', line_mapping.starts), ('line_lines', line_mapping.lines)]
+        if isinstance(translated, MaidataError):
+            header['error'] = str(translated)
+            return header, sections
+        table, segment_offsets = translated
+        local_ids = {}  # 全局INFO_POOL下标只在本进程内有效, 换成条目内的下标
+        info = array('I', [local_ids.setdefault(info_id, len(local_ids)) for info_id in table.info])
+        header['pool'] = [INFO_POOL[info_id] for info_id in local_ids]
+        header['resolution'] = table.resolution
+        header['warnings'] = table.warnings
+        sections += [('segment_offsets', segment_offsets), ('info', info), ('bpm', table.bpm),
+                     ('length', table.length), ('hold', table.hold), ('seconds', table.seconds), ('segment', table.segment),
+                     ('group', table.group), ('group_start', table.group_start)]
+        return header, sections
+
+    def decode_entry(self, header, sections):
+        line_mapping = LineMap()
+        line_mapping.starts = sections['line_starts']
+        line_mapping.lines = sections['line_lines']
+        line_mapping.length = header['line_length']
+        inote = (sections['raw'].tobytes().decode('utf-8'), header['start_line'], line_mapping)
+        if 'error' in header:
+            return inote, ChartParseError(header['error'])
+        table = NoteTable(header['resolution'])
+        info_ids = [intern_info(info) for info in header['pool']]
+        table.info = array('I', map(info_ids.__getitem__, sections['info']))
+        for name in ('bpm', 'length', 'hold', 'seconds', 'segment', 'group', 'group_start'):
+            setattr(table, name, sections[name])
+        table.warnings = header['warnings']
+        return inote, (table, sections['segment_offsets'])
+
+    def write_entry(self, path, header, sections):
+        data = []
+        offset = 0
+        header['byteorder'] = sys.byteorder
+        header['sections'] = []
+        for name, values in sections:
+            chunk = values.tobytes()
+            header['sections'].append([name, values.typecode, offset, len(chunk)])
+            data.append(chunk)
+            data.append(b'\0' * (-len(chunk) % 8))
+            offset += len(chunk) + (-len(chunk) % 8)
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        header_bytes += b' ' * (-(len(header_bytes) + 12) % 8)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(CACHE_MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+            f.writelines(data)
+        os.replace(tmp_path, path)  # 多进程同时写入时保证原子性
+
+    def read_entry(self, path):
+        # 返回 (header, {name: array}), 条目不存在或损坏时返回None
+        try:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:8] != CACHE_MAGIC:
+                    return None
+                header_length, = struct.unpack_from('<I', mm, 8)
+                base = 12 + header_length
+                header = json.loads(mm[12:base].decode('utf-8'))
+                if header['byteorder'] != sys.byteorder:
+                    return None
+                sections = {}
+                for name, typecode, offset, size in header['sections']:
+                    values = array(typecode)
+                    values.frombytes(mm[base + offset:base + offset + size])
+                    sections[name] = values
+            os.utime(path)
+        except (OSError, ValueError, KeyError, struct.error):
+            return None
+        return header, sections
+
+    def evict(self):
+        # 超出容量时从最久未使用的条目开始删除
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for item in it:
+                if item.name.endswith('.bin'):
+                    stat = item.stat()
+                    entries.append((stat.st_mtime, stat.st_size, item.path))
+                    total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        # 删除所有条目, 返回删除的文件数
+        removed = 0
+        if not os.path.isdir(self.cache_dir):
+            return removed
+        with os.scandir(self.cache_dir) as it:
+            for item in it:
+                if item.name.endswith(('.bin', '.tmp')):
+                    try:
+                        os.remove(item.path)
+                        removed += 1
+                    except OSError:
+                        pass
+        return removed
+
+    def stats_str(self):
+        return f"Cache: {self.hits} hit(s), {self.misses} miss(es) [{self.cache_dir}]"
+
+
+
+class Profiler:
+
+    # 各阶段累计的wall/CPU时间及计数器, 用于--profile/--stats-json
+    # hook(stage, wall, cpu) 在每个阶段结束时调用; trace_memory时用tracemalloc记录内存峰值
+    def __init__(self, hook=None, trace_memory=False):
+        self.stages = {}    # stage -> [wall, cpu, calls]
+        self.counters = {}
+        self.hook = hook
+        self.trace_memory = trace_memory
+        self.peak_memory = None
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.started = None
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.started = (time.perf_counter(), time.process_time(), COUNTERS['fractions'])
+
+    def stop(self):
+        wall, cpu, fraction_count = self.started
+        self.wall += time.perf_counter() - wall
+        self.cpu += time.process_time() - cpu
+        self.count('fractions', COUNTERS['fractions'] - fraction_count)
+        if self.trace_memory and tracemalloc.is_tracing():
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.started = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            totals = self.stages.setdefault(name, [0.0, 0.0, 0])
+            totals[0] += wall
+            totals[1] += cpu
+            totals[2] += 1
+            if self.hook is not None:
+                self.hook(name, wall, cpu)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        return {
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'stages': {name: {'wall': wall, 'cpu': cpu, 'calls': calls} for name, (wall, cpu, calls) in self.stages.items()},
+            'counters': dict(self.counters),
+            'peak_memory': self.peak_memory,
+        }
+
+    def format(self):
+        lines = [f"{'stage':<10} {'wall ms':>10} {'cpu ms':>10} {'calls':>6}"]
+        for name, (wall, cpu, calls) in self.stages.items():
+            lines.append(f"{name:<10} {wall * 1000:>10.2f} {cpu * 1000:>10.2f} {calls:>6}")
+        lines.append(f"{'total':<10} {self.wall * 1000:>10.2f} {self.cpu * 1000:>10.2f}")
+        lines.append(', '.join(f"{name}={value}" for name, value in self.counters.items()))
+        if self.peak_memory is not None:
+            lines.append(f"peak memory: {self.peak_memory / 1024:.1f} KiB (tracemalloc)")
+        return '\n'.join(lines) + '\n'
+
+
+
+def profile_stage(profiler, name):
+
+    return contextlib.nullcontext() if profiler is None else profiler.stage(name)
+
+
+
+def translate_inotes(inotes, profiler=None, jobs=None):
+
+    # {level: inote} -> {level: (inote, translated)}
+    # translated为translate_inote的返回值, 解析失败时为对应的MaidataError
+    # jobs: 不为None时较长的inote使用translate_inote_parallel
+    entries = {}
+    with profile_stage(profiler, 'translate'):
+        for level, inote in inotes.items():
+            try:
+                if jobs is not None:
+                    entries[level] = (inote, translate_inote_parallel(inote[0], jobs))
+                else:
+                    entries[level] = (inote, translate_inote(inote[0]))
+            except MaidataError as e:
+                entries[level] = (inote, e)
+    return entries
+
+
+
+def load_inotes(txt, levels=None, cache=None, profiler=None, jobs=None):
+
+    # 读取并解析txt, 返回 {level: (inote, translated)}
+    # 提供cache时按文件内容hash查找, 命中则跳过提取和解析
+    # jobs: 见translate_inotes
+    if cache is None:
+        with profile_stage(profiler, 'read'):
+            inotes = read_inotes(txt, levels)
+        return translate_inotes(inotes, profiler, jobs)
+    # 映射一次: 对映射计算hash, 未命中时在同一个映射上定位需要的块, 不把整个文件读入内存
+    with map_chart(txt) as buffer:
+        with profile_stage(profiler, 'cache'):
+            digest = hashlib.sha256(buffer).hexdigest()
+            entries = cache.load_inotes(digest, levels)
+        if entries is None:
+            with profile_stage(profiler, 'read'):
+                inotes = read_inotes_from_text(buffer, levels)
+    if entries is None:
+        entries = translate_inotes(inotes, profiler, jobs)
+        with profile_stage(profiler, 'cache'):
+            cache.store_inotes(digest, levels, entries)
+    return entries
+
+
+
+def get_loaded_inote(entries, lv, txt_num):
+
+    # 从load_inotes的结果中取出一个难度, 缺失或解析失败时抛出异常
+    if str(lv) not in entries:
+        raise InoteNotFoundError(lv, txt_num)
+    entry = entries[str(lv)]
+    if isinstance(entry[1], MaidataError):
+        raise entry[1]
+    return entry
+
+
+
+def diff_translated(entry1, entry2, timeline='delay', level=None, keys=None, profiler=None):
+
+    # entry为 (inote, (inote_trans, segment_offsets)), 见translate_inotes
+    # keys: 可选的预先计算好的对齐键, 只用于delay模式
+    (inote1_raw, start_line1, line_mapping1), (inote1_trans, segment_offsets1) = entry1
+    (inote2_raw, start_line2, line_mapping2), (inote2_trans, segment_offsets2) = entry2
+
+    with profile_stage(profiler, 'compare'):
+        if timeline == 'tick':
+            errors = compare_inotes_by_time(inote1_trans, inote2_trans, segment_offsets1, segment_offsets2)
+        elif timeline == 'time':
+            errors = compare_inotes_by_seconds(inote1_trans, inote2_trans, segment_offsets1, segment_offsets2)
+        else:
+            errors = compare_inotes(inote1_trans, inote2_trans, segment_offsets1, segment_offsets2, keys)
+    with profile_stage(profiler, 'group'):
+        groups = build_error_groups(errors, inote1_raw, inote2_raw, segment_offsets1, segment_offsets2, start_line1, start_line2, line_mapping1, line_mapping2)
+    if profiler is not None:
+        profiler.count('segments', len(segment_offsets1) + len(segment_offsets2) - 2)
+        profiler.count('notes', len(inote1_trans.info) + len(inote2_trans.info))
+        profiler.count('timeline_groups', len(inote1_trans) + len(inote2_trans))
+        profiler.count('diffs', len(errors))
+        profiler.count('error_groups', len(groups))
+    return DiffResult(None if level is None else str(level), groups, inote1_trans.warnings + inote2_trans.warnings)
+
+
+
+def iter_diff(entry1, entry2, timeline='delay', keys=None, max_diffs=None, window=None):
+
+    # diff_translated的流式版本: 每个错误组闭合后立即产出ErrorGroup, 不保存之前的组
+    # max_diffs: 最多取前N处差异 (之后不再生成错误/上下文)
+    # window: (start, end) 秒, 只报告这段时间内的差异; time模式下直接跳到该位置比较
+    (inote1_raw, start_line1, line_mapping1), (inote1_trans, segment_offsets1) = entry1
+    (inote2_raw, start_line2, line_mapping2), (inote2_trans, segment_offsets2) = entry2
+    if timeline == 'time':
+        errors = iter_compare_inotes_by_seconds(inote1_trans, inote2_trans, segment_offsets1, segment_offsets2, window=window)
+    else:
+        if timeline == 'tick':
+            errors = iter_compare_inotes_by_time(inote1_trans, inote2_trans, segment_offsets1, segment_offsets2)
+        else:
+            errors = iter_compare_inotes(inote1_trans, inote2_trans, segment_offsets1, segment_offsets2, keys)
+        if window is not None:
+            errors = filter_errors_by_time(errors, inote1_trans, inote2_trans, window)
+    if max_diffs is not None:
+        errors = itertools.islice(errors, max_diffs)
+    return iter_error_groups(errors, inote1_raw, inote2_raw, segment_offsets1, segment_offsets2, start_line1, start_line2, line_mapping1, line_mapping2)
+
+
+
+def diff_inote(inote1, inote2, timeline='delay', level=None, profiler=None):
+
+    # inote为get_inote/read_inotes返回的 (inote_raw, start_line, line_mapping)
+    # profiler: 可选的Profiler, 记录各阶段耗时 (可通过Profiler(hook=...) 接收回调)
+    with profile_stage(profiler, 'translate'):
+        translated1 = translate_inote(inote1[0])
+        translated2 = translate_inote(inote2[0])
+    return diff_translated((inote1, translated1), (inote2, translated2), timeline, level, None, profiler)
+
+
+
+def diff_charts(text1, text2, level, timeline='delay', profiler=None):
+
+    # 库接口: 比较内存中的两个谱面 (str或bytes) 的同一难度
+    # 找不到inote时抛出InoteNotFoundError, 无法解析时抛出ChartParseError
+    with profile_stage(profiler, 'read'):
+        blocks1 = read_inotes_from_text(text1, [level])
+        blocks2 = read_inotes_from_text(text2, [level])
+    if str(level) not in blocks1:
+        raise InoteNotFoundError(level, 1)
+    if str(level) not in blocks2:
+        raise InoteNotFoundError(level, 2)
+    return diff_inote(blocks1[str(level)], blocks2[str(level)], timeline, level, profiler)
+
+
+
+def diff_entries(entries1, entries2, levels=None, timeline='delay', profiler=None):
+
+    # entries为translate_inotes/load_inotes的返回值
+    # 缺失或解析失败的inote不抛出异常, 记录在对应的DiffResult中
+    if levels is None:
+        levels = sorted(set(entries1) | set(entries2), key=level_sort_key)
+    results = []
+    for level in map(str, levels):
+        if level not in entries1 and level not in entries2:
+            continue  # 两边都没有的难度不算差异 (如history中删除之后的版本)
+        if level not in entries1:
+            results.append(DiffResult(level, missing=1))
+            continue
+        if level not in entries2:
+            results.append(DiffResult(level, missing=2))
+            continue
+        entry1 = entries1[level]
+        entry2 = entries2[level]
+        for entry in (entry1, entry2):
+            if isinstance(entry[1], MaidataError):
+                results.append(DiffResult(level, error=str(entry[1])))
+                break
+        else:
+            results.append(diff_translated(entry1, entry2, timeline, level, None, profiler))
+    return results
+
+
+
+def diff_all_levels(inotes1, inotes2, levels=None, timeline='delay', profiler=None):
+
+    # inotes为read_inotes的返回值, levels为None时比较两边出现过的所有inote
+    if levels is not None:
+        wanted = set(map(str, levels))
+        inotes1 = {level: inote for level, inote in inotes1.items() if level in wanted}
+        inotes2 = {level: inote for level, inote in inotes2.items() if level in wanted}
+    return diff_entries(translate_inotes(inotes1, profiler), translate_inotes(inotes2, profiler), levels, timeline, profiler)
+
+
+
+def diff_charts_all_levels(text1, text2, levels=None, timeline='delay', profiler=None):
+
+    # 库接口: 比较内存中的两个谱面的所有 (或指定的) 难度, 返回 [DiffResult]
+    with profile_stage(profiler, 'read'):
+        inotes1 = read_inotes_from_text(text1, levels)
+        inotes2 = read_inotes_from_text(text2, levels)
+    return diff_all_levels(inotes1, inotes2, levels, timeline, profiler)
+
+
+
+def format_level_results(results):
+
+    if not results:
+        return "No inote found in txt1 or txt2.\n"
+    return ''.join(f"===== inote_{result.level} =====\n{result.render()}\n" for result in results)
+
+
+
+def diff_levels(txt1, txt2, levels=None, timeline='delay', cache=None, profiler=None, jobs=None):
+
+    # 每个文件只读取一次, 返回 (diff_count, report)
+    entries1 = load_inotes(txt1, levels, cache, profiler, jobs)
+    entries2 = load_inotes(txt2, levels, cache, profiler, jobs)
+    results = diff_entries(entries1, entries2, levels, timeline, profiler)
+    with profile_stage(profiler, 'render'):
+        report = format_level_results(results)
+    return sum(result.diff_count for result in results), report
+
+
+
+def stream_levels(entries1, entries2, levels=None, timeline='delay', output=None, fmt='text', max_groups=None, max_diffs=None, headers=True, window=None, profiler=None):
+
+    # 边比较边输出 (text或jsonl), 无上限时text输出与format_level_results/DiffResult.render相同
+    # headers=False用于单难度 (不输出 ===== inote_N ===== 标题)
+    # 达到max_groups/max_diffs后立即停止, 返回 (diff_count, error_count, stopped)
+    # profiler: 与diff_translated记录同样的计数 (segments, notes, timeline_groups, diffs, error_groups)
+    write = (output or sys.stdout).write
+    if levels is None:
+        levels = sorted(set(entries1) | set(entries2), key=level_sort_key)
+    if not levels and fmt == 'text':
+        write("No inote found in txt1 or txt2.\n")
+    diff_count = group_count = error_count = 0
+    stopped = False
+
+    def emit(record):
+        write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    for level in map(str, levels):
+        entry1 = entries1.get(level)
+        entry2 = entries2.get(level)
+        if entry1 is None and entry2 is None:
+            continue  # 同diff_entries, 两边都没有的难度不输出
+        if headers and fmt == 'text':
+            write(f"===== inote_{level} =====\n")
+        error = next((entry[1] for entry in (entry1, entry2) if entry is not None and isinstance(entry[1], MaidataError)), None)
+        if entry1 is None or entry2 is None:
+            missing = 1 if entry1 is None else 2
+            diff_count += 1
+            if fmt == 'jsonl':
+                emit({'type': 'missing', 'level': level, 'txt': missing})
+            else:
+                write(f"inote_{level} missing in txt{missing}\n")
+        elif error is not None:
+            error_count += 1
+            if fmt == 'jsonl':
+                emit({'type': 'error', 'level': level, 'message': str(error)})
+            else:
+                write(f"{error}\n")
+        else:
+            for warning in entry1[1][0].warnings + entry2[1][0].warnings:
+                if fmt == 'jsonl':
+                    emit({'type': 'warning', 'level': level, 'message': warning})
+                else:
+                    write(warning + "\n")
+            level_groups = level_diffs = 0
+            remaining = None if max_diffs is None else max_diffs - diff_count
+            for group in iter_diff(entry1, entry2, timeline, max_diffs=remaining, window=window):
+                if fmt == 'jsonl':
+                    record = {'type': 'group', 'level': level, 'index': level_groups + 1}
+                    record.update(asdict(group))
+                    emit(record)
+                else:
+                    write(format_error_group(group, level_groups))
+                level_groups += 1
+                level_diffs += len(group.diffs)
+                group_count += 1
+                diff_count += len(group.diffs)
+                if max_groups is not None and group_count >= max_groups:
+                    break
+            if profiler is not None:
+                (table1, segment_offsets1), (table2, segment_offsets2) = entry1[1], entry2[1]
+                profiler.count('segments', len(segment_offsets1) + len(segment_offsets2) - 2)
+                profiler.count('notes', len(table1.info) + len(table2.info))
+                profiler.count('timeline_groups', len(table1) + len(table2))
+                profiler.count('diffs', level_diffs)
+                profiler.count('error_groups', level_groups)
+            stopped = (max_groups is not None and group_count >= max_groups) or (max_diffs is not None and diff_count >= max_diffs)
+            if fmt == 'text':
+                if stopped:
+                    write(f"Stopped after {group_count} error group(s), {diff_count} diff(s).\n")
+                elif level_groups:
+                    write("Reach end of inote.\n")
+                else:
+                    write("No difference found.\n")
+        if max_diffs is not None and diff_count >= max_diffs:
+            stopped = True
+        if headers and fmt == 'text':
+            write("\n")
+        if stopped:
+            break
+
+    if fmt == 'jsonl':
+        emit({'type': 'summary', 'groups': group_count, 'diffs': diff_count, 'errors': error_count, 'stopped': stopped})
+    return diff_count, error_count, stopped
+
+
+
+class WatchedChart:
+
+    # --watch中的一个txt: 保留上次的inote和解析结果, 文件改动时增量更新
+    __slots__ = ('txt', 'level', 'txt_num', 'stamp', 'inote', 'translated', 'checkpoints', 'keys', 'error')
+
+    def __init__(self, txt, level, txt_num):
+        self.txt = txt
+        self.level = level
+        self.txt_num = txt_num
+        self.stamp = None        # chart_stamp: (mtime_ns, size), 压缩包成员另加CRC
+        self.inote = None        # (inote_raw, start_line, line_mapping)
+        self.translated = None   # (NoteTable, segment_offsets)
+        self.checkpoints = None
+        self.keys = None         # 对齐键, 只重新生成改动过的group
+        self.error = None        # 最近一次读取/解析失败的信息
+
+    def refresh(self, key_ids):
+        # 文件有改动时重新提取inote并增量解析, 返回是否有改动
+        # 解析失败时保留上一次的结果; key_ids在两个txt之间共享
+        stamp = chart_stamp(self.txt)
+        if stamp == self.stamp:
+            return False
+        self.stamp = stamp
+        try:
+            inote = get_inote(self.level, self.txt, self.txt_num, mapped=False)  # 保存过程中可能被截断
+            if self.translated is None:
+                checkpoints = Checkpoints()
+                table, segment_offsets = translate_inote(inote[0], checkpoints)
+                keys = get_alignment_keys(table, key_ids)
+            else:
+                table, segment_offsets, checkpoints, head, tail = retranslate_inote(self.inote[0], self.translated, self.checkpoints, inote[0])
+                keys = self.keys[:head]
+                keys += get_alignment_keys(table, key_ids, head, len(table) - tail)
+                keys += self.keys[len(self.keys) - tail:] if tail else []
+        except MaidataError as e:
+            self.error = str(e)
+            return True
+        self.keys = keys
+        self.inote = inote
+        self.translated = (table, segment_offsets)
+        self.checkpoints = checkpoints
+        self.error = None
+        return True
+
+
+
+def watch_diff(txt1, txt2, level, timeline='delay', interval=0.5):
+
+    # 轮询两个txt的mtime, 有改动时只重新解析编辑过的部分并重新diff, Ctrl+C退出
+    charts = [WatchedChart(txt1, level, 1), WatchedChart(txt2, level, 2)]
+    key_ids = {}
+    print(f"Watching {txt1} and {txt2} (inote_{level}), press Ctrl+C to stop")
+    while True:
+        start = time.perf_counter()
+        changed = []
+        for chart in charts:
+            try:
+                if chart.refresh(key_ids):
+                    changed.append(chart)
+            except OSError:
+                pass  # 保存过程中文件可能暂时不存在
+        if changed:
+            errors = [chart.error for chart in charts if chart.error is not None]
+            if errors:
+                report = ''.join(f"{error}\n" for error in errors)
+            else:
+                keys = (charts[0].keys, charts[1].keys)
+                report = diff_translated((charts[0].inote, charts[0].translated), (charts[1].inote, charts[1].translated), timeline, level, keys).render()
+            elapsed = (time.perf_counter() - start) * 1000
+            names = ', '.join(chart.txt for chart in changed)
+            print(f"===== {time.strftime('%H:%M:%S')} {names} changed ({elapsed:.1f} ms) =====")
+            print(report, end='', flush=True)
+        time.sleep(interval)
+
+
+
+def add_note_rule_args(parser):
+
+    parser.add_argument('--strict-notes', action='store_true', help='Compare note info exactly (no touch alias, slide shape or $ normalization)')
+    parser.add_argument('--note-rules', type=str, metavar='PATH', help='JSON file overriding sensor_aliases, slide_shapes, ignored_flags and/or time_tolerance_ms')
+    parser.add_argument('--time-tolerance-ms', type=float, metavar='MS', help='Treat notes within MS milliseconds as simultaneous (default 1); implies --timeline time unless another timeline is given')
+
+
+
+def apply_note_rule_args(args):
+
+    if args.strict_notes:
+        set_normalization_rules({}, {}, '')
+    if args.note_rules:
+        try:
+            with open(args.note_rules, 'r', encoding='utf-8') as f:
+                rules = json.load(f)
+            set_normalization_rules(rules.get('sensor_aliases'), rules.get('slide_shapes'), rules.get('ignored_flags'), rules.get('time_tolerance_ms'))
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            print(f"args error: invalid note rules: {e}")
+            sys.exit(1)
+    if args.time_tolerance_ms is not None:
+        if not args.time_tolerance_ms >= 0:
+            print(f"args error: --time-tolerance-ms must not be negative")
+            sys.exit(1)
+        set_normalization_rules(time_tolerance_ms=args.time_tolerance_ms)
+    if 'timeline' in args and args.timeline is None:
+        args.timeline = 'time' if args.time_tolerance_ms is not None else 'delay'
+
+
+
+def parse_batch_args(argv):
+
+    parser = argparse.ArgumentParser(prog='main.py batch', description='Diff every chart pair of two directories')
+    parser.add_argument('dir1', type=str, help='Chart directory 1, or a zip pack (pack.zip, pack.zip!/subdir)')
+    parser.add_argument('dir2', type=str, help='Chart directory 2, or a zip pack')
+    parser.add_argument('-lv', type=int, choices=range(2, 8), help='inote level (2-7), default all levels')
+    parser.add_argument('--pair-by', choices=['path', 'folder'], default='path', help='path: same relative path (default); folder: same song folder name')
+    parser.add_argument('--pattern', type=str, default='maidata.txt', help='Chart file name (default maidata.txt)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Worker processes (default cpu count)')
+    parser.add_argument('-o', '--output', type=str, help='Write report to file instead of stdout')
+    parser.add_argument('--timeline', choices=['delay', 'tick', 'time'], help='See main.py -h')
+    add_note_rule_args(parser)
+    args = parser.parse_args(argv)
+    apply_note_rule_args(args)
+
+    if not chart_dir_exists(args.dir1):
+        print(f"args error: dir1 not exist")
+        sys.exit(1)
+    if not chart_dir_exists(args.dir2):
+        print(f"args error: dir2 not exist")
+        sys.exit(1)
+    return args
+
+
+
+def chart_dir_exists(root):
+
+    archive, member = split_archive_path(root)
+    if member is None and not is_archive_root(root):
+        return os.path.isdir(root)
+    return os.path.isfile(archive)
+
+
+
+def is_archive_root(root):
+
+    return root.lower().endswith(('.zip', '.7z')) and not os.path.isdir(root)
+
+
+
+def find_chart_files(root, pattern='maidata.txt', pair_by='path'):
+
+    # 返回 {配对键: 路径}, 键相同时保留先找到的
+    # root为zip (或 pack.zip!/subdir) 时只读取目录表, 路径为 pack.zip!/member
+    archive, prefix = split_archive_path(root)
+    if prefix is not None or is_archive_root(root):
+        return find_archive_charts(archive, prefix or '', pattern, pair_by)
+    charts = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        if pattern not in filenames: continue
+        path = os.path.join(dirpath, pattern)
+        if pair_by == 'folder':
+            key = os.path.basename(dirpath)
+        else:
+            key = os.path.relpath(path, root).replace(os.sep, '/')
+        charts.setdefault(key, path)
+    return charts
+
+
+
+def find_archive_charts(archive, prefix='', pattern='maidata.txt', pair_by='path'):
+
+    prefix = prefix.strip('/')
+    prefix = prefix + '/' if prefix else ''
+    with open_archive(archive) as pack:
+        names = sorted(info.filename for info in pack.infolist() if not info.is_dir())
+    charts = {}
+    for name in names:
+        if not name.startswith(prefix) or name.rsplit('/', 1)[-1] != pattern:
+            continue
+        relative = name[len(prefix):]
+        key = relative.rsplit('/', 2)[-2] if pair_by == 'folder' and '/' in relative else relative
+        charts.setdefault(key, f"{archive}!/{name}")
+    return charts
+
+
+
+def expand_chart_pattern(pattern):
+
+    # 展开glob, 支持压缩包内的成员 (pack.zip!/*/maidata.txt)
+    archive, member = split_archive_path(pattern)
+    if member is None:
+        return sorted(glob.glob(pattern, recursive=True))
+    if not os.path.isfile(archive):
+        return []
+    with open_archive(archive) as pack:
+        names = sorted(info.filename for info in pack.infolist() if not info.is_dir())
+    return [f"{archive}!/{name}" for name in fnmatch.filter(names, member)]
+
+
+
+def batch_diff_pair(task):
+
+    # 在子进程中运行, 单个谱面出错不影响其他谱面
+    key, txt1, txt2, levels, timeline = task
+    try:
+        diff_count, report = diff_levels(txt1, txt2, levels, timeline)
+    except Exception as e:
+        return key, None, f"batch error: {type(e).__name__}: {e}\n"
+    return key, diff_count, report
+
+
+
+def batch_diff(dir1, dir2, levels=None, timeline='delay', pair_by='path', pattern='maidata.txt', jobs=None):
+
+    # 返回 (results, only1, only2), results为 [(key, diff_count, report)], 出错时diff_count为None
+    # 子进程使用当前进程的NORMALIZATION_RULES
+    charts1 = find_chart_files(dir1, pattern, pair_by)
+    charts2 = find_chart_files(dir2, pattern, pair_by)
+    keys = sorted(set(charts1) & set(charts2))
+    only1 = sorted(set(charts1) - set(charts2))
+    only2 = sorted(set(charts2) - set(charts1))
+    tasks = [(key, charts1[key], charts2[key], levels, timeline) for key in keys]
+
+    if jobs == 1 or len(tasks) <= 1:
+        results = [batch_diff_pair(task) for task in tasks]
+    else:
+        jobs = jobs or os.cpu_count() or 1
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        rules = normalization_rule_values()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=set_normalization_rules, initargs=rules) as executor:
+            results = list(executor.map(batch_diff_pair, tasks, chunksize=chunksize))
+    return results, only1, only2
+
+
+
+def format_batch_report(results, only1, only2):
+
+    report = []
+    for key, diff_count, pair_report in results:
+        report.append(f"########## {key} ##########\n")
+        report.append(pair_report)
+        report.append("\n")
+
+    changed = [key for key, diff_count, _ in results if diff_count]
+    failed = [key for key, diff_count, _ in results if diff_count is None]
+    report.append("########## Summary ##########\n")
+    report.append(f"Compared: {len(results)}, with differences: {len(changed)}, errors: {len(failed)}\n")
+    for key in changed:
+        report.append(f"  diff   {key}\n")
+    for key in failed:
+        report.append(f"  error  {key}\n")
+    for key in only1:
+        report.append(f"  only in dir1: {key}\n")
+    for key in only2:
+        report.append(f"  only in dir2: {key}\n")
+    return ''.join(report)
+
+
+
+def batch_main(argv):
+
+    args = parse_batch_args(argv)
+    levels = [args.lv] if args.lv else None
+    try:
+        results, only1, only2 = batch_diff(args.dir1, args.dir2, levels, args.timeline, args.pair_by, args.pattern, args.jobs)
+    except MaidataError as e:
+        print(e)
+        sys.exit(1)
+    report = format_batch_report(results, only1, only2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"Report written to {args.output}")
+    else:
+        print(report, end='')
+
+
+
+GIT_NULL_OID = '0' * 40
+HISTORY_STATE = {'blobs': {}, 'levels': None, 'entries': {}}  # history子进程的共享数据, 见init_history_worker
+
+
+
+def parse_history_args(argv):
+
+    parser = argparse.ArgumentParser(prog='main.py history', description='Diff a chart across the commits of a git repository')
+    parser.add_argument('repo', type=str, help='Git repository (work tree or bare)')
+    parser.add_argument('path', type=str, help='Chart path relative to the repository root')
+    parser.add_argument('range', nargs='?', default='HEAD', help='Revision range passed to git log (default HEAD)')
+    parser.add_argument('-lv', type=int, choices=range(2, 8), help='inote level (2-7), default all levels')
+    parser.add_argument('--base', type=str, metavar='REV', help='Diff every commit against REV instead of its parent')
+    parser.add_argument('--full', action='store_true', help='Print the full diff report of each commit instead of a summary')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Worker processes (default cpu count)')
+    parser.add_argument('-o', '--output', type=str, help='Write report to file instead of stdout')
+    parser.add_argument('--timeline', choices=['delay', 'tick', 'time'], help='See main.py -h')
+    add_note_rule_args(parser)
+    args = parser.parse_args(argv)
+    apply_note_rule_args(args)
+
+    if not os.path.isdir(args.repo):
+        print(f"args error: repo not exist")
+        sys.exit(1)
+    return args
+
+
+
+def run_git(repo, *args):
+
+    try:
+        completed = subprocess.run(['git', '-C', repo, *args], capture_output=True)
+    except OSError as e:
+        raise MaidataError(f"git error: {e}") from None
+    if completed.returncode != 0:
+        raise MaidataError(f"git error: {completed.stderr.decode('utf-8', 'replace').strip()}")
+    return completed.stdout
+
+
+
+def git_file_revisions(repo, path, rev_range='HEAD'):
+
+    # 从旧到新列出改动了path的提交: [(commit, subject, old_oid, new_oid)]
+    # oid为None表示该版本中文件不存在 (新增/删除); merge提交不单独列出
+    output = run_git(repo, 'log', '--reverse', '--no-renames', '--raw', '--no-abbrev',
+                     '--format=%x00%H %s', rev_range, '--', path)
+    revisions = []
+    for record in output.decode('utf-8', 'replace').split('\0')[1:]:
+        header, _, raw = record.partition('\n')
+        commit, _, subject = header.partition(' ')
+        for line in raw.splitlines():
+            if not line.startswith(':'): continue
+            fields = line[1:].split('\t')[0].split()
+            old_oid, new_oid = (None if oid == GIT_NULL_OID else oid for oid in fields[2:4])
+            revisions.append((commit, subject, old_oid, new_oid))
+            break
+    return revisions
+
+
+
+def read_git_blobs(repo, specs):
+
+    # 通过一个 git cat-file --batch 进程读取所有对象 (oid或 rev:path), 返回 {spec: bytes}, 不存在的对象不包含在内
+    blobs = {}
+    if not specs:
+        return blobs
+    try:
+        process = subprocess.Popen(['git', '-C', repo, 'cat-file', '--batch'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    except OSError as e:
+        raise MaidataError(f"git error: {e}") from None
+    with process:
+        for spec in specs:
+            process.stdin.write(spec.encode('utf-8') + b'\n')
+            process.stdin.flush()
+            header = process.stdout.readline().split()
+            if len(header) != 3:  # "<spec> missing" / "ambiguous"
+                continue
+            size = int(header[2])
+            content = process.stdout.read(size + 1)[:size]  # 内容后跟一个换行
+            if header[1] == b'blob':
+                blobs[spec] = content
+        process.stdin.close()
+    return blobs
+
+
+
+def init_history_worker(blobs, levels, sensor_aliases=None, slide_shapes=None, ignored_flags=None, time_tolerance_ms=None):
+
+    HISTORY_STATE['blobs'] = blobs
+    HISTORY_STATE['levels'] = levels
+    HISTORY_STATE['entries'] = {}
+    set_normalization_rules(sensor_aliases, slide_shapes, ignored_flags, time_tolerance_ms)
+
+
+
+def history_entries(oid):
+
+    # 每个blob在每个进程中只解析一次, 内容相同的版本共用同一个oid
+    entries = HISTORY_STATE['entries']
+    if oid not in entries:
+        if oid is None:
+            entries[oid] = {}
+        else:
+            try:
+                entries[oid] = translate_inotes(read_inotes_from_text(HISTORY_STATE['blobs'][oid], HISTORY_STATE['levels']))
+            except MaidataError as e:
+                entries[oid] = e
+    return entries[oid]
+
+
+
+def history_diff_pair(task):
+
+    # 返回 (commit, [DiffResult]) 或 (commit, 错误信息)
+    commit, oid1, oid2, timeline = task
+    entries1 = history_entries(oid1)
+    entries2 = history_entries(oid2)
+    for entries in (entries1, entries2):
+        if isinstance(entries, MaidataError):
+            return commit, str(entries)
+    try:
+        return commit, diff_entries(entries1, entries2, HISTORY_STATE['levels'], timeline)
+    except Exception as e:
+        return commit, f"history error: {type(e).__name__}: {e}"
+
+
+
+def history_diff(repo, path, rev_range='HEAD', levels=None, timeline='delay', base=None, jobs=None):
+
+    # 返回 [(commit, subject, results)], results为 [DiffResult] 或错误信息
+    # 默认每个提交与其父提交中的版本比较, 提供base时都与base中的版本比较
+    revisions = git_file_revisions(repo, path, rev_range)
+    specs = {oid for revision in revisions for oid in revision[2:] if oid is not None}
+    if base is not None:
+        base_spec = f"{base}:{path}"
+        specs.add(base_spec)
+    blobs = read_git_blobs(repo, sorted(specs))
+    if base is not None:
+        base_oid = base_spec if base_spec in blobs else None
+        tasks = [(commit, base_oid, new_oid, timeline) for commit, _, _, new_oid in revisions]
+    else:
+        tasks = [(commit, old_oid, new_oid, timeline) for commit, _, old_oid, new_oid in revisions]
+
+    rules = normalization_rule_values()
+    if jobs == 1 or len(tasks) <= 1:
+        init_history_worker(blobs, levels, *rules)
+        results = [history_diff_pair(task) for task in tasks]
+    else:
+        # 相邻的提交分到同一进程, 前一个提交的新版本就是后一个提交的旧版本, 不必重复解析
+        jobs = jobs or os.cpu_count() or 1
+        chunksize = max(1, len(tasks) // jobs)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=init_history_worker, initargs=(blobs, levels, *rules)) as executor:
+            results = list(executor.map(history_diff_pair, tasks, chunksize=chunksize))
+    return [(commit, subject, result) for (commit, subject, _, _), (_, result) in zip(revisions, results)]
+
+
+
+def format_history_report(history, full=False):
+
+    report = []
+    changed = 0
+    for commit, subject, results in history:
+        report.append(f"{commit[:10]} {subject}\n")
+        if isinstance(results, str):
+            report.append(f"  {results}\n")
+            continue
+        results = [result for result in results if not result.identical]
+        if results:
+            changed += 1
+        elif not full:
+            report.append("  no note changes\n")
+        for result in results:
+            if full:
+                report.append(f"===== inote_{result.level} =====\n{result.render()}\n")
+            elif result.missing:
+                report.append(f"  inote_{result.level}: {'added' if result.missing == 1 else 'removed'}\n")
+            elif result.error is not None:
+                report.append(f"  inote_{result.level}: {result.error}\n")
+            else:
+                report.append(f"  inote_{result.level}: {result.diff_count} diff(s) in {len(result.groups)} group(s)\n")
+                for group in result.groups:
+                    for diff in group.diffs:
+                        report.append(f"    line {group.line2}: {diff.note1} -> {diff.note2}\n")
+    report.append(f"Commits: {len(history)}, with note changes: {changed}\n")
+    return ''.join(report)
+
+
+
+def history_main(argv):
+
+    args = parse_history_args(argv)
+    levels = [args.lv] if args.lv else None
+    try:
+        history = history_diff(args.repo, args.path, args.range, levels, args.timeline, args.base, args.jobs)
+    except MaidataError as e:
+        print(e)
+        sys.exit(1)
+    report = format_history_report(history, args.full)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"Report written to {args.output}")
+    else:
+        print(report, end='')
+
+
+
+MANY_STATE = {'reference': None, 'levels': None}  # many子进程共享的参考谱面, fork时直接继承父进程内存
+
+
+
+def parse_many_args(argv):
+
+    parser = argparse.ArgumentParser(prog='main.py many', description='Diff one reference chart against many candidate charts')
+    parser.add_argument('reference', type=str, help='Reference txt')
+    parser.add_argument('candidates', nargs='+', help='Candidate txt files or glob patterns')
+    parser.add_argument('-lv', type=int, choices=range(2, 8), help='inote level (2-7), default all levels')
+    parser.add_argument('--full', action='store_true', help='Print the full diff report of every candidate before the summary')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Worker processes (default cpu count)')
+    parser.add_argument('-o', '--output', type=str, help='Write report to file instead of stdout')
+    parser.add_argument('--timeline', choices=['delay', 'tick', 'time'], help='See main.py -h')
+    add_note_rule_args(parser)
+    args = parser.parse_args(argv)
+    apply_note_rule_args(args)
+
+    candidates = []
+    try:
+        if not chart_exists(args.reference):
+            print(f"args error: reference not exist")
+            sys.exit(1)
+        for pattern in args.candidates:
+            # 展开shell未展开的glob (例如Windows), 不匹配时按原路径处理, 在结果中报告错误
+            candidates.extend(expand_chart_pattern(pattern) if glob.has_magic(pattern) else [pattern])
+    except MaidataError as e:
+        print(f"args error: {e}")
+        sys.exit(1)
+    if not candidates:
+        print(f"args error: no candidate matched")
+        sys.exit(1)
+    args.candidates = list(dict.fromkeys(candidates))
+    return args
+
+
+
+def init_many_worker(reference, levels, sensor_aliases=None, slide_shapes=None, ignored_flags=None, time_tolerance_ms=None):
+
+    # 不支持fork的平台: 参考谱面在每个子进程初始化时传入一次
+    MANY_STATE['reference'] = reference
+    MANY_STATE['levels'] = levels
+    set_normalization_rules(sensor_aliases, slide_shapes, ignored_flags, time_tolerance_ms)
+
+
+
+def many_diff_candidate(task):
+
+    # 返回 (path, diff_count, first_line, report), 出错时diff_count为None
+    # first_line: 候选谱面中第一处差异的行号, 没有差异或inote缺失时为None
+    path, timeline = task
+    reference = MANY_STATE['reference']
+    levels = MANY_STATE['levels']
+    try:
+        entries = load_inotes(path, levels)
+        results = diff_entries(reference, entries, levels, timeline)
+    except Exception as e:
+        return path, None, None, f"many error: {type(e).__name__}: {e}\n"
+    lines = [result.groups[0].line2 for result in results if result.groups]
+    report = format_level_results(results)
+    return path, sum(result.diff_count for result in results), min(lines, default=None), report
+
+
+
+def many_diff(reference, candidates, levels=None, timeline='delay', jobs=None):
+
+    # 参考谱面只读取和解析一次, 候选谱面并行比较; 返回按diff数排序的 [(path, diff_count, first_line, report)]
+    MANY_STATE['reference'] = load_inotes(reference, levels)
+    MANY_STATE['levels'] = levels
+    tasks = [(path, timeline) for path in candidates]
+
+    if jobs == 1 or len(tasks) <= 1:
+        results = [many_diff_candidate(task) for task in tasks]
+    else:
+        jobs = jobs or os.cpu_count() or 1
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        if 'fork' in multiprocessing.get_all_start_methods():
+            # fork的子进程与父进程共享 (写时复制) 已解析的参考谱面, 不需要序列化
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork'))
+        else:
+            rules = normalization_rule_values()
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=init_many_worker,
+                                                              initargs=(MANY_STATE['reference'], levels, *rules))
+        with executor:
+            results = list(executor.map(many_diff_candidate, tasks, chunksize=chunksize))
+    return sorted(results, key=lambda result: (result[1] is None, result[1] or 0, result[0]))
+
+
+
+def format_many_report(results, full=False):
+
+    report = []
+    if full:
+        for path, diff_count, first_line, candidate_report in results:
+            report.append(f"########## {path} ##########\n")
+            report.append(candidate_report)
+            report.append("\n")
+
+    report.append("########## Summary ##########\n")
+    report.append(f"{'rank':>4}  {'diffs':>6}  {'first line':>10}  candidate\n")
+    for rank, (path, diff_count, first_line, candidate_report) in enumerate(results, 1):
+        diffs = 'error' if diff_count is None else diff_count
+        line = '-' if first_line is None else first_line
+        report.append(f"{rank:>4}  {diffs:>6}  {line:>10}  {path}\n")
+        if diff_count is None and not full:
+            report.append(f"      {candidate_report}")
+    return ''.join(report)
+
+
+
+def many_main(argv):
+
+    args = parse_many_args(argv)
+    levels = [args.lv] if args.lv else None
+    try:
+        results = many_diff(args.reference, args.candidates, levels, args.timeline, args.jobs)
+    except MaidataError as e:
+        print(e)
+        sys.exit(1)
+    report = format_many_report(results, args.full)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"Report written to {args.output}")
+    else:
+        print(report, end='')
+
+
+
+SERVE_MAX_CHARTS = 64
+
+
+
+class ChartStore:
+
+    # serve使用的内存LRU: 解析后的谱面 {level: (inote, translated)}
+    # 文件按 (路径, mtime, 大小) 查找, 内联文本按内容hash查找
+    # 解析在锁内进行, 同一个谱面不会被两个请求同时解析; 比较只读取, 可在多个线程中同时进行
+    __slots__ = ('max_charts', 'charts', 'lock', 'hits', 'misses')
+
+    def __init__(self, max_charts=SERVE_MAX_CHARTS):
+        self.max_charts = max_charts
+        self.charts = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, path=None, text=None):
+        if text is not None:
+            content = text.encode('utf-8') if isinstance(text, str) else text
+            key = ('text', hashlib.sha256(content).hexdigest())
+        else:
+            try:
+                key = ('path', os.path.abspath(path), chart_stamp(path))
+            except OSError as e:
+                raise MaidataError(f"serve error: cannot read {path}: {e.strerror}") from None
+        with self.lock:
+            entries = self.charts.get(key)
+            if entries is not None:
+                self.hits += 1
+                self.charts.move_to_end(key)
+                return entries
+            self.misses += 1
+            if text is not None:
+                entries = translate_inotes(read_inotes_from_text(content))
+            else:
+                entries = load_inotes(path)
+            self.charts[key] = entries
+            while len(self.charts) > self.max_charts:
+                self.charts.popitem(last=False)
+            return entries
+
+    def stats(self):
+        with self.lock:
+            return {'charts': len(self.charts), 'max_charts': self.max_charts, 'hits': self.hits, 'misses': self.misses}
+
+
+
+def result_to_dict(result):
+
+    # DiffResult -> JSON, groups与format_error_group输出的内容相同
+    data = asdict(result)
+    data['diff_count'] = result.diff_count
+    return data
+
+
+
+class DiffServer:
+
+    # JSON-RPC 2.0方法: diff, stats, ping; 请求为数组时作为批处理, 在线程池中同时执行
+    __slots__ = ('store', 'executor')
+
+    def __init__(self, max_charts=SERVE_MAX_CHARTS, jobs=None):
+        self.store = ChartStore(max_charts)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1)
+
+    def rpc_diff(self, txt1=None, txt2=None, text1=None, text2=None, level=None, levels=None, timeline='delay'):
+        # 两边各用路径 (txt) 或谱面内容 (text); level为单个难度, 都不提供时比较所有难度
+        if (txt1 is None) == (text1 is None) or (txt2 is None) == (text2 is None):
+            raise ValueError("need txt1 or text1, and txt2 or text2")
+        if timeline not in ('delay', 'tick', 'time'):
+            raise ValueError(f"invalid timeline: {timeline}")
+        if level is not None:
+            levels = [level]
+        entries1 = self.store.load(txt1, text1)
+        entries2 = self.store.load(txt2, text2)
+        results = diff_entries(entries1, entries2, levels, timeline)
+        return {'diff_count': sum(result.diff_count for result in results),
+                'results': [result_to_dict(result) for result in results]}
+
+    def rpc_stats(self):
+        return self.store.stats()
+
+    def rpc_ping(self):
+        return 'pong'
+
+    def handle(self, request):
+        # 单个JSON-RPC请求 -> 响应 (通知返回None)
+        if not isinstance(request, dict) or request.get('jsonrpc') != '2.0' or not isinstance(request.get('method'), str):
+            return {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'Invalid Request'}}
+        request_id = request.get('id')
+        method = getattr(self, 'rpc_' + request['method'], None)
+        params = request.get('params', {})
+        try:
+            if method is None:
+                error = {'code': -32601, 'message': f"Method not found: {request['method']}"}
+            elif not isinstance(params, (dict, list)):
+                error = {'code': -32602, 'message': 'Invalid params'}
+            else:
+                result = method(**params) if isinstance(params, dict) else method(*params)
+                error = None
+        except (TypeError, ValueError) as e:
+            error = {'code': -32602, 'message': f"Invalid params: {e}"}
+        except MaidataError as e:
+            error = {'code': 1, 'message': str(e)}
+        except Exception as e:
+            error = {'code': -32603, 'message': f"{type(e).__name__}: {e}"}
+        if 'id' not in request:
+            return None
+        if error is not None:
+            return {'jsonrpc': '2.0', 'id': request_id, 'error': error}
+        return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+
+    def handle_body(self, body):
+        # 返回响应的JSON文本, 没有需要返回的内容时为None
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return json.dumps({'jsonrpc': '2.0', 'id': None, 'error': {'code': -32700, 'message': 'Parse error'}})
+        if isinstance(payload, list):
+            if not payload:
+                return json.dumps({'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'Invalid Request'}})
+            responses = [response for response in self.executor.map(self.handle, payload) if response is not None]
+            return json.dumps(responses, ensure_ascii=False) if responses else None
+        response = self.handle(payload)
+        return None if response is None else json.dumps(response, ensure_ascii=False)
+
+    def make_server(self, host='127.0.0.1', port=8765):
+        diff_server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                response = diff_server.handle_body(body)
+                data = b'' if response is None else response.encode('utf-8')
+                self.send_response(200 if data else 204)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return http.server.ThreadingHTTPServer((host, port), Handler)
+
+
+
+class DiffClient:
+
+    # serve的最小客户端, 用于脚本和测试
+    __slots__ = ('url', 'timeout', 'next_id')
+
+    def __init__(self, url='http://127.0.0.1:8765', timeout=60):
+        self.url = url
+        self.timeout = timeout
+        self.next_id = 0
+
+    def post(self, payload):
+        request = urllib.request.Request(self.url, json.dumps(payload).encode('utf-8'), {'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = response.read()
+        return json.loads(data) if data else None
+
+    def request(self, method, params=None):
+        self.next_id += 1
+        return {'jsonrpc': '2.0', 'id': self.next_id, 'method': method, 'params': params or {}}
+
+    def call(self, method, **params):
+        # 出错时抛出MaidataError, 信息为服务器返回的message
+        response = self.post(self.request(method, params))
+        if 'error' in response:
+            raise MaidataError(response['error']['message'])
+        return response['result']
+
+    def batch(self, calls):
+        # calls: [(method, params)], 按顺序返回result或 {'error': ...}
+        requests = [self.request(method, params) for method, params in calls]
+        responses = {response['id']: response for response in self.post(requests)}
+        return [responses[request['id']].get('result', responses[request['id']]) for request in requests]
+
+
+
+def parse_serve_args(argv):
+
+    parser = argparse.ArgumentParser(prog='main.py serve', description='Run a local JSON-RPC diff server that keeps parsed charts in memory')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Listen address (default 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Listen port (default 8765, 0 for any free port)')
+    parser.add_argument('--max-charts', type=int, default=SERVE_MAX_CHARTS, help=f'Parsed charts kept in memory (default {SERVE_MAX_CHARTS})')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Threads for batch requests (default cpu count)')
+    add_note_rule_args(parser)
+    args = parser.parse_args(argv)
+    apply_note_rule_args(args)
+    if args.max_charts < 1:
+        print(f"args error: --max-charts must be at least 1")
+        sys.exit(1)
+    return args
+
+
+
+def serve_main(argv):
+
+    args = parse_serve_args(argv)
+    diff_server = DiffServer(args.max_charts, args.jobs)
+    server = diff_server.make_server(args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"Serving on http://{host}:{port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        diff_server.executor.shutdown()
+
+
+
 def main():
 
-    lv, txt1, txt2 = parse_args()
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        batch_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'history':
+        history_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'many':
+        many_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve_main(sys.argv[2:])
+        return
+
+    args = parse_args()
+    if args.watch:
+        try:
+            watch_diff(args.txt1, args.txt2, args.lv, args.timeline, args.watch_interval)
+        except KeyboardInterrupt:
+            pass
+        return
+    cache = None if args.no_cache else ParseCache(args.cache_dir)
+    profiler = Profiler(trace_memory=True) if args.profile or args.stats_json else None
+    if profiler is not None:
+        profiler.start()
+
+    if args.fail_fast:
+        args.max_groups = 1
+    if args.quiet:
+        args.max_diffs = 1
+    streaming = (profiler is None or args.format != 'text' or args.quiet or args.window is not None or
+                 args.max_groups is not None or args.max_diffs is not None)
 
-    inote1_raw, start_line1, line_mapping1 = get_inote(lv, txt1, 1)
-    inote2_raw, start_line2, line_mapping2 = get_inote(lv, txt2, 2)
-    inote1_trans = translate_inote(inote1_raw)
-    inote2_trans = translate_inote(inote2_raw)
-    compare_inotes(inote1_trans, inote2_trans, inote1_raw, inote2_raw, start_line1, start_line2, txt1, txt2, line_mapping1, line_mapping2)
+    try:
+        if streaming:
+            if args.all_levels:
+                entries1 = load_inotes(args.txt1, None, cache, profiler, args.parallel_translate)
+                entries2 = load_inotes(args.txt2, None, cache, profiler, args.parallel_translate)
+                levels = None
+            else:
+                entries1 = {str(args.lv): get_loaded_inote(load_inotes(args.txt1, [args.lv], cache, profiler, args.parallel_translate), args.lv, 1)}
+                entries2 = {str(args.lv): get_loaded_inote(load_inotes(args.txt2, [args.lv], cache, profiler, args.parallel_translate), args.lv, 2)}
+                levels = [args.lv]
+            output = open(os.devnull, 'w') if args.quiet else sys.stdout
+            with profile_stage(profiler, 'stream'):
+                diff_count, error_count, _ = stream_levels(entries1, entries2, levels, args.timeline, output, args.format,
+                                                           args.max_groups, args.max_diffs, args.all_levels, args.window, profiler)
+            if args.quiet:
+                output.close()
+            report = ''
+        elif args.all_levels:
+            _, report = diff_levels(args.txt1, args.txt2, None, args.timeline, cache, profiler, args.parallel_translate)
+        else:
+            entry1 = get_loaded_inote(load_inotes(args.txt1, [args.lv], cache, profiler, args.parallel_translate), args.lv, 1)
+            entry2 = get_loaded_inote(load_inotes(args.txt2, [args.lv], cache, profiler, args.parallel_translate), args.lv, 2)
+            result = diff_translated(entry1, entry2, args.timeline, args.lv, None, profiler)
+            with profile_stage(profiler, 'render'):
+                report = result.render()
+    except MaidataError as e:
+        if args.quiet:
+            pass
+        elif args.format == 'jsonl':
+            print(json.dumps({'type': 'error', 'message': str(e)}, ensure_ascii=False))
+        else:
+            print(e)
+        sys.exit(1)
+    print(report, end='')
+    # jsonl: 标准输出中每行都是一个JSON对象, 缓存和--stats-json -的统计也作为记录输出
+    if cache is not None and args.cache_stats and not args.quiet:
+        if args.format == 'jsonl':
+            print(json.dumps({'type': 'cache', 'hits': cache.hits, 'misses': cache.misses, 'cache_dir': cache.cache_dir}, ensure_ascii=False))
+        else:
+            print(cache.stats_str())
+
+    if profiler is not None:
+        profiler.stop()
+        if cache is not None:
+            profiler.count('cache_hits', cache.hits)
+            profiler.count('cache_misses', cache.misses)
+        if args.profile:
+            sys.stderr.write(profiler.format())
+        if args.stats_json:
+            stats = {'txt1': args.txt1, 'txt2': args.txt2, 'level': args.lv, 'timeline': args.timeline}
+            stats.update(profiler.to_dict())
+            if args.stats_json == '-' and args.format == 'jsonl':
+                print(json.dumps({'type': 'stats', **stats}, ensure_ascii=False))
+            elif args.stats_json == '-':
+                print(json.dumps(stats, indent=2))
+            else:
+                with open(args.stats_json, 'w', encoding='utf-8') as f:
+                    json.dump(stats, f, indent=2)
+
+    if (args.quiet or args.fail_fast) and (diff_count or error_count):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+import benchmark
+import main
+
+
+def translate_pair(segment_count, density, seed):
+    base = benchmark.make_inote(segment_count, seed)
+    other, _ = benchmark.inject_edits(base, density, seed + 1)
+    table1, offsets1 = main.translate_inote(base)
+    table2, offsets2 = main.translate_inote(other)
+    return table1, table2, offsets1, offsets2
+
+
+@pytest.mark.parametrize('seed', range(12))
+def test_chunked_alignment_ignores_key_numbering(seed):
+    # 中间不同部分超过CHUNKED_DIFF_MIN时走分块锚点, 结果不能取决于key_ids的编号顺序
+    # (--watch共享key_ids, 之前出现过的键会改变编号)
+    table1, table2, offsets1, offsets2 = translate_pair(3000, 0.1, seed * 7)
+    assert min(len(table1), len(table2)) > main.CHUNKED_DIFF_MIN
+    expected = main.compare_inotes(table1, table2, offsets1, offsets2)
+    key_ids = {('seeded', k): k for k in range(97 * (seed + 1))}
+    keys2 = main.get_alignment_keys(table2, key_ids)  # 反过来先给第二个谱面编号
+    keys1 = main.get_alignment_keys(table1, key_ids)
+    assert main.compare_inotes(table1, table2, offsets1, offsets2, (keys1, keys2)) == expected
+
+
+@pytest.mark.parametrize('seed', range(12))
+def test_chunked_alignment_numpy_parity(seed, monkeypatch):
+    np = pytest.importorskip('numpy')
+    table1, table2, offsets1, offsets2 = translate_pair(3000, 0.1, seed * 7)
+    assert min(len(table1), len(table2)) > main.CHUNKED_DIFF_MIN
+    monkeypatch.setattr(main, 'np', np)
+    vectorized = main.compare_inotes(table1, table2, offsets1, offsets2)
+    monkeypatch.setattr(main, 'np', None)
+    assert main.compare_inotes(table1, table2, offsets1, offsets2) == vectorized
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_compare_inotes_numpy_parity(seed, monkeypatch):
+    # 向量化的键编码/前后缀裁剪与纯Python路径结果相同, 包括规范化后相同的写法
+    np = pytest.importorskip('numpy')
+    rng = random.Random(seed)
+    spellings = ['1c1', 'C1', '1xh[4:1]', '1hx[4:1]', '5/c1', '1/2', '3/4/5', '']
+    for _ in range(100):
+        base = benchmark.make_inote(rng.choice([0, 1, 3, 20, 200]), rng.randint(0, 10 ** 6))
+        other, _ = benchmark.inject_edits(base, rng.choice([0, 0.01, 0.1, 0.5, 1.0]), rng.randint(0, 99))
+        if rng.random() < 0.3:
+            segments = other.split(',')
+            for _ in range(5):
+                if len(segments) > 2:
+                    segments[rng.randrange(1, len(segments) - 1)] = rng.choice(spellings)
+            other = ','.join(segments)
+        table1, offsets1 = main.translate_inote(base)
+        table2, offsets2 = main.translate_inote(other)
+        monkeypatch.setattr(main, 'np', np)
+        vectorized = main.compare_inotes(table1, table2, offsets1, offsets2)
+        keys1, keys2 = main.get_alignment_keys_numpy(table1, table2)
+        assert main.diff_key_arrays(keys1, keys2) == main.diff_sequences(keys1.tolist(), keys2.tolist())
+        monkeypatch.setattr(main, 'np', None)
+        assert main.compare_inotes(table1, table2, offsets1, offsets2) == vectorized, (base, other)
@@ -0,0 +1,86 @@
+import concurrent.futures
+import random
+import sys
+
+import pytest
+
+import main
+
+
+def unique_note(rng, k):
+    # 每个note的写法都不同, 使每次比较都要向全局池中添加新的info
+    path = ''.join(rng.choice('-^vpqszw') + str(rng.randint(1, 8)) for _ in range(3))
+    return f"{rng.randint(1, 8)}{path}[{k % 7 + 1}:1]"
+
+
+def unique_chart_pair(seed):
+    rng = random.Random(seed)
+    notes = [unique_note(rng, k) for k in range(200)]
+    edited = [note if rng.random() < 0.9 else unique_note(rng, -1) for note in notes]
+    return [f"&title={seed}\n&inote_5=(120){{8}}{','.join(chart)},E\n" for chart in (notes, edited)]
+
+
+def test_diff_charts_threads_match_serial(monkeypatch):
+    # 多个线程同时调用库接口 (并发写入全局字符串池), 结果与串行调用相同
+    for name in ('INFO_POOL', 'INFO_KEYS', 'NOTE_KEYS', 'NOTE_KEY_DIGESTS'):
+        monkeypatch.setattr(main, name, [])
+    for name in ('INFO_IDS', 'NOTE_KEY_IDS'):
+        monkeypatch.setattr(main, name, {})
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        pairs = [unique_chart_pair(seed) for seed in range(16)]
+        with concurrent.futures.ThreadPoolExecutor(8) as pool:
+            threaded = list(pool.map(lambda pair: main.diff_charts(*pair, 5), pairs))
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert len(main.INFO_POOL) == len(main.INFO_IDS) == len(main.INFO_KEYS)
+    assert all(main.INFO_IDS[info] == info_id for info_id, info in enumerate(main.INFO_POOL))
+    assert threaded == [main.diff_charts(*pair, 5) for pair in pairs]
+
+
+CHART1 = '&title=x\n&inote_5=(120){4}1,2,\n3,E\n&inote_4=(120){4}1,E\n&inote_3=(120){x}1,E\n'
+CHART2 = '&title=x\n&inote_5=(120){4}1,5,\n3,4,E\n&inote_3=(120){x}1,E\n&inote_2=(120){4}1,E\n'
+
+
+def test_diff_charts_result_shape():
+    result = main.diff_charts(CHART1, CHART2, 5)
+    assert isinstance(result, main.DiffResult)
+    assert (result.level, result.warnings, result.missing, result.error) == ('5', [], None, None)
+    [group] = result.groups
+    assert isinstance(group, main.ErrorGroup)
+    assert (group.line1, group.line2) == (2, 2)
+    assert (group.context1, group.markers1) == ('(120){4}1,2,3,E', '          ^ ^  ')
+    assert (group.context2, group.markers2) == ('(120){4}1,5,3,4,E', '          ^ ^ ^  ')
+    assert all(isinstance(diff, main.NoteDiff) for diff in group.diffs)
+    assert [(diff.diff_index, diff.segment1, diff.segment2) for diff in group.diffs] == [(2, 1, 1), (3, 2, 2), (4, -1, 3)]
+    assert group.diffs[0].note1 == "'2': bpm-120.0, delay-1/4"
+    assert group.diffs[0].note2 == "'5': bpm-120.0, delay-1/4"
+    # txt1中缺少的note为None
+    assert group.diffs[2].note1 is None and group.diffs[2].note2 == "'4': bpm-120.0, delay-0"
+    assert result.diff_count == 3
+    assert main.diff_charts(CHART1.encode(), CHART2.encode(), 5) == result
+    assert main.diff_charts(CHART1, CHART1, 5) == main.DiffResult('5')
+
+
+def test_diff_charts_errors():
+    with pytest.raises(main.InoteNotFoundError) as info:
+        main.diff_charts(CHART1, CHART2, 4)
+    assert (info.value.level, info.value.source) == (4, 2)
+    with pytest.raises(main.InoteNotFoundError) as info:
+        main.diff_charts(CHART1, CHART2, 2)
+    assert (info.value.level, info.value.source) == (2, 1)
+    with pytest.raises(main.ChartParseError, match="Invalid length 'x'"):
+        main.diff_charts(CHART1, CHART2, 3)
+    assert issubclass(main.InoteNotFoundError, main.MaidataError)
+    assert issubclass(main.ChartParseError, main.MaidataError)
+
+
+def test_diff_charts_all_levels():
+    # 缺失和解析失败的inote记录在结果中, 不抛出异常
+    results = main.diff_charts_all_levels(CHART1, CHART2)
+    assert [(result.level, result.missing, result.diff_count) for result in results] == [
+        ('2', 1, 1), ('3', None, 0), ('4', 2, 1), ('5', None, 3)]
+    assert results[1].error.endswith("Invalid length 'x' at note 0")
+    assert results[3] == main.diff_charts(CHART1, CHART2, 5)
+    assert [result.level for result in main.diff_charts_all_levels(CHART1, CHART2, [5, 4])] == ['5', '4']
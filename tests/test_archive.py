@@ -0,0 +1,82 @@
+import os
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+import main
+
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+CHARTS = {
+    'song1': ('&inote_5=(120){4}1,2,3,E\n', '&inote_5=(120){4}1,4,3,E\n'),
+    'song2': ('&inote_4=(120){4}1,E\n&inote_5=(120){8}1,,2,E\n', '&inote_4=(120){4}1,E\n&inote_5=(120){8}1,,2,E\n'),
+    'song3': ('&inote_5=(120){4}5,E\n', None),
+}
+
+
+def block_summary(blocks):
+    return {level: (raw, start_line, list(line_mapping.starts), list(line_mapping.lines))
+            for level, (raw, start_line, line_mapping) in blocks.items()}
+
+
+def run_main(*args):
+    return subprocess.run([sys.executable, MAIN, *args], capture_output=True, text=True, encoding='utf-8')
+
+
+def write_tree(root, side, prefix=''):
+    # side 0/1: CHARTS中的第一/二个版本; 同时写出目录和zip (成员路径加上prefix)
+    with zipfile.ZipFile(f"{root}.zip", 'w', zipfile.ZIP_DEFLATED) as pack:
+        for song, texts in CHARTS.items():
+            if texts[side] is None:
+                continue
+            os.makedirs(os.path.join(root, song))
+            with open(os.path.join(root, song, 'maidata.txt'), 'w', encoding='utf-8') as f:
+                f.write(texts[side])
+            pack.writestr(f"{prefix}{song}/maidata.txt", texts[side])
+    return str(root), f"{root}.zip"
+
+
+def test_zip_member_against_plain_file(tmp_path):
+    dir1, zip1 = write_tree(tmp_path / 'a', 0)
+    dir2, _ = write_tree(tmp_path / 'b', 1)
+    member = f"{zip1}!/song1/maidata.txt"
+    plain1 = os.path.join(dir1, 'song1', 'maidata.txt')
+    plain2 = os.path.join(dir2, 'song1', 'maidata.txt')
+    assert block_summary(main.read_inotes(member)) == block_summary(main.read_inotes(plain1))
+    assert block_summary(main.read_inotes(member, ['5'])) == block_summary(main.read_inotes(plain1, ['5']))
+    expected = run_main('5', plain1, plain2, '--no-cache')
+    assert expected.stdout.count('Error group') == 1
+    for args in ([member, plain2], [member, plain2, '--cache-dir', str(tmp_path / 'cache')]):
+        result = run_main('5', *args)
+        assert (result.returncode, result.stdout) == (0, expected.stdout)
+
+
+def test_missing_member(tmp_path):
+    _, zip1 = write_tree(tmp_path / 'a', 0)
+    missing = f"{zip1}!/song9/maidata.txt"
+    assert not main.chart_exists(missing)
+    with pytest.raises(FileNotFoundError):
+        main.read_inotes(missing)
+    result = run_main('5', missing, f"{zip1}!/song1/maidata.txt")
+    assert (result.returncode, result.stdout) == (1, "args error: txt1 not exist\n")
+    (tmp_path / 'bad.zip').write_bytes(b'not a zip')
+    result = run_main('5', f"{tmp_path / 'bad.zip'}!/song1/maidata.txt", missing)
+    assert result.returncode == 1 and result.stdout.startswith('args error: archive error:')
+
+
+@pytest.mark.parametrize('pair_by', ['path', 'folder'])
+def test_batch_zip_against_zip(tmp_path, pair_by):
+    # zip与zip配对的结果与解压后的目录相同, 包括 pack.zip!/subdir 形式的根目录
+    dir1, zip1 = write_tree(tmp_path / 'a', 0)
+    dir2, zip2 = write_tree(tmp_path / 'b', 1, prefix='pack/')
+    expected = main.batch_diff(dir1, dir2, pair_by=pair_by, jobs=1)
+    results, only1, only2 = main.batch_diff(zip1, f"{zip2}!/pack", pair_by=pair_by, jobs=1)
+    assert (results, only1, only2) == expected
+    keys = ['song1', 'song2'] if pair_by == 'folder' else ['song1/maidata.txt', 'song2/maidata.txt']
+    assert [(key, diff_count) for key, diff_count, _ in results] == list(zip(keys, [1, 0]))
+    assert only1 == [keys[0].replace('song1', 'song3')] and only2 == []
+    assert main.batch_diff(zip1, f"{zip2}!/pack", pair_by=pair_by, jobs=2) == expected
+    # 前缀不对时没有可以配对的谱面
+    assert main.batch_diff(zip1, zip2, pair_by='path', jobs=1)[0] == []
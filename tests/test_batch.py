@@ -0,0 +1,91 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import main
+
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+TREE1 = {
+    'pop/song1/maidata.txt': '&inote_5=(120){4}1,2,3,E\n',
+    'pop/song2/maidata.txt': '&inote_4=(120){4}1,E\n&inote_5=(120){4}1,E\n',
+    'game/song3/maidata.txt': '&inote_5=(120){4}1,2,E\n',
+    'game/song4/maidata.txt': '&inote_5=(120){4}1,E\n',
+    'game/song4/other.txt': '&inote_5=(120){4}8,E\n',
+}
+TREE2 = {
+    'pop/song1/maidata.txt': '&inote_5=(120){4}1,4,3,E\n',
+    'pop/song2/maidata.txt': '&inote_4=(120){4}1,E\n&inote_5=(120){4}1,E\n',
+    'game/song3/maidata.txt': b'&inote_5=(120){4}\xff1,E\n',  # 无法解码, 整个文件失败
+    'moved/song4/maidata.txt': '&inote_5=(120){4}2,E\n',
+}
+
+
+def write_tree(root, files):
+    for name, text in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(text, str):
+            text = text.encode('utf-8')
+        path.write_bytes(text)
+    return str(root)
+
+
+@pytest.fixture
+def trees(tmp_path):
+    return write_tree(tmp_path / 'a', TREE1), write_tree(tmp_path / 'b', TREE2)
+
+
+def test_pair_by_path(trees):
+    dir1, dir2 = trees
+    results, only1, only2 = main.batch_diff(dir1, dir2, jobs=1)
+    assert [(key, diff_count) for key, diff_count, _ in results] == [
+        ('game/song3/maidata.txt', None), ('pop/song1/maidata.txt', 1), ('pop/song2/maidata.txt', 0)]
+    assert only1 == ['game/song4/maidata.txt'] and only2 == ['moved/song4/maidata.txt']
+    assert results[0][2].startswith('batch error: UnicodeDecodeError:')
+    # 每一对的报告与单独比较相同
+    for key, diff_count, report in results[1:]:
+        assert (diff_count, report) == main.diff_levels(os.path.join(dir1, key), os.path.join(dir2, key))
+    assert main.batch_diff(dir1, dir2, jobs=2) == (results, only1, only2)
+
+
+def test_pair_by_folder_and_pattern(trees):
+    dir1, dir2 = trees
+    results, only1, only2 = main.batch_diff(dir1, dir2, levels=[5], pair_by='folder', jobs=1)
+    assert [(key, diff_count) for key, diff_count, _ in results] == [('song1', 1), ('song2', 0), ('song3', None), ('song4', 1)]
+    assert only1 == only2 == []
+    results, only1, only2 = main.batch_diff(dir1, dir2, pair_by='folder', pattern='other.txt', jobs=1)
+    assert results == [] and only1 == ['song4'] and only2 == []
+
+
+def run_batch(*args):
+    return subprocess.run([sys.executable, MAIN, 'batch', *args], capture_output=True, text=True, encoding='utf-8')
+
+
+def test_batch_cli(trees, tmp_path):
+    dir1, dir2 = trees
+    result = run_batch(dir1, dir2, '-j', '1')
+    assert result.returncode == 0
+    summary = result.stdout[result.stdout.index('########## Summary ##########'):]
+    assert summary == ("########## Summary ##########\n"
+                       "Compared: 3, with differences: 1, errors: 1\n"
+                       "  diff   pop/song1/maidata.txt\n"
+                       "  error  game/song3/maidata.txt\n"
+                       "  only in dir1: game/song4/maidata.txt\n"
+                       "  only in dir2: moved/song4/maidata.txt\n")
+    output = tmp_path / 'report.txt'
+    result = run_batch(dir1, dir2, '-o', str(output))
+    assert (result.returncode, result.stdout) == (0, f"Report written to {output}\n")
+    assert output.read_text(encoding='utf-8').endswith(summary)
+
+
+@pytest.mark.parametrize('args, message', [
+    (['missing', '{dir2}'], 'args error: dir1 not exist\n'),
+    (['{dir1}', 'missing'], 'args error: dir2 not exist\n'),
+])
+def test_batch_cli_errors(trees, args, message):
+    dir1, dir2 = trees
+    result = run_batch(*(arg.format(dir1=dir1, dir2=dir2) for arg in args))
+    assert (result.returncode, result.stdout) == (1, message)
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import subprocess
+import sys
+
+import pytest
+
+import main
+
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+CHART = '&title={title}\n&inote_4=(120){{4}}1,2,E\n&inote_5=(120){{4}}1h[4:1],\n2/3,\n(150){{8}}4,,5,E\n'
+
+
+def write_chart(path, title='a'):
+    path.write_text(CHART.format(title=title), encoding='utf-8')
+    return str(path)
+
+
+def content_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def summary(entries):
+    # 缓存读出的结果与解析结果比较: inote原文/行映射, NoteTable各列, segment_offsets
+    result = {}
+    for level, ((raw, start_line, line_mapping), translated) in entries.items():
+        table, offsets = translated
+        result[level] = (raw, start_line, list(line_mapping.starts), list(line_mapping.lines), line_mapping.length,
+                         table.resolution, [main.INFO_POOL[info] for info in table.info], list(table.bpm), list(table.length),
+                         list(table.hold), list(table.seconds), list(table.segment), list(table.group), list(table.group_start),
+                         table.warnings, list(offsets))
+    return result
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return main.ParseCache(str(tmp_path / 'cache'))
+
+
+@pytest.mark.parametrize('levels', [['5'], None])
+def test_miss_then_hit(tmp_path, cache, levels):
+    path = write_chart(tmp_path / 'a.txt')
+    expected = summary(main.load_inotes(path, levels))
+    assert summary(main.load_inotes(path, levels, cache)) == expected
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert summary(main.load_inotes(path, levels, cache)) == expected
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_changed_file_is_a_miss(tmp_path, cache):
+    path = write_chart(tmp_path / 'a.txt')
+    main.load_inotes(path, ['5'], cache)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('&inote_6=(120){4}1,E\n')
+    entries = main.load_inotes(path, None, cache)
+    assert sorted(entries) == ['4', '5', '6'] and cache.misses == 2
+    # 内容改回之后, 之前的条目仍然有效
+    write_chart(tmp_path / 'a.txt')
+    main.load_inotes(path, ['5'], cache)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_parser_version_bump_is_a_miss(tmp_path, cache, monkeypatch):
+    path = write_chart(tmp_path / 'a.txt')
+    main.load_inotes(path, ['5'], cache)
+    monkeypatch.setattr(main, 'PARSER_VERSION', main.PARSER_VERSION + 1)
+    main.load_inotes(path, ['5'], cache)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+@pytest.mark.parametrize('corrupt', ['truncate', 'magic', 'header', 'empty'])
+def test_corrupt_entry_is_reparsed(tmp_path, cache, corrupt):
+    path = write_chart(tmp_path / 'a.txt')
+    expected = summary(main.load_inotes(path, ['5']))
+    main.load_inotes(path, ['5'], cache)
+    entry = cache.entry_path(content_digest(path), '5')
+    data = open(entry, 'rb').read()
+    data = {'truncate': data[:len(data) // 2], 'magic': b'XXXXXXXX' + data[8:],
+            'header': data[:12] + b'}' + data[13:], 'empty': b''}[corrupt]
+    with open(entry, 'wb') as f:
+        f.write(data)
+    assert summary(main.load_inotes(path, ['5'], cache)) == expected
+    assert (cache.hits, cache.misses) == (0, 2)
+    # 重新解析后写回了完整的条目
+    assert summary(main.load_inotes(path, ['5'], cache)) == expected
+    assert cache.hits == 1
+
+
+def test_eviction_keeps_recently_used_entries(tmp_path, cache):
+    paths = [write_chart(tmp_path / f'{title}.txt', title) for title in 'abcd']
+    main.load_inotes(paths[0], ['5'], cache)
+    entry_size = sum(entry.stat().st_size for entry in os.scandir(cache.cache_dir))
+    cache.max_bytes = entry_size * 3
+    for k, path in enumerate(paths[:3]):
+        main.load_inotes(path, ['5'], cache)
+        # mtime的精度可能很粗, 按使用顺序显式设置
+        os.utime(cache.entry_path(content_digest(path), '5'), (1000 + k, 1000 + k))
+    main.load_inotes(paths[0], ['5'], cache)  # 命中时更新mtime, a变为最近使用
+    main.load_inotes(paths[3], ['5'], cache)  # 超出容量, 删除最久未使用的b
+    remaining = os.listdir(cache.cache_dir)
+    assert len(remaining) == 3
+    assert sum(os.path.getsize(os.path.join(cache.cache_dir, name)) for name in remaining) <= cache.max_bytes
+    cache.hits = cache.misses = 0
+    for path in (paths[0], paths[2], paths[3]):
+        main.load_inotes(path, ['5'], cache)
+    assert (cache.hits, cache.misses) == (3, 0)
+    main.load_inotes(paths[1], ['5'], cache)
+    assert cache.misses == 1
+
+
+def test_clear_cache_option(tmp_path, cache):
+    path = write_chart(tmp_path / 'a.txt')
+    main.load_inotes(path, None, cache)
+    count = len(os.listdir(cache.cache_dir))
+    assert count == 3  # 两个难度和难度列表
+    result = subprocess.run([sys.executable, MAIN, '--clear-cache', '--cache-dir', cache.cache_dir],
+                            capture_output=True, text=True, encoding='utf-8')
+    assert result.returncode == 0
+    assert result.stdout == f"Cache cleared: {count} file(s) removed from {cache.cache_dir}\n"
+    assert os.listdir(cache.cache_dir) == []
@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+
+def run_main(*args):
+    return subprocess.run([sys.executable, MAIN, *args], capture_output=True, text=True, encoding='utf-8')
+
+
+@pytest.mark.parametrize('extra', [[], ['--cache-stats'], ['--stats-json', '-'], ['--cache-stats', '--stats-json', '-']])
+def test_jsonl_output_is_one_object_per_line(tmp_path, extra):
+    # --format jsonl时标准输出的每一行都是一个JSON对象, 包括缓存和统计信息
+    txt1 = tmp_path / 'a.txt'
+    txt2 = tmp_path / 'b.txt'
+    txt1.write_text('&inote_5=(120){4}1,2,3,E\n', encoding='utf-8')
+    txt2.write_text('&inote_5=(120){4}1,4,3,E\n', encoding='utf-8')
+    result = run_main('5', str(txt1), str(txt2), '--format', 'jsonl', '--cache-dir', str(tmp_path / 'cache'), *extra)
+    records = [json.loads(line) for line in result.stdout.splitlines()]
+    types = [record['type'] for record in records]
+    assert types[:2] == ['group', 'summary']
+    assert ('cache' in types) == ('--cache-stats' in extra)
+    assert ('stats' in types) == ('--stats-json' in extra)
+
+
+def test_jsonl_reports_errors_as_records(tmp_path):
+    txt = tmp_path / 'a.txt'
+    txt.write_text('&inote_5=(120){4}1,E\n', encoding='utf-8')
+    result = run_main('6', str(txt), str(txt), '--format', 'jsonl', '--no-cache')
+    assert result.returncode == 1
+    assert [json.loads(line) for line in result.stdout.splitlines()] == [{'type': 'error', 'message': 'get_inote error: inote_6 not found in 1'}]
+
+
+@pytest.mark.parametrize('extra', [[], ['--all-levels']])
+def test_stats_counters_match_between_text_and_jsonl(tmp_path, extra):
+    # --stats-json的计数与输出格式无关 (text走分阶段路径, jsonl走流式路径)
+    txt1 = tmp_path / 'a.txt'
+    txt2 = tmp_path / 'b.txt'
+    txt1.write_text('&inote_4=(120){4}1,2,E\n&inote_5=(120){4}1,2,3,4,5,E\n', encoding='utf-8')
+    txt2.write_text('&inote_4=(120){4}1,3,E\n&inote_5=(120){4}1,4,3,,5,E\n', encoding='utf-8')
+    counters = []
+    for fmt in ('text', 'jsonl'):
+        stats = tmp_path / f'{fmt}.json'
+        run_main('5', str(txt1), str(txt2), '--format', fmt, '--no-cache', '--stats-json', str(stats), *extra)
+        counters.append(json.loads(stats.read_text(encoding='utf-8'))['counters'])
+    assert counters[0] == counters[1]
+    assert {'segments', 'notes', 'timeline_groups', 'diffs', 'error_groups'} <= set(counters[0])
@@ -0,0 +1,94 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import main
+
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None, reason='git not installed')
+
+GIT_ENV = {'GIT_AUTHOR_NAME': 't', 'GIT_AUTHOR_EMAIL': 't@t', 'GIT_COMMITTER_NAME': 't', 'GIT_COMMITTER_EMAIL': 't@t',
+           'GIT_CONFIG_GLOBAL': os.devnull, 'GIT_CONFIG_NOSYSTEM': '1'}
+
+
+def git(repo, *args):
+    return subprocess.run(['git', '-C', str(repo), *args], check=True, capture_output=True,
+                          env={**os.environ, **GIT_ENV}).stdout.decode('utf-8').strip()
+
+
+@pytest.fixture
+def repo(tmp_path):
+    # 三个改动谱面的提交 (新增, 修改并删除一个难度, 删除文件), 中间夹一个不相关的提交
+    git(tmp_path, 'init', '-q')
+    chart = tmp_path / 'song' / 'maidata.txt'
+    chart.parent.mkdir()
+    chart.write_text('&title=t\n&inote_4=(120){4}1,2,E\n&inote_5=(120){4}1,2,\n3,4,E\n', encoding='utf-8')
+    git(tmp_path, 'add', '.')
+    git(tmp_path, 'commit', '-q', '-m', 'add chart')
+    (tmp_path / 'README').write_text('x', encoding='utf-8')
+    git(tmp_path, 'add', '.')
+    git(tmp_path, 'commit', '-q', '-m', 'unrelated')
+    chart.write_text('&title=t\n&inote_5=(120){4}1,2,\n3,5,E\n', encoding='utf-8')
+    git(tmp_path, 'commit', '-q', '-am', 'edit chart')
+    git(tmp_path, 'rm', '-q', 'song/maidata.txt')
+    git(tmp_path, 'commit', '-q', '-m', 'remove chart')
+    commits = git(tmp_path, 'log', '--reverse', '--format=%H').split()
+    return tmp_path, [commits[0], commits[2], commits[3]]
+
+
+def test_git_file_revisions(repo):
+    path, commits = repo
+    revisions = main.git_file_revisions(str(path), 'song/maidata.txt')
+    assert [(commit, subject) for commit, subject, _, _ in revisions] == list(zip(commits, ['add chart', 'edit chart', 'remove chart']))
+    assert revisions[0][2] is None and revisions[2][3] is None  # 新增之前/删除之后不存在
+    assert revisions[0][3] == revisions[1][2] and revisions[1][3] == revisions[2][2]
+
+
+def test_read_git_blobs(repo):
+    # 一个cat-file --batch进程读取所有对象, 不存在的对象和非blob (树) 不包含在内
+    path, commits = repo
+    specs = [f'{commits[0]}:song/maidata.txt', f'{commits[2]}:song/maidata.txt', f'{commits[0]}:song', 'HEAD:README']
+    blobs = main.read_git_blobs(str(path), specs)
+    assert sorted(blobs) == sorted([specs[0], specs[3]])
+    assert blobs[specs[0]].startswith(b'&title=t\n&inote_4=') and blobs[specs[3]] == b'x'
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_history_report(repo, jobs):
+    path, commits = repo
+    report = main.format_history_report(main.history_diff(str(path), 'song/maidata.txt', jobs=jobs))
+    assert report == (f"{commits[0][:10]} add chart\n"
+                      "  inote_4: added\n"
+                      "  inote_5: added\n"
+                      f"{commits[1][:10]} edit chart\n"
+                      "  inote_4: removed\n"
+                      "  inote_5: 1 diff(s) in 1 group(s)\n"
+                      "    line 3: '4': bpm-120.0, delay-0 -> '5': bpm-120.0, delay-0\n"
+                      f"{commits[2][:10]} remove chart\n"
+                      "  inote_5: removed\n"
+                      "Commits: 3, with note changes: 3\n")
+
+
+def test_history_against_base(repo):
+    path, commits = repo
+    history = main.history_diff(str(path), 'song/maidata.txt', levels=[4], base=commits[0], jobs=1)
+    assert main.format_history_report(history) == (f"{commits[0][:10]} add chart\n"
+                                                   "  no note changes\n"
+                                                   f"{commits[1][:10]} edit chart\n"
+                                                   "  inote_4: removed\n"
+                                                   f"{commits[2][:10]} remove chart\n"
+                                                   "  inote_4: removed\n"
+                                                   "Commits: 3, with note changes: 2\n")
+    # base中没有该文件时, 每个版本都与空谱面比较; 两边都没有的难度不报告
+    history = main.history_diff(str(path), 'song/maidata.txt', levels=[5], base=commits[2], jobs=1)
+    assert [[result.missing for result in results] for _, _, results in history] == [[1], [1], []]
+    history = main.history_diff(str(path), 'song/maidata.txt', levels=[4], jobs=1)
+    assert [[result.missing for result in results] for _, _, results in history] == [[1], [2], []]
+
+
+def test_history_bad_revision(repo):
+    path, _ = repo
+    with pytest.raises(main.MaidataError, match='git error'):
+        main.history_diff(str(path), 'song/maidata.txt', 'nope..HEAD')
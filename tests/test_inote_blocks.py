@@ -0,0 +1,63 @@
+import io
+import random
+
+import pytest
+
+import main
+
+
+PIECES = ['&inote_5=', '&inote_4=', '&inote_5', '&inote_6=(120){4}1,', '  &inote_4=1,2', '\u3000&inote_3=',
+          '|| &inote_5=', 'x&inote_5=', '&inote_5 =', '\x85&inote_7=', '1,2,3,', '(150){8}', '', '   ',
+          '&title=abc', 'éあ,', '1h[4:1],', 'E']
+
+
+def block_summary(blocks):
+    return {level: (raw, start_line, list(line_mapping.starts), list(line_mapping.lines), line_mapping.length)
+            for level, (raw, start_line, line_mapping) in blocks.items()}
+
+
+def streaming_blocks(text, levels):
+    # 流式读取器的结果 (同 open(txt, encoding='utf-8-sig'))
+    return main.extract_inotes(io.StringIO(text.removeprefix('\ufeff'), newline=None), levels)
+
+
+@pytest.mark.parametrize('chunk', [1, 7, 1 << 16])
+def test_locator_matches_streaming_reader(chunk, monkeypatch):
+    # 随机的 CRLF/CR/LF, BOM, 前导空白, 重复/无效的header和注释行
+    monkeypatch.setattr(main, 'NEWLINE_COUNT_CHUNK', chunk)
+    rng = random.Random(chunk)
+    for _ in range(3000):
+        lines = [rng.choice(PIECES) for _ in range(rng.randint(0, 14))]
+        text = ''.join(line + rng.choice(['\n', '\r\n', '\r']) for line in lines)
+        if rng.random() < 0.3:
+            text = text.rstrip('\r\n')
+        if rng.random() < 0.2:
+            text = '\ufeff' + text
+        levels = rng.sample(['3', '4', '5', '6', '7'], rng.randint(1, 3))
+        expected = block_summary(streaming_blocks(text, levels))
+        assert block_summary(main.locate_inotes(text.encode('utf-8'), levels)) == expected, (text, levels)
+
+
+@pytest.mark.parametrize('mapped', [True, False])
+def test_read_inotes_from_file(tmp_path, mapped):
+    text = '\ufeff&title=x\r\n&inote_4=(120){4}1,\r\n2,E\r\n&inote_5=\r\n(150){8}3,\r4,\n\r\nE\r\n'
+    path = tmp_path / 'maidata.txt'
+    path.write_bytes(text.encode('utf-8'))
+    for levels in (['4'], ['5'], ['5', '4'], ['6']):
+        expected = block_summary(streaming_blocks(text, levels))
+        assert block_summary(main.read_inotes(str(path), levels, mapped)) == expected
+    assert main.get_inote(5, str(path), 1, mapped)[1] == 4
+
+
+@pytest.mark.parametrize('levels', [['5'], ['5', '4'], None])
+def test_cached_load_matches_read_inotes(tmp_path, levels):
+    # 默认CLI路径 (缓存) 对映射计算hash并在同一个映射上定位, 结果与不使用缓存时相同
+    text = '﻿&title=x\r\n&inote_4=(120){4}1,\r\n2,E\r\n&inote_5=\r\n(150){8}3,\r4,\n\r\nE\r\n'
+    path = tmp_path / 'maidata.txt'
+    path.write_bytes(text.encode('utf-8'))
+    expected = block_summary(main.read_inotes(str(path), levels))
+    cache = main.ParseCache(str(tmp_path / 'cache'))
+    for _ in range(2):
+        entries = main.load_inotes(str(path), levels, cache)
+        assert block_summary({level: inote for level, (inote, _) in entries.items()}) == expected
+    assert (cache.misses, cache.hits) == (1, 1)
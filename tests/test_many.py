@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import main
+
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+REFERENCE = '&inote_4=(120){4}1,2,E\n&inote_5=(120){4}1,2,\n3,4,\n5,6,E\n'
+CANDIDATES = {
+    'c1.txt': '&inote_4=(120){4}1,2,E\n&inote_5=(120){4}1,2,\n3,4,\n5,7,E\n',  # 1处差异, 第4行
+    'c2.txt': REFERENCE,
+    'c3.txt': '&inote_4=(120){4}1,3,E\n&inote_5=(120){4}1,2,\n8,4,\n5,8,E\n',  # 3处差异, 第1行
+    'c4.txt': '&inote_4=(120){4}1,2,E\n&inote_5=(120){4}1,2,\n3,[,E\n',       # 解析失败
+}
+
+
+@pytest.fixture
+def charts(tmp_path):
+    reference = tmp_path / 'ref.txt'
+    reference.write_text(REFERENCE, encoding='utf-8')
+    for name, text in CANDIDATES.items():
+        (tmp_path / name).write_text(text, encoding='utf-8')
+    return str(reference), [str(tmp_path / name) for name in CANDIDATES] + [str(tmp_path / 'missing.txt')]
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_many_ranking_matches_pairwise_diffs(charts, jobs):
+    reference, candidates = charts
+    results = main.many_diff(reference, candidates, jobs=jobs)
+    names = [os.path.basename(path) for path, _, _, _ in results]
+    assert names == ['c2.txt', 'c1.txt', 'c3.txt', 'c4.txt', 'missing.txt']
+    assert [(diff_count, first_line) for _, diff_count, first_line, _ in results[:3]] == [(0, None), (1, 4), (3, 1)]
+    # 共享的参考谱面与逐对比较的结果相同
+    for path, diff_count, _, report in results[:4]:
+        assert (diff_count, report) == main.diff_levels(reference, path)
+    assert results[4][1] is None and 'FileNotFoundError' in results[4][3]
+
+
+def test_many_without_fork(charts, monkeypatch):
+    # 不支持fork时参考谱面通过initializer传给子进程
+    monkeypatch.setattr(main.multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    reference, candidates = charts
+    assert main.many_diff(reference, candidates, jobs=2) == main.many_diff(reference, candidates, jobs=1)
+
+
+def test_many_cli(charts, tmp_path):
+    reference, _ = charts
+    result = subprocess.run([sys.executable, MAIN, 'many', reference, str(tmp_path / 'c[123].txt'), '-lv', '5', '-j', '2'],
+                            capture_output=True, text=True, encoding='utf-8')
+    assert result.returncode == 0
+    rows = [line.split() for line in result.stdout.splitlines()[2:]]
+    assert [(rank, diffs, line, os.path.basename(path)) for rank, diffs, line, path in rows] == [
+        ('1', '0', '-', 'c2.txt'), ('2', '1', '4', 'c1.txt'), ('3', '2', '3', 'c3.txt')]
@@ -0,0 +1,90 @@
+import json
+import threading
+import urllib.request
+
+import pytest
+
+import main
+
+
+CHART1 = '&title=a\n&inote_4=(120){4}1,2,E\n&inote_5=(120){4}1,2,3,4,E\n'
+CHART2 = '&title=b\n&inote_4=(120){4}1,2,E\n&inote_5=(120){4}1,5,3,,4,E\n'
+
+
+@pytest.fixture
+def server():
+    # 端口0: 任意空闲端口, 服务器在后台线程中运行
+    diff_server = main.DiffServer(max_charts=4, jobs=2)
+    http_server = diff_server.make_server('127.0.0.1', 0)
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    host, port = http_server.server_address[:2]
+    yield main.DiffClient(f"http://{host}:{port}", timeout=10)
+    http_server.shutdown()
+    http_server.server_close()
+    diff_server.executor.shutdown()
+
+
+@pytest.fixture
+def charts(tmp_path):
+    paths = [tmp_path / 'a.txt', tmp_path / 'b.txt']
+    for path, text in zip(paths, (CHART1, CHART2)):
+        path.write_text(text, encoding='utf-8')
+    return [str(path) for path in paths]
+
+
+def post_raw(client, body):
+    request = urllib.request.Request(client.url, body, {'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=client.timeout) as response:
+        return response.status, response.read()
+
+
+def test_ping(server):
+    assert server.call('ping') == 'pong'
+
+
+def test_diff_matches_library(server, charts):
+    result = server.call('diff', txt1=charts[0], txt2=charts[1], level=5)
+    expected = main.diff_charts(CHART1, CHART2, 5)
+    assert result == {'diff_count': expected.diff_count, 'results': [main.result_to_dict(expected)]}
+    # 内联文本与路径的结果相同, 不指定难度时比较所有难度
+    assert server.call('diff', text1=CHART1, txt2=charts[1], level=5) == result
+    all_levels = server.call('diff', txt1=charts[0], txt2=charts[1])
+    assert [level['level'] for level in all_levels['results']] == ['4', '5']
+    assert all_levels['diff_count'] == expected.diff_count
+
+
+def test_batch_and_stats(server, charts):
+    calls = [('diff', {'txt1': charts[0], 'txt2': charts[1], 'level': 4}),
+             ('diff', {'txt1': charts[0], 'txt2': charts[1], 'level': 5}),
+             ('ping', {}),
+             ('nope', {})]
+    results = server.batch(calls)
+    assert results[0]['diff_count'] == 0
+    assert results[1] == server.call('diff', txt1=charts[0], txt2=charts[1], level=5)
+    assert results[2] == 'pong'
+    assert results[3]['error']['code'] == -32601
+    # 两个文件各解析一次, 之后的请求都命中内存缓存
+    stats = server.call('stats')
+    assert stats['charts'] == 2 and stats['misses'] == 2 and stats['max_charts'] == 4
+    assert stats['hits'] == 4
+
+
+def test_error_responses(server, tmp_path):
+    with pytest.raises(main.MaidataError, match='Method not found: nope'):
+        server.call('nope')
+    with pytest.raises(main.MaidataError, match='cannot read'):
+        server.call('diff', txt1=str(tmp_path / 'missing.txt'), text2=CHART2, level=5)
+    with pytest.raises(main.MaidataError, match='Invalid params'):
+        server.call('diff', txt1='a.txt', level=5)
+    with pytest.raises(main.MaidataError, match='Invalid params'):
+        server.call('ping', extra=1)
+    status, body = post_raw(server, b'{"jsonrpc": "2.0", "method": ')
+    assert status == 200 and json.loads(body)['error'] == {'code': -32700, 'message': 'Parse error'}
+    status, body = post_raw(server, b'[]')
+    assert json.loads(body)['error']['code'] == -32600
+    status, body = post_raw(server, b'{"method": "ping", "id": 1}')
+    assert json.loads(body)['error']['code'] == -32600
+    # 通知 (没有id) 不返回内容
+    status, body = post_raw(server, b'{"jsonrpc": "2.0", "method": "ping"}')
+    assert status == 204 and body == b''
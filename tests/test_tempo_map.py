@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+import main
+
+
+TOKENS = ['1', '2h[4:1]', '3/4', '', '', '', '(60)', '(150)', '{16}', '{3}', '(90){4}', '(200)5', '{12}6', '(0)', '(0)7']
+
+
+def random_chart(rng, segment_count):
+    parts = ['(120){8}']
+    for _ in range(segment_count):
+        parts.append(rng.choice(TOKENS))
+        parts.append(',')
+    parts.append(rng.choice(['E', '(75),E', '', '1,E,(30)']))
+    return ''.join(parts)
+
+
+def walk_tempo_changes(inote):
+    # 逐个segment累加时长得到的BPM变化点 (时刻, BPM)
+    changes = []
+    seconds = 0.0
+    bpm = length = None
+    for kind, _, _, _, bpm_text, length_text, _, _ in main.tokenize_inote(inote):
+        if kind == 'E':
+            break
+        if bpm_text is not None:
+            bpm = round(float(bpm_text), 2)
+            if not changes or changes[-1][1] != bpm:
+                changes.append((seconds, bpm))
+        if length_text is not None:
+            length = int(length_text)
+        seconds += 240.0 / (bpm * length) if bpm > 0 else 0.0
+    return changes
+
+
+def test_bpm_change_in_empty_segment():
+    inote = '(120){4}1,(60),,2,E'
+    table, offsets = main.translate_inote(inote)
+    tempo_map = table.tempo_map(inote, offsets)
+    assert list(tempo_map.change_times) == [0.0, 0.5]
+    assert list(tempo_map.change_bpm) == [120.0, 60.0]
+    assert tempo_map.bpm_at_time(0.4) == 120.0
+    assert tempo_map.bpm_at_time(1.0) == 60.0
+    assert tempo_map.time_at_group(2) == 2.5
+
+
+def test_tempo_changes_match_segment_walk():
+    rng = random.Random(0)
+    for _ in range(300):
+        inote = random_chart(rng, rng.randint(0, 80))
+        table, offsets = main.translate_inote(inote)
+        tempo_map = table.tempo_map(inote, offsets)
+        expected = walk_tempo_changes(inote)
+        assert list(tempo_map.change_bpm) == [bpm for _, bpm in expected], inote
+        assert list(tempo_map.change_times) == pytest.approx([seconds for seconds, _ in expected]), inote
+        for (seconds, bpm), (next_seconds, _) in zip(expected, expected[1:] + [(None, None)]):
+            if next_seconds is None or next_seconds > seconds + 1e-6:  # (0)的时长为0, 同一时刻的多次变化取最后一个
+                assert tempo_map.bpm_at_time(seconds + 1e-9) == bpm
+
+
+def test_time_queries():
+    # group: '@' 0s, 1 0s, 2 0.5s, (0)3 1.5s (时长为0), 4 1.5s, 5 2.0s
+    inote = '(120){4}1,2,,(0)3,(120)4,5,E'
+    table, offsets = main.translate_inote(inote)
+    tempo_map = table.tempo_map()
+    assert [tempo_map.time_at_group(group_id) for group_id in range(len(tempo_map) + 1)] == [0.0, 0.0, 0.5, 1.5, 1.5, 2.0, 2.0]
+    assert list(tempo_map.segments) == [-1, 0, 1, 3, 4, 5]
+    # 同一时刻开始的多个group: group_at_time取最后一个, groups_between全部包含
+    assert tempo_map.group_at_time(0.0) == 1
+    assert tempo_map.group_at_time(1.5) == 4
+    assert tempo_map.group_at_time(1.0) == 2
+    assert tempo_map.group_at_time(-1.0) == 0
+    assert tempo_map.group_at_time(100.0) == 5
+    assert tempo_map.groups_between(1.5, 1.5) == (3, 5)
+    assert tempo_map.groups_between(0.1, 1.4) == (2, 3)
+    assert tempo_map.groups_between(3.0, 4.0) == (6, 6)
+    # 空segment属于前一个group的间隔
+    assert tempo_map.time_at_segment(2) == 0.5
+    assert tempo_map.time_at_segment(3) == 1.5
+    assert tempo_map.time_at_segment(0) == 0.0
+
+
+def test_bpm_at_time_needs_inote():
+    table, _ = main.translate_inote('(120){4}1,E')
+    with pytest.raises(ValueError):
+        table.tempo_map().bpm_at_time(0.0)
+    table, offsets = main.translate_inote('E')
+    assert table.tempo_map('E', offsets).bpm_at_time(0.0) is None
@@ -0,0 +1,141 @@
+import random
+import re
+
+import pytest
+
+import main
+
+
+TOKENS = ['1', '2', '3h[4:1]', '4b', '5/6', '1-5[8:3]', '', '', '(150)', '{16}', '{12}3', '(90){4}2', '7x',
+          '8[3:2]', 'C', '12', 'x[a]', '/', ' E ']
+
+
+def random_chart(rng, segment_count):
+    parts = ['(120){8}']
+    for _ in range(segment_count):
+        parts.append(rng.choice(TOKENS))
+        parts.append(',')
+        if rng.random() < 0.1:
+            parts.append('\n')
+    if rng.random() < 0.8:
+        parts.append('E')
+    return ''.join(parts)
+
+
+def test_tokenizer_segments_follow_commas():
+    # 每个token的范围就是逗号之间的segment, 'E'之后不再产出; 从中间的segment开始切分与完整切分的后半段相同
+    rng = random.Random(0)
+    for _ in range(500):
+        inote = random_chart(rng, rng.randint(0, 60))
+        tokens = list(main.tokenize_inote(inote))
+        bounds = []
+        start = 0
+        for segment in inote.split(','):
+            bounds.append((start, start + len(segment)))
+            start += len(segment) + 1
+        assert [(token[2], token[3]) for token in tokens] == bounds[:len(tokens)]
+        assert [token[1] for token in tokens] == list(range(len(tokens)))
+        if tokens[-1][0] != 'E':
+            assert len(tokens) == len(bounds)
+        for token in tokens[1:]:
+            assert list(main.tokenize_inote(inote, pos=token[2], segment_index=token[1])) == tokens[token[1]:]
+
+
+def test_text_after_end_is_ignored():
+    table, offsets = main.translate_inote('(120){4}1,,,,2,E,5,6')
+    expected, expected_offsets = main.translate_inote('(120){4}1,,,,2,E')
+    assert table == expected and offsets[:-1] == expected_offsets[:-1]
+    assert list(table.length) == [0, 4, 0]  # 连续的空segment合并到前一个group
+
+
+@pytest.mark.parametrize('inote', ['(120){4}1h[0:1],2,E', '(120){4}1h[-4:1],E'])
+def test_non_positive_hold_denominator_warns(inote):
+    table, _ = main.translate_inote(inote)
+    assert table.warnings and 'Invalid [content]' in table.warnings[0]
+
+
+def test_unclosed_bracket_terminates():
+    table, _ = main.translate_inote('(120){4}1h[4:1,2,E')
+    assert [main.INFO_POOL[info] for info in table.info] == ['@', '1h[4:1', '2']
+
+
+def same_translation(result, expected):
+    (table, offsets), (expected_table, expected_offsets) = result, expected
+    return (table == expected_table and offsets == expected_offsets and table.warnings == expected_table.warnings and
+            table.segment == expected_table.segment and table.group == expected_table.group and
+            table.seconds == expected_table.seconds)
+
+
+def random_edit(rng, inote):
+    start = rng.randint(0, len(inote))
+    end = min(len(inote), start + rng.randint(0, 8))
+    inserted = ''.join(rng.choice(TOKENS) + rng.choice([',', '', ',,']) for _ in range(rng.randint(0, 2)))
+    return inote[:start] + inserted + inote[end:]
+
+
+def test_retranslate_matches_full_translate(monkeypatch):
+    # 增量解析 (从断点续解析并拼接旧的末尾) 与完整解析的结果相同
+    monkeypatch.setattr(main, 'CHECKPOINT_INTERVAL', 4)
+    rng = random.Random(1)
+    for _ in range(400):
+        old = random_chart(rng, rng.randint(0, 120))
+        try:
+            checkpoints = main.Checkpoints()
+            translated = main.translate_inote(old, checkpoints)
+        except main.ChartParseError:
+            continue
+        for _ in range(rng.randint(1, 4)):
+            new = random_edit(rng, old)
+            try:
+                expected = main.translate_inote(new, main.Checkpoints())
+            except main.ChartParseError as e:
+                with pytest.raises(main.ChartParseError, match=re.escape(str(e))):
+                    main.retranslate_inote(old, translated, checkpoints, new)
+                break
+            table, offsets, checkpoints, _, _ = main.retranslate_inote(old, translated, checkpoints, new)
+            assert same_translation((table, offsets), expected), (old, new)
+            old, translated = new, (table, offsets)
+
+
+def test_watched_chart_incremental_diff(tmp_path, monkeypatch):
+    # --watch只重新编码编辑过的group, diff结果与重新完整解析相同
+    monkeypatch.setattr(main, 'CHECKPOINT_INTERVAL', 4)
+    rng = random.Random(2)
+    paths = [tmp_path / 'a.txt', tmp_path / 'b.txt']
+    inotes = [random_chart(rng, 150).replace('E', '') + 'E' for _ in paths]
+    charts = [main.WatchedChart(str(path), 5, k + 1) for k, path in enumerate(paths)]
+    key_ids = {}
+    for _ in range(40):
+        side = rng.randrange(2)
+        inotes[side] = random_edit(rng, inotes[side])
+        for path, inote in zip(paths, inotes):
+            path.write_text(f"&title=t\n&inote_5={inote}\n", encoding='utf-8')
+        for chart in charts:
+            chart.stamp = None  # 两次写入可能在同一个mtime内
+            chart.refresh(key_ids)
+        if any(chart.error is not None for chart in charts):
+            continue
+        entries = [(chart.inote, chart.translated) for chart in charts]
+        incremental = main.diff_translated(*entries, 'delay', 5, (charts[0].keys, charts[1].keys)).render()
+        fresh = [(main.get_inote(5, str(path), k + 1), None) for k, path in enumerate(paths)]
+        fresh = [(inote, main.translate_inote(inote[0])) for inote, _ in fresh]
+        assert incremental == main.diff_translated(*fresh, 'delay', 5).render()
+
+
+def test_parallel_translate_matches_serial(monkeypatch):
+    # 分段并行解析与串行解析的结果相同, 出错时错误信息也相同
+    monkeypatch.setattr(main, 'PARALLEL_TRANSLATE_MIN_CHARS', 0)
+    rng = random.Random(3)
+    for _ in range(40):
+        inote = random_chart(rng, rng.randint(0, 300))
+        if rng.random() < 0.3:
+            inote = inote.replace('(120){8}', rng.choice(['', '{8}', '(120)', ' (120){8}, ,']), 1)
+        try:
+            expected = main.translate_inote(inote)
+        except main.ChartParseError as e:
+            with pytest.raises(main.ChartParseError, match=re.escape(str(e))):
+                main.translate_inote_parallel(inote, rng.randint(2, 4))
+            continue
+        table, offsets = main.translate_inote_parallel(inote, rng.randint(2, 4))
+        assert same_translation((table, offsets), expected), inote
+        assert table.resolution == expected[0].resolution and table.info == expected[0].info